@@ -3,18 +3,18 @@ from typing import Any, Iterator, Mapping, Optional
 
 import psycopg2
 from psycopg2.extras import RealDictCursor
-from psycopg2.pool import SimpleConnectionPool
+from psycopg2.pool import ThreadedConnectionPool
 
 from .config import Settings
 
 
 class Database:
     """
-    Gerencia conexoes com Postgres usando pool.
+    Gerencia conexoes com Postgres usando pool (seguro entre threads).
     """
 
     def __init__(self, settings: Settings) -> None:
-        self._pool = SimpleConnectionPool(
+        self._pool = ThreadedConnectionPool(
             minconn=1,
             maxconn=5,
             host=settings.db_host,
@@ -11,31 +11,28 @@ class EstatisticasRepository:
 
     def get_totais(self) -> dict:
         """
-        Retorna total e media geral de despesas.
+        Retorna total e media geral de despesas a partir do resumo por
+        trimestre (uma linha por trimestre, ver sql/ddl.sql).
 
         :return: Dicionario com total e media.
         """
         sql = (
-            "SELECT COALESCE(SUM(valor_despesas), 0) AS total, "
-            "COALESCE(AVG(valor_despesas), 0) AS media "
-            "FROM ans.despesas_consolidadas"
+            "SELECT COALESCE(SUM(total_despesas), 0) AS total, "
+            "COALESCE(SUM(total_despesas) / NULLIF(SUM(qtd_despesas), 0), 0) AS media "
+            "FROM ans.resumo_trimestre"
         )
         row = self._db.fetch_one(sql)
         return row or {"total": 0, "media": 0}
 
     def get_top_operadoras(self) -> list[dict]:
         """
-        Retorna top 5 operadoras por total de despesas.
+        Retorna top 5 operadoras por total de despesas (resumo por operadora).
 
         :return: Lista com top operadoras.
         """
         sql = (
-            "SELECT d.cnpj, "
-            "COALESCE(c.razao_social, d.razao_social) AS razao_social, "
-            "SUM(d.valor_despesas) AS total_despesas "
-            "FROM ans.despesas_consolidadas d "
-            "LEFT JOIN ans.operadoras_cadop c ON c.cnpj = d.cnpj "
-            "GROUP BY d.cnpj, COALESCE(c.razao_social, d.razao_social) "
+            "SELECT cnpj, razao_social, total_despesas "
+            "FROM ans.resumo_operadora "
             "ORDER BY total_despesas DESC "
             "LIMIT 5"
         )
@@ -0,0 +1,236 @@
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from etl.bench.synthetic_ans import build_consolidated, generate_dataset
+from etl.pipeline_metrics import (
+    StageMetrics,
+    measure_stage,
+    record_rows,
+    write_metrics_json,
+)
+from etl.process.aggregate_despesas import aggregate
+from etl.process.consolidate_despesas import consolidate_frame
+from etl.process.duckdb_engine import ENGINES
+from etl.process.enrich_consolidado import enrich
+from etl.process.frame_io import write_frame
+from etl.process.validate_consolidado import validate
+
+DEFAULT_WORK_DIR = Path("data/bench")
+DEFAULT_SCALES = (10_000, 100_000, 1_000_000)
+DEFAULT_OPERATORS = 1_000
+QUARTERS = 4
+STAGES = ("consolidar", "validar", "enriquecer", "agregar")
+
+
+def _stage_files(scale_dir: Path) -> dict:
+    """
+    Caminhos de entrada e saida das etapas em uma escala.
+
+    :param scale_dir: Diretorio da escala.
+    :return: Mapa nome -> caminho.
+    """
+    return {
+        "raw": scale_dir / "raw",
+        "cadop": scale_dir / "Relatorio_cadop.csv",
+        "consolidado_dos_zips": scale_dir / "out" / "consolidado_despesas.csv",
+        "consolidado": scale_dir / "consolidado_sintetico.csv",
+        "validado": scale_dir / "out" / "consolidado_validado.csv",
+        "inconsistencias_2_1": scale_dir / "out" / "inconsistencias_2_1.csv",
+        "enriquecido": scale_dir / "out" / "consolidado_enriquecido.csv",
+        "inconsistencias_2_2": scale_dir / "out" / "inconsistencias_2_2.csv",
+        "agregado": scale_dir / "out" / "despesas_agregadas.csv",
+    }
+
+
+def _measure(
+    name: str, scale_dir: Path, raw_rows: int, workers: int, engine: str
+) -> StageMetrics:
+    """
+    Executa e mede uma etapa (roda em um processo novo).
+
+    :param name: Etapa (ver STAGES).
+    :param scale_dir: Diretorio da escala.
+    :param raw_rows: Linhas de balancete geradas (entrada da consolidacao).
+    :param workers: Processos da consolidacao.
+    :param engine: Engine da consolidacao e da agregacao.
+    :return: Metricas da etapa.
+    """
+    files = _stage_files(scale_dir)
+    with measure_stage(name) as metrics:
+        if name == "consolidar":
+            consolidated_df = consolidate_frame(
+                extract_dir=files["raw"],
+                cadop_path=files["cadop"],
+                limit_quarters=QUARTERS,
+                workers=workers,
+                prefilter=True,
+                engine=engine,
+            )
+            write_frame(consolidated_df, files["consolidado_dos_zips"])
+            record_rows(rows_in=raw_rows, rows_out=len(consolidated_df))
+        elif name == "validar":
+            valid_count, invalid_count = validate(
+                input_file=files["consolidado"],
+                valid_file=files["validado"],
+                invalid_file=files["inconsistencias_2_1"],
+            )
+            record_rows(rows_in=valid_count + invalid_count, rows_out=valid_count)
+        elif name == "enriquecer":
+            enriched_count, missing_count = enrich(
+                input_file=files["validado"],
+                cadop_path=files["cadop"],
+                output_file=files["enriquecido"],
+                missing_file=files["inconsistencias_2_2"],
+            )
+            record_rows(rows_in=enriched_count, rows_out=enriched_count)
+        else:
+            rows_in, rows_out = aggregate(
+                input_file=files["enriquecido"],
+                output_file=files["agregado"],
+                engine=engine,
+            )
+            record_rows(rows_in=rows_in, rows_out=rows_out)
+    return metrics
+
+
+def _prepare_scale(scale_dir: Path, rows: int, operators: int, seed: int) -> None:
+    """
+    Gera os dados de uma escala: ZIPs e CADOP para a consolidacao e um
+    consolidado com o mesmo numero de linhas para as etapas seguintes.
+
+    :param scale_dir: Diretorio da escala (recriado).
+    :param rows: Linhas da escala.
+    :param operators: Operadoras no CADOP.
+    :param seed: Semente aleatoria.
+    :return: None.
+    """
+    if scale_dir.exists():
+        shutil.rmtree(scale_dir)
+    dataset = generate_dataset(
+        output_dir=scale_dir,
+        rows=rows,
+        operators=operators,
+        quarters=QUARTERS,
+        seed=seed,
+    )
+    files = _stage_files(scale_dir)
+    files["agregado"].parent.mkdir(parents=True, exist_ok=True)
+    write_frame(
+        build_consolidated(dataset.cadop_path, rows, seed=seed), files["consolidado"]
+    )
+
+
+def run_benchmark(
+    scales: Sequence[int] = DEFAULT_SCALES,
+    work_dir: Path = DEFAULT_WORK_DIR,
+    operators: int = DEFAULT_OPERATORS,
+    workers: int = 1,
+    seed: int = 42,
+    engine: str = "pandas",
+) -> Path:
+    """
+    Mede consolidacao, validacao, enriquecimento e agregacao em varias escalas,
+    sem acesso a rede.
+
+    Cada etapa roda em um processo novo, para que o pico de memoria seja so o
+    dela. Na escala N, a consolidacao le N linhas de balancete (em CSV, TXT,
+    XLSX e latin-1) e as demais etapas partem de um consolidado de N linhas.
+
+    :param scales: Quantidades de linhas.
+    :param work_dir: Diretorio dos dados gerados e do relatorio.
+    :param operators: Operadoras no CADOP sintetico.
+    :param workers: Processos da consolidacao.
+    :param seed: Semente aleatoria.
+    :param engine: Engine da consolidacao e da agregacao.
+    :return: Caminho do relatorio JSON.
+    """
+    work_dir = work_dir.resolve()
+    started = time.time()
+    results: List[StageMetrics] = []
+    print(
+        f"{'linhas':>10} {'etapa':<11} {'entrada':>10} {'saida':>10} "
+        f"{'segundos':>9} {'linhas/s':>11} {'pico MB':>8}"
+    )
+    for rows in scales:
+        scale_dir = work_dir / f"linhas_{rows}"
+        _prepare_scale(scale_dir, rows, operators, seed)
+        for name in STAGES:
+            # spawn: o processo novo nao herda a memoria do gerador.
+            with ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=os.chdir,
+                initargs=(str(scale_dir),),
+            ) as pool:
+                metrics = pool.submit(
+                    _measure, name, scale_dir, rows, workers, engine
+                ).result()
+            rate = metrics.rows_in / metrics.wall_seconds if metrics.wall_seconds else 0
+            metrics.extra.update(scale=rows, rows_per_second=int(rate))
+            results.append(metrics)
+            print(
+                f"{rows:>10} {name:<11} {metrics.rows_in:>10} {metrics.rows_out:>10} "
+                f"{metrics.wall_seconds:>9.3f} {int(rate):>11} "
+                f"{metrics.process_peak_rss_mb or 0:>8.1f}"
+            )
+
+    summary = {
+        "started_at": datetime.fromtimestamp(started).isoformat(timespec="seconds"),
+        "scales": list(scales),
+        "operators": operators,
+        "workers": workers,
+        "seed": seed,
+        "engine": engine,
+        "python": sys.version.split()[0],
+        "cpus": os.cpu_count(),
+    }
+    timestamp = datetime.fromtimestamp(started).strftime("%Y%m%d_%H%M%S")
+    return write_metrics_json(work_dir / f"bench_{timestamp}.json", results, summary)
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """
+    Le os argumentos de linha de comando do benchmark.
+
+    :param argv: Argumentos (None usa sys.argv).
+    :return: Argumentos lidos.
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark offline das etapas do ETL com dados sinteticos."
+    )
+    parser.add_argument(
+        "--scales",
+        default=",".join(str(rows) for rows in DEFAULT_SCALES),
+        help="Quantidades de linhas, separadas por virgula.",
+    )
+    parser.add_argument("--work-dir", type=Path, default=DEFAULT_WORK_DIR)
+    parser.add_argument("--operators", type=int, default=DEFAULT_OPERATORS)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--engine", choices=ENGINES, default="pandas")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    report = run_benchmark(
+        scales=[int(rows) for rows in args.scales.split(",")],
+        work_dir=args.work_dir,
+        operators=args.operators,
+        workers=args.workers,
+        seed=args.seed,
+        engine=args.engine,
+    )
+    print(f"Relatorio: {report}")
@@ -0,0 +1,563 @@
+import argparse
+import io
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_OUTPUT_DIR = Path("data/synthetic")
+CADOP_FILE_NAME = "Relatorio_cadop.csv"
+RAW_SUBDIR = "raw"
+WRITE_BLOCK_ROWS = 200_000
+
+RAW_COLUMNS = [
+    "DATA",
+    "REG_ANS",
+    "CD_CONTA_CONTABIL",
+    "DESCRICAO",
+    "VL_SALDO_INICIAL",
+    "VL_SALDO_FINAL",
+]
+
+# Contas do plano contabil (codigo, descricao, peso); so as que tem
+# "despesa" e "evento"/"sinistro" entram na consolidacao.
+ACCOUNTS = [
+    ("4", "DESPESAS COM EVENTOS / SINISTROS", 3),
+    ("41", "Despesas com Eventos / Sinistros Conhecidos ou Avisados", 3),
+    ("411", "Eventos/ Sinistros Conhecidos ou Avisados de Assistência", 6),
+    ("4111", "Despesas com Sinistros - Rede Contratada", 2),
+    ("31", "CONTRAPRESTAÇÕES EFETIVAS DE PLANO DE ASSISTÊNCIA À SAÚDE", 8),
+    ("46", "DESPESAS ADMINISTRATIVAS", 6),
+    ("44", "OUTRAS DESPESAS OPERACIONAIS", 5),
+    ("12", "APLICAÇÕES FINANCEIRAS", 4),
+    ("21", "PROVISÕES TÉCNICAS DE OPERAÇÕES DE ASSISTÊNCIA À SAÚDE", 4),
+]
+MODALIDADES = [
+    "Medicina de Grupo",
+    "Cooperativa Médica",
+    "Autogestão",
+    "Seguradora Especializada em Saúde",
+    "Odontologia de Grupo",
+    "Filantropia",
+]
+CNPJ_WEIGHTS = np.array([6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+UFS = ["SP", "RJ", "MG", "RS", "PR", "BA", "SC", "PE", "GO", "CE", "DF", "ES"]
+
+# Variacoes de arquivo observadas nos ZIPs da ANS, alternadas por trimestre.
+FORMATS = ("csv", "txt", "xlsx", "csv_latin1")
+
+
+@dataclass(frozen=True)
+class FileFormat:
+    """
+    Formato de um arquivo de trimestre dentro do ZIP.
+    """
+
+    suffix: str
+    encoding: str
+    sep: str
+    decimal: str
+    quoted: bool
+    member_dir: str = ""
+
+
+CSV_FORMATS = {
+    "csv": FileFormat(".csv", "utf-8", ";", ",", quoted=True),
+    "csv_latin1": FileFormat(".csv", "latin-1", ";", ",", quoted=False),
+    "txt": FileFormat(".txt", "latin-1", ",", ".", quoted=False, member_dir="dados/"),
+}
+
+
+@dataclass(frozen=True)
+class SyntheticDataset:
+    """
+    Arquivos gerados e contagens esperadas.
+    """
+
+    raw_dir: Path
+    cadop_path: Path
+    zips: Tuple[Path, ...]
+    raw_rows: int
+    operators: int
+
+
+def _cnpj_digits(base: np.ndarray) -> np.ndarray:
+    """
+    Calcula os dois digitos verificadores de CNPJs em lote.
+
+    :param base: Matriz (n, 12) com os digitos base.
+    :return: Matriz (n, 14) com o CNPJ completo.
+    """
+    digits = base
+    for weights in (CNPJ_WEIGHTS[1:], CNPJ_WEIGHTS):
+        mod = (digits * weights).sum(axis=1) % 11
+        digits = np.column_stack([digits, np.where(mod < 2, 0, 11 - mod)])
+    return digits
+
+
+def _random_cnpjs(rng: np.random.Generator, count: int) -> np.ndarray:
+    """
+    Gera CNPJs validos.
+
+    :param rng: Gerador aleatorio.
+    :param count: Quantidade.
+    :return: Array de textos com 14 digitos.
+    """
+    digits = _cnpj_digits(rng.integers(0, 10, size=(count, 12)))
+    return np.array(["".join(map(str, row)) for row in digits], dtype=object)
+
+
+def _format_cnpj(cnpj: str) -> str:
+    """
+    Formata um CNPJ com mascara (00.000.000/0000-00), como no CADOP.
+
+    :param cnpj: CNPJ com 14 digitos.
+    :return: CNPJ formatado.
+    """
+    return f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:]}"
+
+
+def build_cadop(
+    rng: np.random.Generator,
+    operators: int,
+    invalid_cnpj_rate: float = 0.02,
+    empty_name_rate: float = 0.01,
+    reregistered_rate: float = 0.02,
+) -> "pd.DataFrame":
+    """
+    Monta um CADOP sintetico com as mesmas colunas do arquivo da ANS.
+
+    Uma fracao das operadoras tem CNPJ com digito errado, razao social vazia
+    ou um segundo registro mais recente (que deve prevalecer na deduplicacao).
+
+    :param rng: Gerador aleatorio.
+    :param operators: Quantidade de operadoras.
+    :param invalid_cnpj_rate: Fracao de CNPJs com digito verificador errado.
+    :param empty_name_rate: Fracao de razoes sociais vazias.
+    :param reregistered_rate: Fracao de operadoras com registro duplicado.
+    :return: DataFrame do CADOP (tudo como texto).
+    """
+    registros = np.arange(300000, 300000 + operators).astype(str)
+    cnpjs = _random_cnpjs(rng, operators)
+    broken = rng.random(operators) < invalid_cnpj_rate
+    cnpjs[broken] = [c[:-1] + str((int(c[-1]) + 1) % 10) for c in cnpjs[broken]]
+    names = np.array([f"OPERADORA SINTETICA {i} LTDA" for i in range(operators)])
+    names = np.where(rng.random(operators) < empty_name_rate, "", names)
+    years = rng.integers(1999, 2020, size=operators)
+    months = rng.integers(1, 13, size=operators)
+
+    cadop_df = pd.DataFrame(
+        {
+            "REGISTRO_OPERADORA": registros,
+            "CNPJ": [_format_cnpj(c) for c in cnpjs],
+            "Razao_Social": names,
+            "Nome_Fantasia": [f"SINTETICA {i}" for i in range(operators)],
+            "Modalidade": rng.choice(MODALIDADES, size=operators),
+            "Logradouro": "RUA DAS FLORES",
+            "Numero": "100",
+            "Complemento": "",
+            "Bairro": "CENTRO",
+            "Cidade": "SAO PAULO",
+            "UF": rng.choice(UFS, size=operators),
+            "CEP": "01000000",
+            "DDD": "11",
+            "Telefone": "30000000",
+            "Fax": "",
+            "Endereco_eletronico": "contato@exemplo.com.br",
+            "Representante": "FULANO DE TAL",
+            "Cargo_Representante": "DIRETOR",
+            "Regiao_de_Comercializacao": rng.integers(1, 7, size=operators).astype(str),
+            "Data_Registro_ANS": [f"{y}-{m:02d}-01" for y, m in zip(years, months)],
+        }
+    )
+    again = cadop_df[rng.random(operators) < reregistered_rate].copy()
+    again["Razao_Social"] = again["Razao_Social"].where(
+        again["Razao_Social"].eq(""), again["Razao_Social"] + " (NOVA)"
+    )
+    again["UF"] = rng.choice(UFS, size=len(again))
+    again["Data_Registro_ANS"] = "2022-01-01"
+    return pd.concat([cadop_df, again], ignore_index=True)
+
+
+def write_cadop(cadop_df: "pd.DataFrame", path: Path) -> Path:
+    """
+    Grava o CADOP como a ANS publica (";" e UTF-8).
+
+    :param cadop_df: DataFrame de build_cadop.
+    :param path: Caminho de destino.
+    :return: Caminho gravado.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    cadop_df.to_csv(path, sep=";", index=False, encoding="utf-8")
+    return path
+
+
+def _raw_blocks(
+    rng: np.random.Generator,
+    registros: Sequence[str],
+    rows: int,
+    ano: int,
+    tri: int,
+) -> Iterator["pd.DataFrame"]:
+    """
+    Gera as linhas de balancete de um trimestre em blocos.
+
+    :param rng: Gerador aleatorio.
+    :param registros: Registros ANS que aparecem no arquivo.
+    :param rows: Total de linhas.
+    :param ano: Ano do trimestre.
+    :param tri: Numero do trimestre.
+    :return: Iterador de DataFrames com as colunas de RAW_COLUMNS.
+    """
+    weights = np.array([weight for _, _, weight in ACCOUNTS], dtype=float)
+    weights /= weights.sum()
+    codes = np.array([code for code, _, _ in ACCOUNTS], dtype=object)
+    descriptions = np.array([desc for _, desc, _ in ACCOUNTS], dtype=object)
+    registros = np.asarray(registros, dtype=object)
+    data = f"{ano}-{3 * tri - 2:02d}-01"
+    for start in range(0, rows, WRITE_BLOCK_ROWS):
+        size = min(WRITE_BLOCK_ROWS, rows - start)
+        account = rng.choice(len(ACCOUNTS), size=size, p=weights)
+        final = np.round(rng.lognormal(10, 2, size=size), 2)
+        # Estornos: saldos negativos aparecem nos balancetes reais.
+        final = np.where(rng.random(size) < 0.03, -final, final)
+        yield pd.DataFrame(
+            {
+                "DATA": data,
+                "REG_ANS": rng.choice(registros, size=size),
+                "CD_CONTA_CONTABIL": codes[account],
+                "DESCRICAO": descriptions[account],
+                "VL_SALDO_INICIAL": np.round(final * rng.random(size), 2),
+                "VL_SALDO_FINAL": final,
+            }
+        )
+
+
+def _write_csv_member(
+    archive: zipfile.ZipFile,
+    name: str,
+    blocks: Iterator["pd.DataFrame"],
+    fmt: FileFormat,
+) -> None:
+    """
+    Grava um CSV/TXT dentro do ZIP, bloco a bloco.
+
+    :param archive: ZIP aberto para escrita.
+    :param name: Nome do membro.
+    :param blocks: Blocos de linhas.
+    :param fmt: Formato do arquivo.
+    :return: None.
+    """
+    header = list(RAW_COLUMNS)
+    if fmt.encoding != "utf-8":
+        # Cabecalho acentuado, como nos arquivos antigos em latin-1.
+        header[header.index("DESCRICAO")] = "DESCRIÇÃO"
+    with archive.open(name, "w", force_zip64=True) as raw:
+        handle = io.TextIOWrapper(raw, encoding=fmt.encoding, newline="")
+        for index, block in enumerate(blocks):
+            block.to_csv(
+                handle,
+                sep=fmt.sep,
+                decimal=fmt.decimal,
+                index=False,
+                header=header if index == 0 else False,
+                quoting=1 if fmt.quoted else 0,
+                lineterminator="\n",
+            )
+        handle.flush()
+        handle.detach()
+
+
+def _xlsx_cell(ref: str, value: object, strings: dict) -> str:
+    """
+    Monta uma celula XLSX (numero ou texto compartilhado).
+
+    :param ref: Referencia da celula (ex.: B2).
+    :param value: Valor.
+    :param strings: Tabela de textos compartilhados, atualizada.
+    :return: XML da celula.
+    """
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return f'<c r="{ref}"><v>{value}</v></c>'
+    index = strings.setdefault(str(value), len(strings))
+    return f'<c r="{ref}" t="s"><v>{index}</v></c>'
+
+
+XLSX_STATIC_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" '
+        'ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/'
+        'vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/'
+        'vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/sharedStrings.xml" ContentType="application/'
+        'vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+        "</Types>"
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/'
+        'relationships"><Relationship Id="rId1" Type="http://schemas.openxmlformats'
+        '.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/></Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/'
+        'relationships"><sheets><sheet name="Plan1" sheetId="1" r:id="rId1"/>'
+        "</sheets></workbook>"
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/'
+        'relationships"><Relationship Id="rId1" Type="http://schemas.openxmlformats'
+        '.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/><Relationship Id="rId2" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/'
+        'sharedStrings" Target="sharedStrings.xml"/></Relationships>'
+    ),
+}
+
+
+def _write_xlsx(path: Path, blocks: Iterator["pd.DataFrame"]) -> None:
+    """
+    Grava uma planilha XLSX minima (uma aba, textos compartilhados), sem
+    depender de bibliotecas de planilha.
+
+    :param path: Caminho do XLSX.
+    :param blocks: Blocos de linhas.
+    :return: None.
+    """
+    letters = "ABCDEF"
+    strings: dict = {}
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as book:
+        for name, content in XLSX_STATIC_PARTS.items():
+            book.writestr(name, content)
+        with book.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/'
+                b'spreadsheetml/2006/main"><sheetData>'
+            )
+            header = "".join(
+                _xlsx_cell(f"{letter}1", col, strings)
+                for letter, col in zip(letters, RAW_COLUMNS)
+            )
+            sheet.write(f'<row r="1">{header}</row>'.encode("utf-8"))
+            row_number = 1
+            for block in blocks:
+                block = block.assign(
+                    REG_ANS=block["REG_ANS"].astype(int),
+                    CD_CONTA_CONTABIL=block["CD_CONTA_CONTABIL"].astype(int),
+                )
+                parts = []
+                for values in block.itertuples(index=False):
+                    row_number += 1
+                    cells = "".join(
+                        _xlsx_cell(f"{letter}{row_number}", value, strings)
+                        for letter, value in zip(letters, values)
+                    )
+                    parts.append(f'<row r="{row_number}">{cells}</row>')
+                sheet.write("".join(parts).encode("utf-8"))
+            sheet.write(b"</sheetData></worksheet>")
+        items = "".join(f"<si><t>{escape(text)}</t></si>" for text in strings)
+        book.writestr(
+            "xl/sharedStrings.xml",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            f'count="{len(strings)}" uniqueCount="{len(strings)}">{items}</sst>',
+        )
+
+
+def write_quarter_zip(
+    raw_dir: Path,
+    ano: int,
+    tri: int,
+    fmt_name: str,
+    blocks: Iterator["pd.DataFrame"],
+) -> Path:
+    """
+    Grava o ZIP de um trimestre no mesmo layout do download
+    (raw_dir/ano/1T2025/1T2025.zip), com um arquivo nao-dados junto.
+
+    :param raw_dir: Diretorio base dos ZIPs.
+    :param ano: Ano do trimestre.
+    :param tri: Numero do trimestre.
+    :param fmt_name: Formato do arquivo de dados (ver FORMATS).
+    :param blocks: Blocos de linhas.
+    :return: Caminho do ZIP.
+    """
+    quarter = f"{tri}T{ano}"
+    zip_path = raw_dir / str(ano) / quarter / f"{quarter}.zip"
+    zip_path.parent.mkdir(parents=True, exist_ok=True)
+    if fmt_name == "xlsx":
+        xlsx_path = zip_path.with_suffix(".xlsx.tmp")
+        _write_xlsx(xlsx_path, blocks)
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as archive:
+        if fmt_name == "xlsx":
+            archive.write(xlsx_path, f"{quarter}.xlsx")
+            xlsx_path.unlink()
+        else:
+            fmt = CSV_FORMATS[fmt_name]
+            name = f"{fmt.member_dir}{quarter}{fmt.suffix}"
+            _write_csv_member(archive, name, blocks, fmt)
+        archive.writestr("leia-me.txt.pdf", b"%PDF-1.4 dicionario de dados")
+    return zip_path
+
+
+def _quarters(count: int, last: Tuple[int, int]) -> List[Tuple[int, int]]:
+    """
+    Lista os trimestres terminando em `last`, do mais antigo ao mais novo.
+
+    :param count: Quantidade de trimestres.
+    :param last: Tupla (ano, trimestre) do mais recente.
+    :return: Lista de tuplas (ano, trimestre).
+    """
+    ano, tri = last
+    quarters = []
+    for _ in range(count):
+        quarters.append((ano, tri))
+        ano, tri = (ano, tri - 1) if tri > 1 else (ano - 1, 4)
+    return quarters[::-1]
+
+
+def generate_dataset(
+    output_dir: Path = DEFAULT_OUTPUT_DIR,
+    rows: int = 100_000,
+    operators: int = 1_000,
+    quarters: int = 4,
+    last_quarter: Tuple[int, int] = (2025, 3),
+    formats: Sequence[str] = FORMATS,
+    orphan_rate: float = 0.01,
+    seed: int = 42,
+) -> SyntheticDataset:
+    """
+    Gera ZIPs de trimestres e o CADOP correspondente, de forma deterministica.
+
+    As linhas sao divididas igualmente entre os trimestres e o formato do
+    arquivo de cada trimestre alterna conforme `formats`.
+
+    :param output_dir: Diretorio de saida (recebe raw/ e o CADOP).
+    :param rows: Total de linhas de balancete (todos os trimestres).
+    :param operators: Operadoras no CADOP.
+    :param quarters: Quantidade de trimestres.
+    :param last_quarter: Tupla (ano, trimestre) do mais recente.
+    :param formats: Formatos alternados por trimestre (ver FORMATS).
+    :param orphan_rate: Fracao de registros ANS ausentes do CADOP.
+    :param seed: Semente aleatoria.
+    :return: Descricao do conjunto gerado.
+    """
+    unknown = [name for name in formats if name not in FORMATS]
+    if unknown or not formats:
+        raise ValueError(f"Formato desconhecido: {unknown} (use {', '.join(FORMATS)})")
+    rng = np.random.default_rng(seed)
+    cadop_df = build_cadop(rng, operators)
+    cadop_path = write_cadop(cadop_df, output_dir / CADOP_FILE_NAME)
+
+    orphans = max(int(operators * orphan_rate), 0)
+    registros = list(cadop_df["REGISTRO_OPERADORA"].unique()) + [
+        str(900000 + i) for i in range(orphans)
+    ]
+    raw_dir = output_dir / RAW_SUBDIR
+    zips = []
+    per_quarter = rows // quarters
+    for index, (ano, tri) in enumerate(_quarters(quarters, last_quarter)):
+        count = per_quarter + (rows % quarters if index == quarters - 1 else 0)
+        blocks = _raw_blocks(rng, registros, count, ano, tri)
+        fmt_name = formats[index % len(formats)]
+        zips.append(write_quarter_zip(raw_dir, ano, tri, fmt_name, blocks))
+    return SyntheticDataset(
+        raw_dir=raw_dir,
+        cadop_path=cadop_path,
+        zips=tuple(zips),
+        raw_rows=rows,
+        operators=operators,
+    )
+
+
+def build_consolidated(
+    cadop_path: Path,
+    rows: int,
+    seed: int = 42,
+    invalid_rate: float = 0.03,
+) -> "pd.DataFrame":
+    """
+    Monta um consolidado sintetico (saida de consolidate) com `rows` linhas,
+    para medir validacao, enriquecimento e agregacao em qualquer escala.
+
+    Usa CNPJs e razoes sociais do CADOP; uma fracao das linhas tem CNPJ
+    fora do CADOP, razao social vazia ou valor nao positivo.
+
+    :param cadop_path: CADOP gerado por generate_dataset.
+    :param rows: Quantidade de linhas.
+    :param seed: Semente aleatoria.
+    :param invalid_rate: Fracao de linhas com cada tipo de problema.
+    :return: DataFrame com CNPJ, RazaoSocial, Trimestre, Ano e ValorDespesas.
+    """
+    rng = np.random.default_rng(seed)
+    cadop_df = pd.read_csv(cadop_path, sep=";", dtype=str, keep_default_na=False)
+    pick = rng.integers(0, len(cadop_df), size=rows)
+    cnpj = cadop_df["CNPJ"].str.replace(r"\D", "", regex=True).to_numpy()[pick]
+    razao = cadop_df["Razao_Social"].to_numpy()[pick]
+    valor = np.round(rng.lognormal(14, 2, size=rows), 2)
+
+    outside = rng.random(rows) < invalid_rate
+    cnpj[outside] = _random_cnpjs(rng, int(outside.sum()))
+    razao = np.where(rng.random(rows) < invalid_rate, "", razao)
+    valor = np.where(rng.random(rows) < invalid_rate, -valor, valor)
+    return pd.DataFrame(
+        {
+            "CNPJ": cnpj,
+            "RazaoSocial": razao,
+            "Trimestre": rng.integers(1, 5, size=rows),
+            "Ano": rng.integers(2023, 2026, size=rows),
+            "ValorDespesas": valor,
+        }
+    )
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """
+    Le os argumentos de linha de comando do gerador.
+
+    :param argv: Argumentos (None usa sys.argv).
+    :return: Argumentos lidos.
+    """
+    parser = argparse.ArgumentParser(
+        description="Gera ZIPs de trimestres e CADOP sinteticos da ANS."
+    )
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--operators", type=int, default=1_000)
+    parser.add_argument("--quarters", type=int, default=4)
+    parser.add_argument(
+        "--formats",
+        default=",".join(FORMATS),
+        help=f"Formatos alternados por trimestre ({', '.join(FORMATS)}).",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    dataset = generate_dataset(
+        output_dir=args.output,
+        rows=args.rows,
+        operators=args.operators,
+        quarters=args.quarters,
+        formats=args.formats.split(","),
+        seed=args.seed,
+    )
+    for zip_path in dataset.zips:
+        print(f"ZIP gerado: {zip_path}")
+    print(f"CADOP gerado: {dataset.cadop_path}")
@@ -1,24 +1,33 @@
-﻿import zipfile
+﻿import json
+import logging
+import time
+import zipfile
 import unicodedata
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Iterable, List
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Tuple
 
 import pandas as pd
 import requests
-from openpyxl import load_workbook
 
-try:
-    from etl.fetch.ans_indexer import get_last_trimesters
-except ModuleNotFoundError:
-    from ans_indexer import get_last_trimesters
+# Modulo da pipeline (importado como etl.fetch.ans_downloader): depende de
+# etl.process, entao nao roda como script solto.
+from etl.fetch import raw_cache
+from etl.fetch.ans_indexer import get_last_trimesters
+from etl.process.csv_dialect import encodings_for, sniff_csv
+from etl.process.xlsx_reader import iter_xlsx_frames
 
 DEFAULT_RAW_DIR = Path("data/raw/ans")
 DEFAULT_EXTRACT_DIR = Path("data/processed/ans")
 CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_WORKERS = 4
+DOWNLOAD_RETRIES = 3
+RETRY_BACKOFF = 2.0
+PART_SUFFIX = ".part"
+# Validadores da resposta que iniciou o .part (If-Range na retomada).
+PART_META_SUFFIX = ".json"
 CSV_EXTS = {".csv", ".txt"}
 XLSX_EXT = ".xlsx"
-CSV_SEPS = [";", ",", "\t", "|", None]
-CSV_ENCODINGS = ["utf-8", "latin-1"]
 
 
 def _build_quarter_dir(ano: int, tri: int) -> str:
@@ -45,40 +54,350 @@ def _zip_path(item: Dict, raw_dir: Path) -> Path:
     return raw_dir / str(ano) / _build_quarter_dir(ano, tri) / item["filename"]
 
 
-def download_file(url: str, dest: Path, timeout: int = 30) -> Path:
+def _part_path(dest: Path) -> Path:
+    """
+    Retorna o caminho do arquivo parcial usado durante o download.
+
+    :param dest: Caminho de destino final.
+    :return: Caminho do arquivo .part.
+    """
+    return dest.with_name(dest.name + PART_SUFFIX)
+
+
+def _range_total(content_range: Optional[str]) -> Optional[int]:
+    """
+    Extrai o tamanho total de um header Content-Range.
+
+    :param content_range: Valor do header (ex.: bytes 0-99/1000).
+    :return: Tamanho total ou None se desconhecido.
+    """
+    if not content_range or "/" not in content_range:
+        return None
+    total = content_range.rsplit("/", 1)[1].strip()
+    return int(total) if total.isdigit() else None
+
+
+def _part_meta_path(part: Path) -> Path:
+    """
+    Retorna o arquivo com os validadores do parcial.
+
+    :param part: Caminho do arquivo parcial.
+    :return: Caminho do JSON ao lado do .part.
+    """
+    return part.with_name(part.name + PART_META_SUFFIX)
+
+
+def _load_part_meta(part: Path) -> Dict[str, str]:
+    """
+    Le os validadores (ETag/Last-Modified) gravados para o parcial.
+
+    :param part: Caminho do arquivo parcial.
+    :return: Headers gravados ou vazio se ausentes.
+    """
+    try:
+        return json.loads(_part_meta_path(part).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_part_meta(part: Path, headers: Mapping[str, str]) -> Dict[str, str]:
+    """
+    Grava os validadores da resposta que iniciou o parcial.
+
+    :param part: Caminho do arquivo parcial.
+    :param headers: Headers da resposta.
+    :return: Validadores gravados.
+    """
+    meta = {
+        name: headers[name] for name in ("ETag", "Last-Modified") if headers.get(name)
+    }
+    _part_meta_path(part).write_text(json.dumps(meta), encoding="utf-8")
+    return meta
+
+
+def _discard_part(part: Path) -> None:
+    """
+    Remove o arquivo parcial e os validadores dele.
+
+    :param part: Caminho do arquivo parcial.
+    :return: None.
+    """
+    part.unlink(missing_ok=True)
+    _part_meta_path(part).unlink(missing_ok=True)
+
+
+def _if_range(meta: Dict[str, str]) -> Optional[str]:
+    """
+    Escolhe o validador do If-Range: ETag forte ou, sem ele, Last-Modified.
+
+    :param meta: Validadores do parcial.
+    :return: Valor do header ou None se nao ha como retomar com seguranca.
     """
-    Baixa um arquivo para disco usando streaming.
+    etag = meta.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return meta.get("Last-Modified")
+
+
+def _same_version(meta: Dict[str, str], headers: Mapping[str, str]) -> bool:
+    """
+    Confere se a resposta e da mesma versao que iniciou o parcial.
+
+    :param meta: Validadores do parcial.
+    :param headers: Headers da resposta.
+    :return: True se os validadores presentes nos dois coincidem.
+    """
+    shared = [name for name in meta if headers.get(name)]
+    return bool(shared) and all(meta[name] == headers[name] for name in shared)
+
+
+def _fetch_part(
+    url: str,
+    part: Path,
+    timeout: int,
+    headers: Optional[Dict[str, str]] = None,
+    unchanged: Optional[Callable[[Mapping[str, str]], bool]] = None,
+) -> Tuple[int, Optional[Mapping[str, str]]]:
+    """
+    Baixa (ou retoma via HTTP Range) o conteudo para o arquivo parcial.
+
+    A retomada envia If-Range com o validador da resposta que iniciou o
+    parcial e so anexa um 206 da mesma versao, a partir do fim do parcial;
+    se o remoto mudou, o parcial e regravado do zero.
 
     :param url: URL do arquivo.
-    :param dest: Caminho de destino.
+    :param part: Caminho do arquivo parcial.
     :param timeout: Timeout em segundos.
-    :return: Caminho do arquivo baixado.
+    :param headers: Headers extras da requisicao (ex.: If-None-Match).
+    :param unchanged: Predicado sobre os headers da resposta; se verdadeiro, o
+        corpo nao e lido.
+    :return: Tupla (bytes recebidos nesta tentativa, headers da resposta; None
+        se o remoto nao mudou).
     """
-    dest.parent.mkdir(parents=True, exist_ok=True)
-    with requests.get(url, stream=True, timeout=timeout) as r:
+    offset = part.stat().st_size if part.exists() else 0
+    meta = _load_part_meta(part) if offset else {}
+    validator = _if_range(meta)
+    if offset and not validator:
+        # Sem validador nao da para saber se o parcial e da versao atual.
+        _discard_part(part)
+        offset = 0
+    request_headers = dict(headers or {})
+    if offset:
+        request_headers["Range"] = f"bytes={offset}-"
+        request_headers["If-Range"] = validator
+    with requests.get(url, stream=True, timeout=timeout, headers=request_headers) as r:
+        if r.status_code == 304 or (r.ok and unchanged and unchanged(r.headers)):
+            return 0, None
+        if r.status_code == 416:
+            # Parcial ja completo (ou maior que o remoto): confere pelo total.
+            if _range_total(r.headers.get("Content-Range")) == offset:
+                return 0, {**meta, "Content-Range": f"bytes */{offset}"}
+            _discard_part(part)
+            raise requests.HTTPError(f"Range invalido para {url}", response=r)
         r.raise_for_status()
-        with open(dest, "wb") as f:
+        if r.status_code == 206:
+            content_range = r.headers.get("Content-Range") or ""
+            start = content_range.split(" ", 1)[-1].split("-", 1)[0]
+            if not offset or start != str(offset) or not _same_version(meta, r.headers):
+                _discard_part(part)
+                raise requests.HTTPError(
+                    f"Retomada de {url} com outra versao ou faixa", response=r
+                )
+            mode = "ab"
+        else:
+            mode = "wb"
+            _save_part_meta(part, r.headers)
+        received = 0
+        with open(part, mode) as f:
             for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
                 if chunk:
                     f.write(chunk)
-    return dest
+                    received += len(chunk)
+    return received, r.headers
+
+
+def _fetch_with_retries(
+    url: str,
+    part: Path,
+    timeout: int = 30,
+    retries: int = DOWNLOAD_RETRIES,
+    headers: Optional[Dict[str, str]] = None,
+    unchanged: Optional[Callable[[Mapping[str, str]], bool]] = None,
+) -> Tuple[int, Optional[Mapping[str, str]]]:
+    """
+    Repete _fetch_part com backoff; cada tentativa retoma o .part da anterior.
 
+    :param url: URL do arquivo.
+    :param part: Caminho do arquivo parcial.
+    :param timeout: Timeout em segundos.
+    :param retries: Tentativas antes de desistir.
+    :param headers: Headers extras da requisicao.
+    :param unchanged: Predicado repassado a _fetch_part.
+    :return: Tupla (bytes recebidos, headers da ultima resposta; None se inalterado).
+    """
+    last_error: Optional[Exception] = None
+    for attempt in range(retries):
+        try:
+            return _fetch_part(url, part, timeout, headers=headers, unchanged=unchanged)
+        except requests.RequestException as exc:
+            last_error = exc
+            if attempt + 1 < retries:
+                time.sleep(RETRY_BACKOFF * (attempt + 1))
+    raise RuntimeError(f"Falha ao baixar {url}: {last_error}")
+
+
+def _download_with_stats(
+    url: str, dest: Path, timeout: int = 30, retries: int = DOWNLOAD_RETRIES
+) -> Tuple[Path, int, float, bool]:
+    """
+    Baixa um arquivo com retomada do .part e mede a vazao.
 
-def download_items(items: List[Dict], raw_dir: Path = DEFAULT_RAW_DIR) -> List[Path]:
+    :param url: URL do arquivo.
+    :param dest: Caminho de destino.
+    :param timeout: Timeout em segundos.
+    :param retries: Tentativas antes de desistir.
+    :return: Tupla (caminho, bytes recebidos, segundos, False: sem cache).
+    """
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    part = _part_path(dest)
+    started = time.perf_counter()
+    received, _ = _fetch_with_retries(url, part, timeout=timeout, retries=retries)
+    part.replace(dest)
+    _discard_part(part)
+    return dest, received, time.perf_counter() - started, False
+
+
+def download_file(url: str, dest: Path, timeout: int = 30) -> Path:
     """
-    Baixa todos os ZIPs para os itens informados.
+    Baixa um arquivo para disco usando streaming, retomando parciais.
+
+    :param url: URL do arquivo.
+    :param dest: Caminho de destino.
+    :param timeout: Timeout em segundos.
+    :return: Caminho do arquivo baixado.
+    """
+    path, _, _, _ = _download_with_stats(url, dest, timeout=timeout)
+    return path
+
+
+def _download_part_file(
+    url: str,
+    dest: Path,
+    headers: Dict[str, str],
+    unchanged: Optional[Callable[[Mapping[str, str]], bool]],
+) -> Tuple[int, Optional[Mapping[str, str]]]:
+    """
+    Adapta o download com retomada para o formato esperado pelo cache.
+
+    :param url: URL do arquivo.
+    :param dest: Caminho de destino.
+    :param headers: Headers condicionais da requisicao.
+    :param unchanged: Predicado que dispensa a leitura do corpo.
+    :return: Tupla (bytes recebidos, headers da resposta; None se inalterado).
+    """
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    part = _part_path(dest)
+    received, response_headers = _fetch_with_retries(
+        url, part, headers=headers, unchanged=unchanged
+    )
+    if response_headers is None:
+        # Parcial de uma execucao interrompida nao vale mais: o cache esta em dia.
+        _discard_part(part)
+        return received, None
+    part.replace(dest)
+    _discard_part(part)
+    return received, response_headers
+
+
+def download_cached(
+    url: str,
+    dest: Path,
+    cache_dir: Path = raw_cache.DEFAULT_CACHE_DIR,
+    max_bytes: int = raw_cache.DEFAULT_MAX_BYTES,
+) -> Tuple[Path, int, float, bool]:
+    """
+    Baixa um arquivo passando pelo cache persistente (GET condicional).
+
+    :param url: URL do arquivo.
+    :param dest: Caminho de destino.
+    :param cache_dir: Diretorio do cache persistente.
+    :param max_bytes: Tamanho maximo do cache.
+    :return: Tupla (caminho, bytes recebidos, segundos, True se veio do cache).
+    """
+    started = time.perf_counter()
+    path, received, cached = raw_cache.fetch(
+        url, dest, _download_part_file, cache_dir=cache_dir, max_bytes=max_bytes
+    )
+    return path, received, time.perf_counter() - started, cached
+
+
+def _log_throughput(
+    logger: Optional[logging.Logger],
+    path: Path,
+    size: int,
+    elapsed: float,
+    cached: bool,
+) -> None:
+    """
+    Registra a vazao de um download concluido.
+
+    :param logger: Logger opcional.
+    :param path: Arquivo baixado.
+    :param size: Bytes recebidos.
+    :param elapsed: Tempo em segundos.
+    :param cached: True se o arquivo veio do cache (remoto inalterado).
+    :return: None.
+    """
+    if not logger:
+        return
+    if cached:
+        logger.info("Inalterado (cache) %s", path.name)
+        return
+    mb = size / (1024 * 1024)
+    rate = mb / elapsed if elapsed > 0 else 0.0
+    logger.info(
+        "Baixado %s: %.1f MB em %.1fs (%.2f MB/s)", path.name, mb, elapsed, rate
+    )
+
+
+def download_items(
+    items: List[Dict],
+    raw_dir: Path = DEFAULT_RAW_DIR,
+    workers: int = DOWNLOAD_WORKERS,
+    logger: Optional[logging.Logger] = None,
+    cache_dir: Optional[Path] = None,
+) -> List[Path]:
+    """
+    Baixa todos os ZIPs para os itens informados, N arquivos por vez.
 
     :param items: Itens de trimestre.
     :param raw_dir: Diretorio base de download.
-    :return: Lista de caminhos baixados.
+    :param workers: Quantidade maxima de downloads simultaneos.
+    :param logger: Logger opcional para vazao por arquivo.
+    :param cache_dir: Cache persistente opcional; arquivos inalterados nao sao baixados.
+    :return: Lista de caminhos baixados (na ordem dos itens).
     """
-    paths: List[Path] = []
-    for item in items:
-        path = _zip_path(item, raw_dir)
-        if path.exists():
-            paths.append(path)
-            continue
-        paths.append(download_file(item["url"], path))
+    paths = [_zip_path(item, raw_dir) for item in items]
+    if cache_dir is None:
+        pending = [(i, p) for i, p in zip(items, paths) if not p.exists()]
+    else:
+        pending = list(zip(items, paths))
+    if not pending:
+        return paths
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        if cache_dir is None:
+            futures = [
+                executor.submit(_download_with_stats, item["url"], path)
+                for item, path in pending
+            ]
+        else:
+            futures = [
+                executor.submit(download_cached, item["url"], path, cache_dir)
+                for item, path in pending
+            ]
+        for future in futures:
+            _log_throughput(logger, *future.result())
     return paths
 
 
@@ -161,6 +480,16 @@ def _is_descricao_col(name: str) -> bool:
     return _normalize_col_name(name) == "descricao"
 
 
+def _has_descricao_col(columns: List[str]) -> bool:
+    """
+    Retorna True se o cabecalho tiver a coluna DESCRICAO.
+
+    :param columns: Colunas do cabecalho.
+    :return: True se encontrou DESCRICAO.
+    """
+    return any(_is_descricao_col(col) for col in columns)
+
+
 def _df_contains_evento(df: "pd.DataFrame") -> bool:
     """
     Verifica se DESCRICAO contem despesas de eventos/sinistros.
@@ -187,28 +516,45 @@ def _csv_contains_evento(path: Path) -> bool:
     :param path: Caminho do arquivo.
     :return: True se encontrou eventos/sinistros.
     """
-    for encoding in CSV_ENCODINGS:
-        for sep in CSV_SEPS:
-            try:
-                reader = pd.read_csv(
-                    path,
-                    sep=sep,
-                    engine="python",
-                    dtype=str,
-                    chunksize=50000,
-                    encoding=encoding,
-                    on_bad_lines="skip",
-                    usecols=_is_descricao_col,
-                )
-                for chunk in reader:
-                    if _df_contains_evento(chunk):
-                        return True
-                return False
-            except Exception:
-                continue
+    dialect = sniff_csv(path, _has_descricao_col)
+    if dialect is None:
+        return False
+    for encoding in encodings_for(dialect):
+        try:
+            reader = pd.read_csv(
+                path,
+                sep=dialect.sep,
+                engine="c",
+                dtype=str,
+                chunksize=50000,
+                encoding=encoding,
+                on_bad_lines="skip",
+                usecols=_is_descricao_col,
+            )
+            for chunk in reader:
+                if _df_contains_evento(chunk):
+                    return True
+            return False
+        except UnicodeDecodeError:
+            continue
+        except Exception:
+            return False
     return False
 
 
+def _select_descricao_col(header: List[Optional[str]]) -> Optional[Tuple[int]]:
+    """
+    Localiza a primeira coluna DESCRICAO no cabecalho do XLSX.
+
+    :param header: Valores da primeira linha da planilha.
+    :return: Tupla com o indice da coluna ou None.
+    """
+    for idx, name in enumerate(header):
+        if _is_descricao_col(name):
+            return (idx,)
+    return None
+
+
 def _xlsx_contains_evento(path: Path) -> bool:
     """
     Procura em XLSX por despesas de eventos/sinistros.
@@ -217,37 +563,12 @@ def _xlsx_contains_evento(path: Path) -> bool:
     :return: True se encontrou eventos/sinistros.
     """
     try:
-        wb = load_workbook(filename=path, read_only=True, data_only=True)
-    except Exception:
+        for chunk in iter_xlsx_frames(path, _select_descricao_col):
+            if _df_contains_evento(chunk):
+                return True
         return False
-    try:
-        for ws in wb.worksheets:
-            rows = ws.iter_rows(values_only=True)
-            try:
-                header = next(rows)
-            except StopIteration:
-                continue
-            if not header:
-                continue
-            col_index = None
-            for idx, name in enumerate(header):
-                if _is_descricao_col(name):
-                    col_index = idx
-                    break
-            if col_index is None:
-                continue
-            for row in rows:
-                if not row or col_index >= len(row):
-                    continue
-                value = row[col_index]
-                if value is None:
-                    continue
-                text = str(value).lower()
-                if "despesa" in text and ("evento" in text or "sinistro" in text):
-                    return True
+    except Exception:
         return False
-    finally:
-        wb.close()
 
 
 def find_evento_files(paths: Iterable[Path]) -> List[Path]:
@@ -271,9 +592,3 @@ def find_evento_files(paths: Iterable[Path]) -> List[Path]:
                 if _xlsx_contains_evento(file):
                     results.append(file)
     return results
-
-
-if __name__ == "__main__":
-    downloaded = download_last_trimesters(3)
-    for path in downloaded:
-        print(path)
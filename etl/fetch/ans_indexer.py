@@ -1,26 +1,151 @@
-﻿import re
+﻿import hashlib
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
 import requests
-from bs4 import BeautifulSoup
-from typing import List, Dict
+from requests.adapters import HTTPAdapter
 
 BASE_URL = "https://dadosabertos.ans.gov.br/FTP/PDA/demonstracoes_contabeis/"
+LISTING_CACHE_DIR = Path("data/cache/listings")
+LISTING_TTL = 6 * 60 * 60
+CRAWL_WORKERS = 8
+QUARTERS_PER_YEAR = 4
 
 ZIP_RE = re.compile(r"^([1-4])T(\d{4})\.zip$", re.IGNORECASE)
 QUARTER_DIR_RE = re.compile(r"^([1-4])T(\d{4})/?$", re.IGNORECASE)
 QUARTER_IN_NAME_RE = re.compile(r"([1-4])T(\d{4})", re.IGNORECASE)
 
 
+_SESSION: Optional[requests.Session] = None
+_SESSION_LOCK = threading.Lock()
+
+
+class _HrefParser(HTMLParser):
+    """
+    Parser em streaming que guarda apenas os href das tags <a>.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.links: List[str] = []
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        if tag != "a":
+            return
+        for name, value in attrs:
+            if name == "href" and value:
+                self.links.append(value)
+                return
+
+
+def _session() -> requests.Session:
+    """
+    Retorna a sessao HTTP compartilhada (keep-alive) do indexador.
+
+    :return: Sessao requests reutilizavel entre threads.
+    """
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=CRAWL_WORKERS)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _SESSION = session
+        return _SESSION
+
+
+def _extract_hrefs(html: str) -> List[str]:
+    """
+    Extrai os href de uma listagem HTML sem montar a arvore do documento.
+
+    :param html: Conteudo HTML.
+    :return: Lista de links encontrados.
+    """
+    parser = _HrefParser()
+    parser.feed(html)
+    parser.close()
+    return parser.links
+
+
+def _cache_file(url: str) -> Path:
+    """
+    Retorna o arquivo de cache em disco de uma listagem.
+
+    :param url: URL da listagem.
+    :return: Caminho do arquivo JSON.
+    """
+    return LISTING_CACHE_DIR / f"{hashlib.sha1(url.encode('utf-8')).hexdigest()}.json"
+
+
+def _read_cached_links(url: str) -> Optional[List[str]]:
+    """
+    Le uma listagem do cache se ainda estiver dentro do TTL.
+
+    :param url: URL da listagem.
+    :return: Lista de links ou None se ausente/expirada.
+    """
+    path = _cache_file(url)
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if time.time() - data.get("fetched_at", 0) > LISTING_TTL:
+        return None
+    return data.get("links")
+
+
+def _write_cached_links(url: str, links: List[str]) -> None:
+    """
+    Grava uma listagem no cache em disco.
+
+    :param url: URL da listagem.
+    :param links: Links encontrados.
+    :return: None.
+    """
+    path = _cache_file(url)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+    payload = {"url": url, "fetched_at": time.time(), "links": links}
+    tmp.write_text(json.dumps(payload), encoding="utf-8")
+    tmp.replace(path)
+
+
 def _list_links(url: str) -> List[str]:
     """
-    Busca e retorna todos os links href de uma listagem.
+    Busca e retorna todos os links href de uma listagem (com cache por TTL).
 
     :param url: URL da listagem.
     :return: Lista de links encontrados.
     """
-    r = requests.get(url, timeout=20)
+    cached = _read_cached_links(url)
+    if cached is not None:
+        return cached
+    r = _session().get(url, timeout=20)
     r.raise_for_status()
-    soup = BeautifulSoup(r.text, "html.parser")
-    return [a.get("href") for a in soup.find_all("a") if a.get("href")]
+    links = _extract_hrefs(r.text)
+    _write_cached_links(url, links)
+    return links
+
+
+def _list_many(urls: Iterable[str]) -> Dict[str, List[str]]:
+    """
+    Lista varias URLs em paralelo na sessao compartilhada.
+
+    :param urls: URLs das listagens.
+    :return: Mapa URL -> links.
+    """
+    unique = list(dict.fromkeys(urls))
+    if not unique:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(CRAWL_WORKERS, len(unique))) as executor:
+        return dict(zip(unique, executor.map(_list_links, unique)))
 
 
 def _parse_quarter_from_name(name: str):
@@ -150,6 +275,7 @@ def _collect_quarter_files(
     year_url: str,
     quarter_dirs: Dict[tuple, str],
     quarter_zips: Dict[tuple, List[str]],
+    dir_listings: Dict[str, List[str]],
     results: List[Dict],
     seen_urls: set,
 ) -> bool:
@@ -161,6 +287,7 @@ def _collect_quarter_files(
     :param year_url: URL base do ano.
     :param quarter_dirs: Pastas por trimestre.
     :param quarter_zips: ZIPs por trimestre.
+    :param dir_listings: Listagens ja buscadas das pastas de trimestre.
     :param results: Lista de resultados.
     :param seen_urls: Conjunto de URLs ja vistas.
     :return: True se encontrou arquivos, False caso contrario.
@@ -175,7 +302,10 @@ def _collect_quarter_files(
     dir_name = quarter_dirs.get((ano, tri))
     if dir_name:
         quarter_url = f"{year_url}{dir_name}"
-        for item in _list_links(quarter_url):
+        links = dir_listings.get(quarter_url)
+        if links is None:
+            links = _list_links(quarter_url)
+        for item in links:
             if _is_parent_dir(item) or not item.lower().endswith(".zip"):
                 continue
             url = f"{quarter_url}{item}"
@@ -185,41 +315,107 @@ def _collect_quarter_files(
     return quarter_has_files
 
 
-def get_last_trimesters(limit: int = 3) -> List[Dict]:
+def _year_candidates(year_url: str, year_links: List[str]) -> List[tuple]:
     """
-    Descobre os ultimos N trimestres e retorna os ZIPs encontrados.
+    Monta os trimestres candidatos de um ano, do mais recente ao mais antigo.
 
-    :param limit: Quantidade de trimestres.
+    :param year_url: URL base do ano.
+    :param year_links: Links da listagem do ano.
+    :return: Lista de tuplas (ano, tri, year_url, dirs, zips).
+    """
+    links = [x for x in year_links if not _is_parent_dir(x)]
+    quarter_dirs, quarter_zips = _split_year_links(links)
+    return [
+        (ano, tri, year_url, quarter_dirs, quarter_zips)
+        for ano, tri in _sorted_quarters(quarter_dirs, quarter_zips)
+    ]
+
+
+def _crawl(
+    years: List[str], limit: Optional[int] = None, since: Optional[int] = None
+) -> List[Dict]:
+    """
+    Percorre anos e pastas de trimestre em paralelo, em lotes.
+
+    Os resultados mantem a ordem da varredura sequencial: anos e trimestres
+    do mais recente para o mais antigo.
+
+    :param years: Anos disponiveis em ordem decrescente.
+    :param limit: Quantidade de trimestres (None para todos).
+    :param since: Ano minimo dos trimestres (None para sem limite).
     :return: Lista de itens com ano, trimestre, arquivo e URL.
     """
-    years = _list_years()
     results: List[Dict] = []
     seen_urls: set = set()
     found_quarters: set = set()
 
-    for year in years:
-        year_url = f"{BASE_URL}{year}/"
-        year_links = [x for x in _list_links(year_url) if not _is_parent_dir(x)]
-        quarter_dirs, quarter_zips = _split_year_links(year_links)
+    if limit is None:
+        batch_size = len(years)
+    else:
+        batch_size = limit // QUARTERS_PER_YEAR + 1
+
+    for start in range(0, len(years), max(batch_size, 1)):
+        year_urls = [f"{BASE_URL}{year}/" for year in years[start : start + batch_size]]
+        year_listings = _list_many(year_urls)
+        candidates = [
+            cand
+            for url in year_urls
+            for cand in _year_candidates(url, year_listings[url])
+            if since is None or cand[0] >= since
+        ]
+
+        pos = 0
+        while pos < len(candidates):
+            missing = None if limit is None else limit - len(found_quarters)
+            window = (
+                candidates[pos:] if missing is None else candidates[pos : pos + missing]
+            )
+            dir_urls = [
+                f"{year_url}{dirs[(ano, tri)]}"
+                for ano, tri, year_url, dirs, _ in window
+                if (ano, tri) in dirs and (ano, tri) not in found_quarters
+            ]
+            dir_listings = _list_many(dir_urls)
+            for ano, tri, year_url, quarter_dirs, quarter_zips in window:
+                pos += 1
+                if (ano, tri) in found_quarters:
+                    continue
+                if _collect_quarter_files(
+                    ano,
+                    tri,
+                    year_url,
+                    quarter_dirs,
+                    quarter_zips,
+                    dir_listings,
+                    results,
+                    seen_urls,
+                ):
+                    found_quarters.add((ano, tri))
+                if limit is not None and len(found_quarters) == limit:
+                    return results
 
-        for ano, tri in _sorted_quarters(quarter_dirs, quarter_zips):
-            if (ano, tri) in found_quarters:
-                continue
+    return results
 
-            if _collect_quarter_files(
-                ano,
-                tri,
-                year_url,
-                quarter_dirs,
-                quarter_zips,
-                results,
-                seen_urls,
-            ):
-                found_quarters.add((ano, tri))
-            if len(found_quarters) == limit:
-                return results
 
-    return results
+def get_last_trimesters(limit: int = 3) -> List[Dict]:
+    """
+    Descobre os ultimos N trimestres e retorna os ZIPs encontrados.
+
+    :param limit: Quantidade de trimestres.
+    :return: Lista de itens com ano, trimestre, arquivo e URL.
+    """
+    return _crawl(_list_years(), limit=limit)
+
+
+def get_trimesters_since(since_year: int) -> List[Dict]:
+    """
+    Descobre todos os trimestres a partir de um ano (ex.: historico desde 2007).
+
+    :param since_year: Ano inicial (inclusivo).
+    :return: Lista de itens com ano, trimestre, arquivo e URL.
+    """
+    years = [year for year in _list_years() if int(year) >= since_year]
+    return _crawl(years, since=since_year)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,317 @@
+import functools
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Mapping, Optional, Tuple
+
+DEFAULT_CACHE_DIR = Path("data/cache/raw")
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024 * 1024
+MANIFEST_NAME = "manifest.json"
+OBJECTS_DIR = "objects"
+PARTS_DIR = "parts"
+HASH_CHUNK = 1024 * 1024
+
+_LOCK = threading.Lock()
+
+
+def _manifest_path(cache_dir: Path) -> Path:
+    """
+    Retorna o caminho do manifesto JSON do cache.
+
+    :param cache_dir: Diretorio do cache.
+    :return: Caminho do manifesto.
+    """
+    return cache_dir / MANIFEST_NAME
+
+
+def _load_manifest(cache_dir: Path) -> Dict[str, Dict]:
+    """
+    Le o manifesto do cache, retornando vazio se ausente ou corrompido.
+
+    :param cache_dir: Diretorio do cache.
+    :return: Mapa URL -> entrada do cache.
+    """
+    path = _manifest_path(cache_dir)
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(cache_dir: Path, manifest: Dict[str, Dict]) -> None:
+    """
+    Grava o manifesto de forma atomica (arquivo temporario + replace).
+
+    :param cache_dir: Diretorio do cache.
+    :param manifest: Mapa URL -> entrada do cache.
+    :return: None.
+    """
+    path = _manifest_path(cache_dir)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8")
+    tmp.replace(path)
+
+
+def _object_path(cache_dir: Path, digest: str) -> Path:
+    """
+    Retorna o caminho do objeto enderecado pelo hash do conteudo.
+
+    :param cache_dir: Diretorio do cache.
+    :param digest: SHA-256 do conteudo.
+    :return: Caminho do objeto.
+    """
+    return cache_dir / OBJECTS_DIR / digest[:2] / digest
+
+
+def _part_path(cache_dir: Path, url: str) -> Path:
+    """
+    Retorna um caminho parcial estavel por URL (permite retomar entre execucoes).
+
+    :param cache_dir: Diretorio do cache.
+    :param url: URL do arquivo.
+    :return: Caminho do arquivo parcial.
+    """
+    return cache_dir / PARTS_DIR / hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+
+def _file_sha256(path: Path) -> str:
+    """
+    Calcula o SHA-256 de um arquivo em blocos.
+
+    :param path: Caminho do arquivo.
+    :return: Hash hexadecimal.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(HASH_CHUNK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _validators(headers: Mapping[str, str]) -> Dict[str, str]:
+    """
+    Extrai ETag, Last-Modified e tamanho total de uma resposta.
+
+    :param headers: Headers HTTP (200 ou 206).
+    :return: Mapa com os validadores presentes.
+    """
+    keys = {"etag": "ETag", "last_modified": "Last-Modified"}
+    found = {key: headers[name] for key, name in keys.items() if headers.get(name)}
+    # Em 206 o Content-Length e so do trecho; o total vem do Content-Range.
+    content_range = headers.get("Content-Range") or ""
+    total = content_range.rsplit("/", 1)[-1].strip() if "/" in content_range else ""
+    if total.isdigit():
+        found["content_length"] = total
+    elif headers.get("Content-Length") and "Content-Range" not in headers:
+        found["content_length"] = headers["Content-Length"]
+    return found
+
+
+def _is_unchanged(entry: Dict, headers: Mapping[str, str]) -> bool:
+    """
+    Compara os validadores remotos com os gravados no manifesto.
+
+    :param entry: Entrada do manifesto.
+    :param headers: Headers HTTP da resposta.
+    :return: True se o arquivo remoto nao mudou.
+    """
+    remote = _validators(headers)
+    if not remote.get("etag") and not remote.get("last_modified"):
+        return False
+    for key, value in remote.items():
+        if key == "content_length" and "content-encoding" in headers:
+            continue
+        if entry.get(key) != value:
+            return False
+    return True
+
+
+def _conditional_headers(entry: Dict) -> Dict[str, str]:
+    """
+    Monta os headers do GET condicional (If-None-Match/If-Modified-Since).
+
+    :param entry: Entrada do manifesto.
+    :return: Headers da requisicao.
+    """
+    headers = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def _materialize(source: Path, dest: Path) -> Path:
+    """
+    Disponibiliza o objeto do cache no destino (hardlink ou copia).
+
+    :param source: Objeto no cache.
+    :param dest: Caminho de destino.
+    :return: Caminho de destino.
+    """
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    if dest.exists():
+        dest.unlink()
+    try:
+        os.link(source, dest)
+    except OSError:
+        shutil.copy2(source, dest)
+    return dest
+
+
+def _reuse(cache_dir: Path, url: str, digest: str, dest: Path) -> Optional[Path]:
+    """
+    Atualiza o ultimo acesso da entrada (ordem do LRU) e disponibiliza o
+    objeto no destino, tudo sob o lock: um _evict de outra thread nao remove o
+    objeto entre a conferencia e o link.
+
+    :param cache_dir: Diretorio do cache.
+    :param url: URL da entrada.
+    :param digest: SHA-256 do objeto validado pelo GET condicional.
+    :param dest: Caminho de destino.
+    :return: Caminho de destino ou None se a entrada saiu do cache.
+    """
+    with _LOCK:
+        manifest = _load_manifest(cache_dir)
+        entry = manifest.get(url)
+        source = _object_path(cache_dir, digest)
+        if not entry or entry["sha256"] != digest or not source.exists():
+            return None
+        entry["last_access"] = time.time()
+        _save_manifest(cache_dir, manifest)
+        return _materialize(source, dest)
+
+
+def _evict(
+    cache_dir: Path, manifest: Dict[str, Dict], max_bytes: int, keep: str
+) -> None:
+    """
+    Remove entradas menos usadas ate o cache caber no limite de bytes.
+
+    :param cache_dir: Diretorio do cache.
+    :param manifest: Mapa URL -> entrada do cache (alterado in-place).
+    :param max_bytes: Tamanho maximo do cache.
+    :param keep: URL que nunca e removida (a que acabou de ser usada).
+    :return: None.
+    """
+    sizes = {entry["sha256"]: entry["size"] for entry in manifest.values()}
+    total = sum(sizes.values())
+    by_access = sorted(manifest.items(), key=lambda kv: kv[1].get("last_access", 0))
+    for url, entry in by_access:
+        if total <= max_bytes:
+            break
+        if url == keep:
+            continue
+        del manifest[url]
+        digest = entry["sha256"]
+        if any(other["sha256"] == digest for other in manifest.values()):
+            continue
+        total -= sizes[digest]
+        _object_path(cache_dir, digest).unlink(missing_ok=True)
+
+
+def cached_digest(url: str, cache_dir: Path = DEFAULT_CACHE_DIR) -> Optional[str]:
+    """
+    Retorna o SHA-256 do objeto em cache para a URL, se houver.
+
+    :param url: URL do arquivo.
+    :param cache_dir: Diretorio do cache.
+    :return: Hash hexadecimal ou None.
+    """
+    with _LOCK:
+        entry = _load_manifest(cache_dir).get(url)
+    return entry["sha256"] if entry else None
+
+
+def restore(
+    digest: str, dest: Path, cache_dir: Path = DEFAULT_CACHE_DIR
+) -> Optional[Path]:
+    """
+    Disponibiliza no destino um objeto do cache, sem acessar a rede.
+
+    :param digest: SHA-256 do conteudo (ver cached_digest).
+    :param dest: Caminho de destino.
+    :param cache_dir: Diretorio do cache.
+    :return: Caminho de destino ou None se o objeto saiu do cache.
+    """
+    source = _object_path(cache_dir, digest)
+    if not source.exists():
+        return None
+    return _materialize(source, dest)
+
+
+def fetch(
+    url: str,
+    dest: Path,
+    download: Callable[
+        [str, Path, Dict[str, str], Optional[Callable[[Mapping[str, str]], bool]]],
+        Tuple[int, Optional[Mapping[str, str]]],
+    ],
+    cache_dir: Path = DEFAULT_CACHE_DIR,
+    max_bytes: int = DEFAULT_MAX_BYTES,
+) -> Tuple[Path, int, bool]:
+    """
+    Obtem um arquivo via cache persistente, baixando apenas se mudou.
+
+    A verificacao e o download sao o mesmo GET condicional: se o remoto mudou,
+    o corpo dessa resposta vai para o parcial e os validadores gravados sao os
+    dela, nunca de uma requisicao posterior.
+
+    :param url: URL do arquivo.
+    :param dest: Caminho de destino.
+    :param download: Funcao (url, caminho, headers, inalterado) que baixa com
+        retentativas e retorna (bytes recebidos, headers da resposta); headers
+        None indicam 304 ou validadores iguais aos do manifesto.
+    :param cache_dir: Diretorio do cache.
+    :param max_bytes: Tamanho maximo do cache (LRU por tamanho).
+    :return: Tupla (caminho de destino, bytes baixados, True se veio do cache).
+        Um parcial ja completo de outra execucao nao vem do cache, mesmo com
+        0 bytes baixados.
+    """
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    with _LOCK:
+        entry = _load_manifest(cache_dir).get(url)
+
+    headers: Dict[str, str] = {}
+    unchanged = None
+    if entry and _object_path(cache_dir, entry["sha256"]).exists():
+        headers = _conditional_headers(entry)
+        unchanged = functools.partial(_is_unchanged, entry)
+
+    part = _part_path(cache_dir, url)
+    part.parent.mkdir(parents=True, exist_ok=True)
+    received, response_headers = download(url, part, headers, unchanged)
+    if response_headers is None:
+        reused = _reuse(cache_dir, url, entry["sha256"], dest)
+        if reused:
+            return reused, 0, True
+        # O objeto saiu do cache durante a verificacao: baixa sem condicional.
+        received, response_headers = download(url, part, {}, None)
+    validators = _validators(response_headers)
+
+    digest = _file_sha256(part)
+    obj = _object_path(cache_dir, digest)
+    obj.parent.mkdir(parents=True, exist_ok=True)
+    size = part.stat().st_size
+    if obj.exists():
+        part.unlink()
+    else:
+        part.replace(obj)
+
+    with _LOCK:
+        manifest = _load_manifest(cache_dir)
+        manifest[url] = {
+            **validators,
+            "sha256": digest,
+            "size": size,
+            "last_access": time.time(),
+        }
+        _evict(cache_dir, manifest, max_bytes, keep=url)
+        _save_manifest(cache_dir, manifest)
+        return _materialize(obj, dest), received, False
@@ -0,0 +1,519 @@
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from etl.process.money import format_money, parse_money
+
+if TYPE_CHECKING:
+    from api.db import Database
+
+CSV_ENCODING = "utf-8-sig"
+# Marcador de nulo no COPY: distingue NULL de texto vazio (como no \copy).
+NULL_MARK = r"\N"
+COPY_CHUNK_ROWS = 50_000
+COPY_READ_SIZE = 1024 * 1024
+# Resumos materializados lidos pela API e pelo analytics.sql (ver sql/ddl.sql).
+REFRESH_SUMMARIES_SQL = "SELECT ans.atualizar_resumos()"
+
+CADOP_COLUMNS = [
+    "registro_operadora",
+    "cnpj",
+    "razao_social",
+    "nome_fantasia",
+    "modalidade",
+    "logradouro",
+    "numero",
+    "complemento",
+    "bairro",
+    "cidade",
+    "uf",
+    "cep",
+    "ddd",
+    "telefone",
+    "fax",
+    "endereco_eletronico",
+    "representante",
+    "cargo_representante",
+    "regiao_de_comercializacao",
+    "data_registro_ans",
+]
+CONSOLIDADO_COLUMNS = ["cnpj", "razao_social", "trimestre", "ano", "valor_despesas"]
+AGREGADO_COLUMNS = [
+    "razao_social",
+    "uf",
+    "total_despesas",
+    "media_despesas",
+    "desvio_padrao_despesas",
+]
+# Caracteres aceitos nos valores monetarios (valor ~ '^[0-9.,-]+$').
+MONEY_CHARS = np.array([ord(char) for char in "0123456789.,-"], dtype=np.uint32)
+_COMMA = ord(",")
+# Colunas do CADOP reduzidas a digitos sem NULLIF (como no import.sql).
+DIGIT_COLUMNS = ("cep", "ddd")
+
+
+@dataclass(frozen=True)
+class TableLoad:
+    """
+    Carga de uma tabela: origem, conversao dos blocos e regra de gravacao.
+
+    Sem `reload_function`, grava com upsert; com ela, chama a funcao SQL com a
+    tabela temporaria (ex.: troca das particoes do consolidado). `after`
+    nomeia a tabela que precisa estar gravada antes (FK); o COPY para a
+    tabela temporaria roda em paralelo mesmo assim.
+    """
+
+    table: str
+    source: Path
+    columns: List[str]
+    key: Tuple[str, ...]
+    frames: Callable[[Path], Iterator["pd.DataFrame"]]
+    update_where: str = ""
+    reload_function: str = ""
+    after: Optional[str] = None
+
+
+@dataclass
+class LoadResult:
+    """
+    Resultado da carga de uma tabela.
+    """
+
+    table: str
+    copied: int = 0
+    written: int = 0
+    copy_seconds: float = 0.0
+    merge_seconds: float = 0.0
+
+
+class _CopyStream:
+    """
+    Arquivo somente leitura sobre blocos de CSV, consumido pelo copy_expert.
+
+    Cada bloco e gerado sob demanda, entao o COPY comeca antes do arquivo de
+    origem terminar de ser lido.
+    """
+
+    def __init__(self, blocks: Iterator[bytes]) -> None:
+        self._blocks = blocks
+        self._buffer = b""
+        self._pos = 0
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        Le ate size bytes do proximo trecho do CSV.
+
+        :param size: Maximo de bytes (negativo le tudo).
+        :return: Bytes lidos (vazio no fim).
+        """
+        if self._pos >= len(self._buffer):
+            self._buffer = next(self._blocks, b"")
+            self._pos = 0
+        if size < 0:
+            size = len(self._buffer)
+        data = self._buffer[self._pos : self._pos + size]
+        self._pos += len(data)
+        return data
+
+
+def _read_text(path: Path, sep: str = ",") -> Iterator["pd.DataFrame"]:
+    """
+    Le um CSV de saida em blocos, tudo como texto; so campo vazio vira nulo.
+
+    :param path: Caminho do CSV.
+    :param sep: Separador.
+    :return: Iterador de DataFrames.
+    """
+    yield from pd.read_csv(
+        path,
+        sep=sep,
+        dtype=str,
+        encoding=CSV_ENCODING,
+        keep_default_na=False,
+        na_values=[""],
+        chunksize=COPY_CHUNK_ROWS,
+    )
+
+
+def _positional(df: "pd.DataFrame", columns: List[str], path: Path) -> "pd.DataFrame":
+    """
+    Renomeia as colunas pela posicao, como o \\copy do import.sql.
+
+    :param df: Bloco lido.
+    :param columns: Colunas da tabela, na ordem do arquivo.
+    :param path: Caminho do CSV (para a mensagem de erro).
+    :return: Bloco com as colunas da tabela.
+    """
+    if len(df.columns) != len(columns):
+        raise ValueError(
+            f"{path.name}: esperadas {len(columns)} colunas, "
+            f"encontradas {len(df.columns)}."
+        )
+    df.columns = columns
+    return df
+
+
+def _distinct(
+    series: "pd.Series", func: Callable[["pd.Series"], "pd.Series"], null: object
+) -> "pd.Series":
+    """
+    Aplica uma operacao de texto uma vez por valor distinto e espalha o
+    resultado (CNPJ, razao social, ano e trimestre se repetem muito).
+
+    :param series: Coluna de texto.
+    :param func: Operacao vetorizada sobre os valores distintos.
+    :param null: Resultado para as linhas nulas.
+    :return: Coluna com o resultado de cada linha.
+    """
+    codes, uniques = pd.factorize(series)
+    mapped = func(pd.Series(uniques, dtype=object)).to_numpy(dtype=object)
+    return pd.Series(np.append(mapped, null)[codes], index=series.index)
+
+
+def _trim(series: "pd.Series") -> "pd.Series":
+    """
+    Equivalente a NULLIF(trim(x), '') (trim do Postgres remove so espacos).
+
+    :param series: Coluna de texto.
+    :return: Coluna sem espacos nas pontas e com nulo no lugar de vazio.
+    """
+
+    def _strip(values: "pd.Series") -> "pd.Series":
+        trimmed = values.str.strip(" ")
+        return trimmed.mask(trimmed == "")
+
+    return _distinct(series, _strip, None)
+
+
+def _digits(series: "pd.Series") -> "pd.Series":
+    """
+    Equivalente a regexp_replace(x, '[^0-9]', '', 'g').
+
+    :param series: Coluna de texto.
+    :return: Coluna so com digitos (nulos preservados).
+    """
+    return _distinct(
+        series, lambda values: values.str.replace(r"[^0-9]", "", regex=True), None
+    )
+
+
+def _matches(series: "pd.Series", pattern: str) -> "pd.Series":
+    """
+    Equivalente a x ~ '^pattern$', com nulo contando como falso.
+
+    :param series: Coluna de texto.
+    :param pattern: Expressao regular (ancorada na coluna inteira).
+    :return: Mascara booleana.
+    """
+    return _distinct(
+        series, lambda values: values.str.fullmatch(pattern, na=False), False
+    ).astype(bool)
+
+
+def _money_text(series: "pd.Series") -> Tuple["pd.Series", "pd.Series"]:
+    """
+    Converte uma coluna monetaria do CSV para o texto do numeric(18,5).
+
+    Valores sem virgula ja estao no formato do numeric (que arredonda como o
+    parse_money) e seguem como vieram; so os com virgula sao reescritos.
+
+    :param series: Coluna de texto.
+    :return: Tupla (texto, valor em 1/MONEY_SCALE ou nulo se o texto nao
+        casar com [0-9.,-]+).
+    """
+    text = series.fillna("").to_numpy(dtype=str)
+    if not len(text):
+        return series, parse_money(series)
+    codes = text.view(np.uint32).reshape(len(text), -1)
+    allowed = (codes == 0) | np.isin(codes, MONEY_CHARS)
+    valid = allowed.all(axis=1) & (codes[:, 0] != 0)
+    comma = valid & (codes == _COMMA).any(axis=1)
+
+    money = parse_money(series.where(valid))
+    out = series.to_numpy(dtype=object)
+    out[comma] = format_money(money[comma].to_numpy(np.int64))
+    return pd.Series(out, index=series.index), money
+
+
+def _cadop_date(series: "pd.Series") -> "pd.Series":
+    """
+    Converte Data_Registro_ANS (AAAA-MM-DD ou DD/MM/AAAA) para data.
+
+    :param series: Coluna de texto.
+    :return: Coluna datetime (NaT fora dos dois formatos).
+    """
+    iso = pd.to_datetime(
+        series.where(_matches(series, r"[0-9]{4}-[0-9]{2}-[0-9]{2}")),
+        format="%Y-%m-%d",
+        errors="coerce",
+    )
+    br = pd.to_datetime(
+        series.where(_matches(series, r"[0-9]{2}/[0-9]{2}/[0-9]{4}")),
+        format="%d/%m/%Y",
+        errors="coerce",
+    )
+    return iso.fillna(br)
+
+
+def cadop_frames(path: Path) -> Iterator["pd.DataFrame"]:
+    """
+    Limpa e deduplica o CADOP (registro mais recente por CNPJ).
+
+    :param path: Relatorio_cadop.csv.
+    :return: Iterador com um unico bloco tipado.
+    """
+    raw = pd.concat(
+        [_positional(df, CADOP_COLUMNS, path) for df in _read_text(path, sep=";")],
+        ignore_index=True,
+    )
+    cadop = pd.DataFrame(index=raw.index)
+    for col in CADOP_COLUMNS:
+        if col in DIGIT_COLUMNS or col == "cnpj":
+            cadop[col] = _digits(raw[col])
+        elif col == "data_registro_ans":
+            cadop[col] = _cadop_date(raw[col])
+        else:
+            cadop[col] = _trim(raw[col])
+    cadop["uf"] = cadop["uf"].str.upper()
+
+    keep = _matches(cadop["cnpj"], r"[0-9]{14}") & cadop["razao_social"].notna()
+    cadop = (
+        cadop[keep]
+        .sort_values("data_registro_ans", ascending=False, na_position="last")
+        .drop_duplicates(subset=["cnpj"], keep="first")
+    )
+    cadop["data_registro_ans"] = cadop["data_registro_ans"].dt.strftime("%Y-%m-%d")
+    yield cadop
+
+
+def consolidado_frames(path: Path) -> Iterator["pd.DataFrame"]:
+    """
+    Converte o consolidado em blocos tipados, so com as linhas aceitas.
+
+    :param path: consolidado_despesas.csv.
+    :return: Iterador de blocos.
+    """
+    for raw in _read_text(path):
+        raw = _positional(raw, CONSOLIDADO_COLUMNS, path)
+        valor, money = _money_text(raw["valor_despesas"])
+        df = pd.DataFrame(
+            {
+                "cnpj": _digits(raw["cnpj"]),
+                "razao_social": _trim(raw["razao_social"]),
+                "trimestre": raw["trimestre"],
+                "ano": raw["ano"],
+                "valor_despesas": valor,
+            }
+        )
+        keep = (
+            _matches(df["cnpj"], r"[0-9]{14}")
+            & df["razao_social"].notna()
+            & _matches(df["trimestre"], r"[1-4]")
+            & _matches(df["ano"], r"[0-9]{4}")
+            & money.gt(0).fillna(False)
+        )
+        yield df[keep]
+
+
+def agregado_frames(path: Path) -> Iterator["pd.DataFrame"]:
+    """
+    Converte o agregado em blocos tipados, so com as linhas aceitas.
+
+    :param path: despesas_agregadas.csv.
+    :return: Iterador de blocos.
+    """
+    for raw in _read_text(path):
+        raw = _positional(raw, AGREGADO_COLUMNS, path)
+        df = pd.DataFrame(
+            {
+                "razao_social": _trim(raw["razao_social"]),
+                "uf": _trim(raw["uf"]).str.upper(),
+            }
+        )
+        keep = df["razao_social"].notna() & (df["uf"].str.len() == 2)
+        for col in AGREGADO_COLUMNS[2:]:
+            df[col], money = _money_text(raw[col])
+            floor = 0 if col == "desvio_padrao_despesas" else 1
+            keep &= money.ge(floor).fillna(False)
+        yield df[keep]
+
+
+def default_loads(output_dir: Path) -> List[TableLoad]:
+    """
+    Cargas das tres tabelas a partir dos CSVs de entrega (mesmas regras do
+    sql/import.sql).
+
+    :param output_dir: Diretorio dos CSVs de saida.
+    :return: Cargas, CADOP primeiro.
+    """
+    return [
+        TableLoad(
+            table="ans.operadoras_cadop",
+            source=output_dir / "Relatorio_cadop.csv",
+            columns=CADOP_COLUMNS,
+            key=("cnpj",),
+            frames=cadop_frames,
+            update_where=(
+                "EXCLUDED.data_registro_ans IS NOT NULL AND ("
+                "ans.operadoras_cadop.data_registro_ans IS NULL OR "
+                "EXCLUDED.data_registro_ans >= ans.operadoras_cadop.data_registro_ans)"
+            ),
+        ),
+        TableLoad(
+            table="ans.despesas_consolidadas",
+            source=output_dir / "consolidado_despesas.csv",
+            columns=CONSOLIDADO_COLUMNS,
+            key=("cnpj", "ano", "trimestre"),
+            frames=consolidado_frames,
+            reload_function="ans.recarregar_consolidadas",
+            after="ans.operadoras_cadop",
+        ),
+        TableLoad(
+            table="ans.despesas_agregadas",
+            source=output_dir / "despesas_agregadas.csv",
+            columns=AGREGADO_COLUMNS,
+            key=("razao_social", "uf"),
+            frames=agregado_frames,
+        ),
+    ]
+
+
+def _csv_blocks(load: TableLoad, counter: LoadResult) -> Iterator[bytes]:
+    """
+    Gera o CSV do COPY bloco a bloco, contando as linhas enviadas.
+
+    :param load: Carga da tabela.
+    :param counter: Resultado atualizado com as linhas copiadas.
+    :return: Iterador de blocos em UTF-8.
+    """
+    for df in load.frames(load.source):
+        counter.copied += len(df)
+        text = df[load.columns].to_csv(index=False, header=False, na_rep=NULL_MARK)
+        yield text.encode("utf-8")
+
+
+def _merge_sql(load: TableLoad, staging: str) -> str:
+    """
+    Monta a gravacao a partir da tabela temporaria: a funcao de recarga ou o
+    INSERT ... ON CONFLICT.
+
+    :param load: Carga da tabela.
+    :param staging: Nome da tabela temporaria.
+    :return: SQL da gravacao.
+    """
+    if load.reload_function:
+        return f"SELECT {load.reload_function}('{staging}'::regclass)"
+    columns = ", ".join(load.columns)
+    updates = ", ".join(
+        f"{col} = EXCLUDED.{col}" for col in load.columns if col not in load.key
+    )
+    sql = (
+        f"INSERT INTO {load.table} ({columns}) SELECT {columns} FROM {staging} "
+        f"ON CONFLICT ({', '.join(load.key)}) DO UPDATE SET {updates}"
+    )
+    return f"{sql} WHERE {load.update_where}" if load.update_where else sql
+
+
+def _load_table(db: "Database", load: TableLoad, after: Optional[Future]) -> LoadResult:
+    """
+    Copia uma tabela para uma temporaria tipada e grava na definitiva.
+
+    :param db: Banco (uma conexao do pool por tabela).
+    :param load: Carga da tabela.
+    :param after: Carga que precisa terminar antes da gravacao (ou None).
+    :return: Resultado da carga.
+    """
+    result = LoadResult(table=load.table)
+    staging = "stg_" + load.table.split(".")[-1]
+    with db.connection() as conn:
+        try:
+            with conn.cursor() as cur:
+                started = time.perf_counter()
+                cur.execute(
+                    f"CREATE TEMP TABLE {staging} "
+                    f"(LIKE {load.table} INCLUDING DEFAULTS) ON COMMIT DROP"
+                )
+                cur.copy_expert(
+                    f"COPY {staging} ({', '.join(load.columns)}) FROM STDIN "
+                    f"WITH (FORMAT csv, NULL '{NULL_MARK}', ENCODING 'UTF8')",
+                    _CopyStream(_csv_blocks(load, result)),
+                    size=COPY_READ_SIZE,
+                )
+                result.copy_seconds = time.perf_counter() - started
+                if after is not None:
+                    after.result()
+                started = time.perf_counter()
+                cur.execute(_merge_sql(load, staging))
+                if load.reload_function:
+                    result.written = cur.fetchone()[0]
+                else:
+                    result.written = cur.rowcount
+            conn.commit()
+            result.merge_seconds = time.perf_counter() - started
+        except BaseException:
+            conn.rollback()
+            raise
+    return result
+
+
+def load_tables(db: "Database", loads: List[TableLoad]) -> Dict[str, LoadResult]:
+    """
+    Carrega as tabelas em paralelo, uma conexao por tabela.
+
+    O COPY de todas comeca junto; a gravacao de uma tabela com `after` espera
+    o commit da tabela referenciada. Cada tabela e uma transacao.
+
+    :param db: Banco com pool de conexoes (maxconn >= numero de tabelas).
+    :param loads: Cargas em ordem de dependencia.
+    :return: Resultado por tabela.
+    """
+    futures: Dict[str, Future] = {}
+    with ThreadPoolExecutor(max_workers=len(loads) or 1) as pool:
+        for load in loads:
+            after = futures[load.after] if load.after else None
+            futures[load.table] = pool.submit(_load_table, db, load, after)
+    return {table: future.result() for table, future in futures.items()}
+
+
+def refresh_summaries(db: "Database") -> None:
+    """
+    Atualiza os resumos materializados (REFRESH CONCURRENTLY: leitores seguem
+    vendo a versao anterior ate o fim).
+
+    :param db: Banco com pool de conexoes.
+    :return: None.
+    """
+    db.execute(REFRESH_SUMMARIES_SQL)
+
+
+def load_outputs(output_dir: Path, db: Optional["Database"] = None) -> List[LoadResult]:
+    """
+    Carrega CADOP, consolidado e agregado no Postgres via COPY FROM STDIN.
+
+    Substitui o sql/import.sql: as linhas chegam ja limpas e tipadas, entao o
+    banco so converte texto canonico (sem regex por coluna). Depois das tres
+    tabelas, atualiza os resumos materializados.
+
+    :param output_dir: Diretorio dos CSVs de saida.
+    :param db: Banco (None abre um pool com as configuracoes do .env).
+    :return: Resultados, na ordem das tabelas.
+    """
+    own = db is None
+    if own:
+        # So a carga precisa do .env: a conversao dos blocos roda sem ele.
+        from api.config import Settings
+        from api.db import Database
+
+        db = Database(Settings())
+    try:
+        results = list(load_tables(db, default_loads(output_dir)).values())
+        refresh_summaries(db)
+        return results
+    finally:
+        if own:
+            db.close()
@@ -0,0 +1,293 @@
+import hashlib
+import json
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from etl.pipeline_metrics import StageMetrics, files_size, measure_stage
+from etl.process.partial_cache import source_digest
+
+STATE_NAME = "stages.json"
+
+
+@dataclass(frozen=True)
+class Stage:
+    """
+    Etapa da pipeline: funcao, dependencias e arquivos de saida declarados.
+
+    A funcao recebe os resultados das etapas ja executadas. Etapas com
+    `always` (downloads, que dependem do estado remoto) sempre executam; as
+    demais sao puladas quando as entradas, a configuracao (`config`, ex.:
+    engine e quantidade de trimestres) e as saidas nao mudaram.
+    """
+
+    name: str
+    run: Callable[[Dict[str, object]], object]
+    deps: Tuple[str, ...] = ()
+    outputs: Tuple[Path, ...] = ()
+    always: bool = False
+    config: Dict[str, object] = field(default_factory=dict)
+
+
+def _by_name(stages: Iterable[Stage]) -> Dict[str, Stage]:
+    """
+    Indexa as etapas por nome, validando dependencias e ciclos.
+
+    :param stages: Etapas declaradas (em ordem topologica).
+    :return: Mapa nome -> etapa.
+    """
+    by_name: Dict[str, Stage] = {}
+    for stage in stages:
+        if stage.name in by_name:
+            raise ValueError(f"Etapa duplicada: {stage.name}")
+        for dep in stage.deps:
+            if dep not in by_name:
+                raise ValueError(
+                    f"Etapa {stage.name} depende de {dep}, que precisa vir antes."
+                )
+        by_name[stage.name] = stage
+    return by_name
+
+
+def select_stages(
+    stages: List[Stage],
+    only: Optional[Iterable[str]] = None,
+    start: Optional[str] = None,
+) -> List[str]:
+    """
+    Resolve a selecao de etapas (--only / --from).
+
+    :param stages: Etapas declaradas.
+    :param only: Nomes das etapas a executar (somente elas).
+    :param start: Etapa inicial; executa ela e todas as que dependem dela.
+    :return: Nomes selecionados, na ordem declarada.
+    """
+    by_name = _by_name(stages)
+    only = list(only or [])
+    if only and start:
+        raise ValueError("Use --only ou --from, nao os dois.")
+    for name in only + ([start] if start else []):
+        if name not in by_name:
+            raise ValueError(
+                f"Etapa desconhecida: {name} (disponiveis: {', '.join(by_name)})"
+            )
+    if only:
+        return [stage.name for stage in stages if stage.name in only]
+    if not start:
+        return [stage.name for stage in stages]
+    selected = {start}
+    for stage in stages:
+        if any(dep in selected for dep in stage.deps):
+            selected.add(stage.name)
+    return [stage.name for stage in stages if stage.name in selected]
+
+
+def _load_state(state_dir: Path) -> Dict[str, Dict[str, str]]:
+    """
+    Le as impressoes digitais da ultima execucao, vazio se ausente.
+
+    :param state_dir: Diretorio do estado.
+    :return: Mapa etapa -> {"inputs", "outputs"}.
+    """
+    path = state_dir / STATE_NAME
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(state_dir: Path, state: Dict[str, Dict[str, str]]) -> None:
+    """
+    Grava as impressoes digitais de forma atomica.
+
+    :param state_dir: Diretorio do estado.
+    :param state: Mapa etapa -> {"inputs", "outputs"}.
+    :return: None.
+    """
+    state_dir.mkdir(parents=True, exist_ok=True)
+    tmp = state_dir / (STATE_NAME + ".tmp")
+    tmp.write_text(json.dumps(state, indent=2, sort_keys=True), encoding="utf-8")
+    tmp.replace(state_dir / STATE_NAME)
+
+
+def _hash(value: object) -> str:
+    """
+    Calcula o SHA-256 da representacao JSON de um valor.
+
+    :param value: Valor serializavel (Path vira texto).
+    :return: Hash hexadecimal.
+    """
+    text = json.dumps(value, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _files_token(paths: Iterable[Path], state_dir: Path) -> str:
+    """
+    Impressao digital de arquivos pelo conteudo (hash reaproveitado por mtime).
+
+    :param paths: Arquivos.
+    :param state_dir: Diretorio do estado (indice de hashes).
+    :return: Hash hexadecimal ("" se algum arquivo nao existir).
+    """
+    parts = []
+    for path in paths:
+        if not path.exists():
+            return ""
+        parts.append([str(path), source_digest(path, state_dir)])
+    return _hash(parts)
+
+
+def _stage_files(stage: Stage, result: object) -> List[Path]:
+    """
+    Arquivos produzidos por uma etapa: os declarados ou, sem eles, os
+    retornados pela funcao.
+
+    :param stage: Etapa.
+    :param result: Resultado da execucao.
+    :return: Lista de arquivos (vazia se a etapa nao produz arquivos).
+    """
+    if stage.outputs:
+        return list(stage.outputs)
+    if isinstance(result, list) and all(isinstance(p, Path) for p in result):
+        return result
+    return []
+
+
+def _run_stage(
+    stage: Stage,
+    results: Dict[str, object],
+    input_token: str,
+    input_files: List[Path],
+    previous: Optional[Dict[str, str]],
+    force: bool,
+    state_dir: Path,
+    logger: logging.Logger,
+    metrics_out: Optional[List[StageMetrics]],
+) -> Tuple[object, str, List[Path]]:
+    """
+    Executa uma etapa ou a pula se entradas e saidas nao mudaram.
+
+    :param stage: Etapa.
+    :param results: Resultados das etapas anteriores.
+    :param input_token: Impressao digital das entradas e da configuracao.
+    :param input_files: Arquivos produzidos pelas dependencias.
+    :param previous: Estado gravado na ultima execucao da etapa.
+    :param force: Se True, nunca pula.
+    :param state_dir: Diretorio do estado.
+    :param logger: Logger da pipeline.
+    :param metrics_out: Lista que recebe as metricas da etapa (opcional).
+    :return: Tupla (resultado, impressao das saidas, arquivos produzidos).
+    """
+    metrics = None
+    try:
+        with measure_stage(stage.name) as metrics:
+            if not stage.always and not force and previous:
+                current = _files_token(stage.outputs, state_dir)
+                if (
+                    previous.get("inputs") == input_token
+                    and current
+                    and current == previous.get("outputs")
+                ):
+                    logger.info("Etapa %s inalterada, pulada", stage.name)
+                    metrics.status = "pulada"
+                    return None, current, list(stage.outputs)
+            logger.info("Etapa %s iniciada", stage.name)
+            metrics.bytes_read = files_size(input_files)
+            result = stage.run(results)
+            files = _stage_files(stage, result)
+            metrics.bytes_written = files_size(files)
+        token = _files_token(files, state_dir) if files else _hash(result)
+        return result, token, files
+    finally:
+        if metrics is not None and metrics_out is not None:
+            metrics_out.append(metrics)
+
+
+def run_stages(
+    stages: List[Stage],
+    selected: List[str],
+    state_dir: Path,
+    logger: logging.Logger,
+    workers: int = 4,
+    force: bool = False,
+    metrics: Optional[List[StageMetrics]] = None,
+) -> Dict[str, object]:
+    """
+    Executa as etapas selecionadas, em paralelo quando independentes.
+
+    Cada etapa comeca assim que todas as suas dependencias terminam. Uma
+    dependencia fora da selecao precisa ter as saidas declaradas em disco
+    (de uma execucao anterior).
+
+    :param stages: Etapas declaradas.
+    :param selected: Nomes a executar (ver select_stages).
+    :param state_dir: Diretorio do estado das impressoes digitais.
+    :param logger: Logger da pipeline.
+    :param workers: Etapas simultaneas.
+    :param force: Se True, executa mesmo as etapas inalteradas.
+    :param metrics: Lista que recebe as metricas de cada etapa, na ordem em
+        que terminam (inclusive a que falhar).
+    :return: Mapa etapa -> resultado (None para as puladas).
+    """
+    by_name = _by_name(stages)
+    state = _load_state(state_dir)
+    results: Dict[str, object] = {}
+    tokens: Dict[str, str] = {}
+    files: Dict[str, List[Path]] = {}
+
+    for name in selected:
+        for dep in by_name[name].deps:
+            if dep in selected or dep in tokens:
+                continue
+            token = _files_token(by_name[dep].outputs, state_dir)
+            if not by_name[dep].outputs or not token:
+                raise RuntimeError(
+                    f"Etapa {name} depende de {dep}, que nao foi selecionada "
+                    "e nao tem saidas gravadas."
+                )
+            tokens[dep] = token
+            files[dep] = list(by_name[dep].outputs)
+
+    pending = list(selected)
+    running: Dict = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while pending or running:
+            for name in list(pending):
+                stage = by_name[name]
+                if not all(dep in tokens for dep in stage.deps):
+                    continue
+                pending.remove(name)
+                input_token = _hash(
+                    {
+                        "deps": [[dep, tokens[dep]] for dep in stage.deps],
+                        "config": stage.config,
+                    }
+                )
+                future = executor.submit(
+                    _run_stage,
+                    stage,
+                    dict(results),
+                    input_token,
+                    [path for dep in stage.deps for path in files[dep]],
+                    state.get(name),
+                    force,
+                    state_dir,
+                    logger,
+                    metrics,
+                )
+                running[future] = (name, input_token)
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, input_token = running.pop(future)
+                result, output_token, files[name] = future.result()
+                results[name] = result
+                tokens[name] = output_token
+                if not by_name[name].always:
+                    state[name] = {"inputs": input_token, "outputs": output_token}
+                    _save_state(state_dir, state)
+    return results
@@ -0,0 +1,230 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+METRIC_PREFIX = "ans_pipeline"
+
+_CURRENT = threading.local()
+_OPEN: List["StageMetrics"] = []
+_OPEN_LOCK = threading.Lock()
+
+
+@dataclass
+class StageMetrics:
+    """
+    Metricas de uma execucao de etapa.
+
+    O tempo de CPU e o do processo inteiro (todas as threads, inclusive os
+    pools da etapa, e os filhos encerrados) durante a janela da etapa. Com
+    etapas simultaneas as janelas se sobrepoem e a CPU nao e separavel por
+    etapa: concurrent_stages registra quantas chegaram a rodar juntas. O pico
+    de RSS e o do processo (e filhos) desde o inicio, lido ao fim da etapa.
+    """
+
+    name: str
+    status: str = "executada"
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    rows_in: Optional[int] = None
+    rows_out: Optional[int] = None
+    bytes_read: int = 0
+    bytes_written: int = 0
+    process_peak_rss_mb: Optional[float] = None
+    concurrent_stages: int = 1
+    extra: Dict[str, float] = field(default_factory=dict)
+
+
+def _cpu_seconds() -> float:
+    """
+    Tempo de CPU do processo (todas as threads) mais o dos filhos encerrados.
+
+    :return: Segundos de CPU.
+    """
+    times = os.times()
+    return time.process_time() + times.children_user + times.children_system
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """
+    Pico de memoria residente do processo e dos filhos, se disponivel.
+
+    :return: Pico em MB ou None (sem o modulo resource).
+    """
+    if resource is None:
+        return None
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # ru_maxrss vem em KB no Linux e em bytes no macOS.
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(peak / divisor, 1)
+
+
+def files_size(paths: Iterable[Path]) -> int:
+    """
+    Soma o tamanho dos arquivos existentes.
+
+    :param paths: Arquivos.
+    :return: Total em bytes.
+    """
+    return sum(path.stat().st_size for path in paths if path.is_file())
+
+
+def record_rows(
+    rows_in: Optional[int] = None, rows_out: Optional[int] = None, **extra: float
+) -> None:
+    """
+    Registra contagens de linhas da etapa em execucao na thread atual.
+
+    Fora de uma etapa medida, nao faz nada.
+
+    :param rows_in: Linhas lidas.
+    :param rows_out: Linhas produzidas.
+    :param extra: Outras contagens e tempos (ex.: inconsistencias).
+    :return: None.
+    """
+    metrics = getattr(_CURRENT, "metrics", None)
+    if metrics is None:
+        return
+    if rows_in is not None:
+        metrics.rows_in = rows_in
+    if rows_out is not None:
+        metrics.rows_out = rows_out
+    metrics.extra.update(extra)
+
+
+@contextmanager
+def measure_stage(name: str) -> Iterator[StageMetrics]:
+    """
+    Mede tempo, CPU e memoria de uma etapa na thread atual.
+
+    Enquanto o contexto esta aberto, record_rows preenche estas metricas e
+    as etapas abertas ao mesmo tempo atualizam concurrent_stages.
+    Se a etapa levantar excecao, o status fica como "falhou".
+
+    :param name: Nome da etapa.
+    :return: Metricas em preenchimento.
+    """
+    metrics = StageMetrics(name=name)
+    _CURRENT.metrics = metrics
+    with _OPEN_LOCK:
+        _OPEN.append(metrics)
+        for other in _OPEN:
+            other.concurrent_stages = max(other.concurrent_stages, len(_OPEN))
+    wall = time.perf_counter()
+    cpu = _cpu_seconds()
+    try:
+        yield metrics
+    except BaseException:
+        metrics.status = "falhou"
+        raise
+    finally:
+        _CURRENT.metrics = None
+        with _OPEN_LOCK:
+            _OPEN[:] = [other for other in _OPEN if other is not metrics]
+        metrics.wall_seconds = round(time.perf_counter() - wall, 3)
+        metrics.cpu_seconds = round(_cpu_seconds() - cpu, 3)
+        metrics.process_peak_rss_mb = _peak_rss_mb()
+
+
+def write_metrics_json(
+    path: Path, stages: List[StageMetrics], summary: Dict[str, object]
+) -> Path:
+    """
+    Grava as metricas da execucao em JSON.
+
+    :param path: Arquivo de destino.
+    :param stages: Metricas por etapa.
+    :param summary: Dados gerais da execucao (status, modo, horarios...).
+    :return: Caminho gravado.
+    """
+    payload = dict(summary, stages=[asdict(stage) for stage in stages])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(payload, indent=2, ensure_ascii=False), encoding="utf-8")
+    return path
+
+
+def _prom_line(metric: str, value: object, stage: Optional[str] = None) -> str:
+    """
+    Formata uma amostra no formato texto do Prometheus.
+
+    :param metric: Nome da metrica (sem prefixo).
+    :param value: Valor numerico (int ou float).
+    :param stage: Rotulo da etapa (opcional).
+    :return: Linha formatada.
+    """
+    labels = f'{{stage="{stage}"}}' if stage else ""
+    return f"{METRIC_PREFIX}_{metric}{labels} {value}"
+
+
+def write_prometheus_textfile(
+    path: Path, stages: List[StageMetrics], success: bool, finished_at: float
+) -> Path:
+    """
+    Grava as metricas no formato do textfile collector do node_exporter.
+
+    A escrita e atomica (arquivo temporario + replace), como o collector exige.
+
+    :param path: Arquivo .prom de destino.
+    :param stages: Metricas por etapa.
+    :param success: Se a execucao terminou sem erro.
+    :param finished_at: Fim da execucao (epoch).
+    :return: Caminho gravado.
+    """
+    gauges = {
+        "stage_wall_seconds": ("Tempo de parede da etapa.", "wall_seconds"),
+        "stage_cpu_seconds": (
+            "CPU do processo durante a etapa (sobreposta entre etapas simultaneas).",
+            "cpu_seconds",
+        ),
+        "stage_concurrent_stages": (
+            "Maximo de etapas rodando junto com a etapa.",
+            "concurrent_stages",
+        ),
+        "stage_rows_in": ("Linhas lidas pela etapa.", "rows_in"),
+        "stage_rows_out": ("Linhas produzidas pela etapa.", "rows_out"),
+        "stage_bytes_read": ("Bytes lidos pela etapa.", "bytes_read"),
+        "stage_bytes_written": ("Bytes gravados pela etapa.", "bytes_written"),
+        "stage_skipped": ("1 se a etapa foi pulada por estar inalterada.", None),
+    }
+    lines = []
+    for metric, (help_text, attr) in gauges.items():
+        lines.append(f"# HELP {METRIC_PREFIX}_{metric} {help_text}")
+        lines.append(f"# TYPE {METRIC_PREFIX}_{metric} gauge")
+        for stage in stages:
+            value = getattr(stage, attr) if attr else int(stage.status == "pulada")
+            if value is not None:
+                lines.append(_prom_line(metric, value, stage.name))
+    peaks = [s.process_peak_rss_mb for s in stages if s.process_peak_rss_mb]
+    for metric, help_text, value in (
+        ("success", "1 se a ultima execucao terminou sem erro.", int(success)),
+        ("last_run_timestamp_seconds", "Fim da ultima execucao.", finished_at),
+        (
+            "process_peak_rss_mb",
+            "Pico de RSS do processo na execucao (MB).",
+            max(peaks, default=None),
+        ),
+    ):
+        if value is None:
+            continue
+        lines.append(f"# HELP {METRIC_PREFIX}_{metric} {help_text}")
+        lines.append(f"# TYPE {METRIC_PREFIX}_{metric} gauge")
+        lines.append(_prom_line(metric, value))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    tmp.replace(path)
+    return path
@@ -1,86 +1,594 @@
+import gzip
+import json
 from pathlib import Path
+from typing import (
+    Callable,
+    Collection,
+    Dict,
+    Iterable,
+    Iterator,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
+import numpy as np
 import pandas as pd
 
+try:
+    from etl.process.duckdb_engine import check_engine, scan_aggregate_rows
+    from etl.process.frame_io import iter_frames, quarter_mask, read_quarters
+    from etl.process.money import MONEY_SCALE, format_money, money_mean, to_money
+except ModuleNotFoundError:
+    from duckdb_engine import check_engine, scan_aggregate_rows
+    from frame_io import iter_frames, quarter_mask, read_quarters
+    from money import MONEY_SCALE, format_money, money_mean, to_money
+
 
 INPUT_FILE = Path("data/output/consolidado_enriquecido.csv")
 OUTPUT_DIR = Path("data/output")
 OUTPUT_FILE = OUTPUT_DIR / "despesas_agregadas.csv"
+GROUP_KEYS = ["RazaoSocial", "UF"]
+VALUE_COLUMNS = ["TotalDespesas", "MediaDespesas", "DesvioPadraoDespesas"]
+QUARTER_KEYS = ["Ano", "Trimestre"]
+# Chaves do estado incremental: momentos por trimestre e por RazaoSocial/UF.
+STATE_KEYS = QUARTER_KEYS + GROUP_KEYS
+# total em inteiros de 1/MONEY_SCALE (exato); m2 em reais ao quadrado.
+MOMENT_COLUMNS = ["n", "total", "m2"]
+# Incrementar quando o formato dos momentos mudar.
+STATE_VERSION = 3
+
+# (Ano, Trimestre) -> impressao digital das linhas do trimestre na entrada.
+Fingerprints = Dict[Tuple[int, int], str]
+# Recebe os trimestres a ler (None = todos) e devolve (momentos, linhas lidas).
+MomentReader = Callable[
+    [Optional[Collection[Tuple[int, int]]]], Tuple[Optional["pd.DataFrame"], int]
+]
+
+
+def _clean_key(series: "pd.Series") -> "pd.Series":
+    """
+    Equivale a fillna("").astype(str).str.strip(), mas so nos valores unicos.
+
+    :param series: Coluna de chave (poucas operadoras e UFs, muitas linhas).
+    :return: Serie de texto sem espacos nas pontas ("" para nulos).
+    """
+    codes, uniques = pd.factorize(series)
+    cleaned = pd.Index(uniques).astype(str).str.strip().to_numpy(dtype=object)
+    # Nulos tem codigo -1, que aponta para o "" anexado no fim.
+    return pd.Series(np.append(cleaned, "")[codes], index=series.index)
+
+
+def _prepare(enriched_df: "pd.DataFrame") -> "pd.DataFrame":
+    """
+    Normaliza as chaves, descarta linhas sem RazaoSocial/UF e converte valores.
+
+    :param enriched_df: Consolidado enriquecido (ou um bloco dele).
+    :return: DataFrame filtrado com a coluna ValorDespesas_num (ver money.py).
+    """
+    enriched_df = enriched_df.copy()
+    for key in GROUP_KEYS:
+        enriched_df[key] = _clean_key(enriched_df[key])
+
+    enriched_df = enriched_df[
+        (enriched_df["RazaoSocial"] != "") & (enriched_df["UF"] != "")
+    ].copy()
+    enriched_df["ValorDespesas_num"] = to_money(enriched_df["ValorDespesas"])
+    return enriched_df
+
+
+def _scan(
+    source: Union[Path, "pd.DataFrame"],
+    keys: Sequence[str],
+    quarters: Optional[Collection[Tuple[int, int]]] = None,
+) -> Tuple["pd.DataFrame", int]:
+    """
+    Prepara as linhas com o DuckDB (chaves limpas em SQL) e converte os valores.
+
+    :param source: Arquivo (CSV ou Parquet) ou DataFrame ja em memoria.
+    :param keys: Colunas de agrupamento.
+    :param quarters: Trimestres (Ano, Trimestre) a ler; None le todos.
+    :return: Tupla (linhas preparadas, linhas lidas).
+    """
+    prepared, rows_in = scan_aggregate_rows(
+        source, keys, "ValorDespesas", quarters=quarters
+    )
+    prepared["ValorDespesas_num"] = to_money(prepared.pop("ValorDespesas"))
+    return prepared, rows_in
+
+
+def _format(aggregated_df: "pd.DataFrame") -> "pd.DataFrame":
+    """
+    Ordena pelo total e formata os valores com 5 casas.
+
+    Total e media saem exatos dos inteiros; o desvio padrao e float.
+
+    :param aggregated_df: Agregado com total e media em 1/MONEY_SCALE.
+    :return: Agregado pronto para o CSV.
+    """
+    aggregated_df = aggregated_df.sort_values("TotalDespesas", ascending=False)
+    aggregated_df["TotalDespesas"] = format_money(aggregated_df["TotalDespesas"])
+    mean = aggregated_df["MediaDespesas"]
+    aggregated_df["MediaDespesas"] = np.where(
+        mean.notna(), format_money(mean.fillna(0)), "nan"
+    )
+    deviation = aggregated_df["DesvioPadraoDespesas"].to_numpy(dtype=np.float64)
+    aggregated_df["DesvioPadraoDespesas"] = np.char.mod("%.5f", deviation)
+    return aggregated_df
+
+
+def _moments(prepared: "pd.DataFrame", keys: Sequence[str]) -> "pd.DataFrame":
+    """
+    Calcula os momentos das linhas preparadas por chave, em uma passada.
+
+    Guarda contagem, soma inteira (exata em qualquer ordem) e soma dos
+    quadrados dos desvios em relacao a media do grupo (M2), que combinam entre
+    blocos e execucoes.
+
+    :param prepared: Linhas preparadas (ver _prepare).
+    :param keys: Colunas de agrupamento (GROUP_KEYS ou STATE_KEYS).
+    :return: DataFrame indexado pelas chaves com colunas n, total e m2.
+    """
+    values = prepared["ValorDespesas_num"]
+    by = [
+        prepared[key].astype(int) if key in QUARTER_KEYS else prepared[key]
+        for key in keys
+    ]
+    grouped = values.groupby(by)
+    total = grouped.sum()
+    # As chaves de texto sao fatoradas uma vez; o M2 agrupa pelo numero do grupo.
+    group = grouped.ngroup().to_numpy()
+    reais = values.to_numpy(dtype=np.float64, na_value=np.nan) / MONEY_SCALE
+    reais = pd.Series(reais)
+    deviation = reais - reais.groupby(group).transform("mean")
+    moments = pd.DataFrame(
+        {
+            "n": grouped.count().astype(np.int64),
+            "total": total.astype(np.int64),
+            "m2": (deviation * deviation).groupby(group).sum().to_numpy(),
+        },
+        index=total.index,
+    )
+    moments.index.names = list(keys)
+    return moments
+
+
+def chunk_moments(
+    enriched_df: "pd.DataFrame", keys: Sequence[str] = GROUP_KEYS
+) -> "pd.DataFrame":
+    """
+    Calcula os momentos de um bloco do enriquecido.
+
+    :param enriched_df: Bloco do consolidado enriquecido.
+    :param keys: Colunas de agrupamento (GROUP_KEYS ou STATE_KEYS).
+    :return: DataFrame indexado pelas chaves com colunas n, total e m2.
+    """
+    return _moments(_prepare(enriched_df), keys)
+
+
+def _mean(moments: "pd.DataFrame") -> "pd.Series":
+    """
+    Media por chave em reais (float), a partir dos momentos (0 onde nao ha
+    valores); usada so na combinacao do M2.
+
+    :param moments: Momentos por chave.
+    :return: Serie de medias.
+    """
+    count = moments["n"].where(moments["n"] > 0)
+    return (moments["total"] / MONEY_SCALE / count).fillna(0.0)
+
+
+def merge_moments(left: "pd.DataFrame", right: "pd.DataFrame") -> "pd.DataFrame":
+    """
+    Combina momentos de dois blocos.
+
+    O total e inteiro (soma exata) e o M2 usa a formula de Chan, para o
+    resultado bater com o agregado feito de uma vez.
+
+    :param left: Momentos acumulados.
+    :param right: Momentos de um novo bloco.
+    :return: Momentos combinados, ordenados pelas chaves.
+    """
+    left, right = left.align(right, join="outer", fill_value=0)
+    n = left["n"] + right["n"]
+    delta = _mean(right) - _mean(left)
+    weight = (left["n"] * right["n"] / n.where(n > 0)).fillna(0.0)
+    return pd.DataFrame(
+        {
+            "n": n,
+            "total": left["total"] + right["total"],
+            "m2": left["m2"] + right["m2"] + delta * delta * weight,
+        }
+    ).sort_index()
+
+
+def rollup_moments(
+    moments: "pd.DataFrame", keys: Sequence[str] = GROUP_KEYS
+) -> "pd.DataFrame":
+    """
+    Junta os momentos de varias particoes (ex.: trimestres) por chave.
+
+    Todas as particoes de uma chave sao combinadas de uma vez: M2 total e a
+    soma dos M2 mais n_i * (media_i - media)^2 de cada particao.
+
+    :param moments: Momentos indexados por chaves que incluem keys.
+    :param keys: Niveis que permanecem.
+    :return: Momentos indexados por keys.
+    """
+    if list(moments.index.names) == list(keys):
+        return moments
+    grouped = moments.groupby(level=list(keys))
+    rolled = pd.DataFrame(
+        {
+            "n": grouped["n"].sum(),
+            "total": grouped["total"].sum(),
+        }
+    )
+    parent = moments.index.droplevel(
+        [name for name in moments.index.names if name not in keys]
+    )
+    deviation = _mean(moments).to_numpy() - _mean(rolled).reindex(parent).to_numpy()
+    spread = moments["n"] * deviation * deviation
+    rolled["m2"] = grouped["m2"].sum() + spread.groupby(level=list(keys)).sum()
+    return rolled
+
+
+def _finish(state: Optional["pd.DataFrame"]) -> "pd.DataFrame":
+    """
+    Converte momentos em total, media e desvio padrao populacional formatados.
 
+    :param state: Momentos por chave (por GROUP_KEYS ou STATE_KEYS) ou None.
+    :return: DataFrame agregado, com os valores ja formatados (5 casas).
+    """
+    if state is None or state.empty:
+        return pd.DataFrame(columns=GROUP_KEYS + VALUE_COLUMNS)
+    state = rollup_moments(state, GROUP_KEYS)
+    count = state["n"].where(state["n"] > 0)
+    mean = money_mean(state["total"], state["n"].clip(lower=1))
+    aggregated_df = pd.DataFrame(
+        {
+            "TotalDespesas": state["total"],
+            "MediaDespesas": pd.Series(mean, index=state.index, dtype="Int64").where(
+                count.notna()
+            ),
+            "DesvioPadraoDespesas": np.sqrt(state["m2"] / count).fillna(0.0),
+        }
+    )
+    aggregated_df.index.names = GROUP_KEYS
+    return _format(aggregated_df.reset_index())
+
+
+def _only_quarters(
+    enriched_df: "pd.DataFrame", quarters: Collection[Tuple[int, int]]
+) -> "pd.DataFrame":
+    """
+    Filtra as linhas dos trimestres informados.
+
+    :param enriched_df: Consolidado enriquecido (ou um bloco dele).
+    :param quarters: Trimestres (Ano, Trimestre) mantidos.
+    :return: DataFrame so com as linhas desses trimestres.
+    """
+    if enriched_df.empty:
+        return enriched_df
+    return enriched_df[quarter_mask(enriched_df, quarters)]
+
+
+def _refresh_state(
+    read: MomentReader,
+    state_file: Optional[Path],
+    quarters: Optional[Fingerprints],
+    keep_quarters: Optional[int],
+) -> Tuple[Optional["pd.DataFrame"], int]:
+    """
+    Calcula os momentos da entrada, reaproveitando o estado por trimestre.
+
+    Com quarters, so os trimestres novos ou com impressao digital diferente da
+    gravada sao lidos; os demais vem do estado. Sem quarters, a entrada
+    inteira e lida. Nos dois casos o estado passa a ter apenas os trimestres
+    da entrada, entao o resultado e o mesmo de agregar a entrada inteira.
+
+    :param read: Le os momentos dos trimestres pedidos (None = todos).
+    :param state_file: Arquivo de estado ou None (sem estado).
+    :param quarters: Todos os trimestres da entrada com a impressao digital
+        das linhas de cada um (ou None).
+    :param keep_quarters: Mantem apenas os N trimestres mais recentes.
+    :return: Tupla (momentos, linhas lidas).
+    """
+    if state_file is None:
+        return read(None)
+    if quarters is None:
+        state, rows_in = read(None)
+        fingerprints: Fingerprints = {}
+    else:
+        if keep_quarters:
+            quarters = dict(sorted(quarters.items())[-keep_quarters:])
+        state, saved = load_state(state_file)
+        stale = sorted(
+            quarter
+            for quarter, digest in quarters.items()
+            if saved.get(quarter) != digest
+        )
+        new, rows_in = read(stale)
+        state = update_state(state, new, quarters, stale)
+        fingerprints = quarters
+    if keep_quarters:
+        state = keep_last_quarters(state, keep_quarters)
+    save_state(state, state_file, fingerprints)
+    return state, rows_in
+
+
+def aggregate_frame(
+    enriched_df: "pd.DataFrame",
+    engine: str = "pandas",
+    state_file: Optional[Path] = None,
+    quarters: Optional[Fingerprints] = None,
+    keep_quarters: Optional[int] = None,
+) -> "pd.DataFrame":
+    """
+    Agrega despesas por RazaoSocial e UF em memoria.
+
+    :param enriched_df: Consolidado enriquecido.
+    :param engine: "pandas" ou "duckdb" (limpeza e conversao em SQL; os
+        momentos sao os mesmos, entao o resultado e identico).
+    :param state_file: Momentos por trimestre de execucoes anteriores (ver
+        aggregate).
+    :param quarters: Trimestres da entrada com a impressao digital de cada
+        um; so os novos ou alterados entram nos momentos calculados.
+    :param keep_quarters: Com state_file, janela dos N trimestres mais recentes.
+    :return: DataFrame agregado, com os valores ja formatados (5 casas).
+    """
+    check_engine(engine)
+    keys = STATE_KEYS if state_file else GROUP_KEYS
+
+    def read(stale: Optional[Collection[Tuple[int, int]]]) -> tuple:
+        """
+        Calcula os momentos das linhas em memoria dos trimestres pedidos.
+
+        :param stale: Trimestres a ler (None = todos).
+        :return: Tupla (momentos, linhas lidas).
+        """
+        if stale is not None and not stale:
+            return None, 0
+        source = enriched_df if stale is None else _only_quarters(enriched_df, stale)
+        if engine == "duckdb":
+            prepared, _ = _scan(source, keys)
+        else:
+            prepared = _prepare(source)
+        return _moments(prepared, keys), len(source)
+
+    state, _ = _refresh_state(read, state_file, quarters, keep_quarters)
+    return _finish(state)
+
+
+def merge_chunks(
+    chunks: Iterable["pd.DataFrame"], keys: Sequence[str] = GROUP_KEYS
+) -> Optional["pd.DataFrame"]:
+    """
+    Acumula os momentos de um enriquecido lido em blocos.
+
+    :param chunks: Blocos do consolidado enriquecido.
+    :param keys: Colunas de agrupamento (GROUP_KEYS ou STATE_KEYS).
+    :return: Momentos combinados ou None se nao houver linhas.
+    """
+    state = None
+    for chunk in chunks:
+        moments = chunk_moments(chunk, keys)
+        if moments.empty:
+            continue
+        state = moments if state is None else merge_moments(state, moments)
+    return state
+
+
+def aggregate_chunks(
+    chunks: Iterable["pd.DataFrame"],
+    state_file: Optional[Path] = None,
+    quarters: Optional[Fingerprints] = None,
+    keep_quarters: Optional[int] = None,
+) -> "pd.DataFrame":
+    """
+    Agrega um enriquecido em blocos, mantendo apenas os momentos por chave.
+
+    Os blocos sao sempre consumidos ate o fim (quem os produz pode gravar
+    saidas), mesmo quando nenhum trimestre precisa ser recalculado.
+
+    :param chunks: Blocos do consolidado enriquecido.
+    :param state_file: Momentos por trimestre de execucoes anteriores (ver
+        aggregate).
+    :param quarters: Trimestres da entrada com a impressao digital de cada um.
+    :param keep_quarters: Com state_file, janela dos N trimestres mais recentes.
+    :return: DataFrame agregado, com os valores ja formatados (5 casas).
+    """
+    keys = STATE_KEYS if state_file else GROUP_KEYS
+
+    def read(stale: Optional[Collection[Tuple[int, int]]]) -> tuple:
+        """
+        Consome os blocos e acumula os momentos dos trimestres pedidos.
+
+        :param stale: Trimestres a ler (None = todos).
+        :return: Tupla (momentos, linhas lidas).
+        """
+        selected = chunks
+        if stale is not None:
+            selected = (_only_quarters(chunk, stale) for chunk in chunks)
+        counter = [0]
+        return merge_chunks(_count_rows(selected, counter), keys), counter[0]
+
+    state, _ = _refresh_state(read, state_file, quarters, keep_quarters)
+    return _finish(state)
+
+
+def load_state(path: Path) -> Tuple[Optional["pd.DataFrame"], Fingerprints]:
+    """
+    Carrega os momentos por trimestre gravados por save_state.
+
+    Um estado ausente ou de outra versao e ignorado: os trimestres sem
+    impressao digital gravada sao relidos da entrada.
+
+    :param path: Arquivo de estado (.json.gz).
+    :return: Tupla (momentos indexados por STATE_KEYS ou None, impressoes
+        digitais por trimestre).
+    """
+    if not path.exists():
+        return None, {}
+    with gzip.open(path, "rt", encoding="utf-8") as handle:
+        payload = json.load(handle)
+    if payload.get("version") != STATE_VERSION:
+        return None, {}
+    state = pd.DataFrame(payload["rows"], columns=STATE_KEYS + MOMENT_COLUMNS)
+    fingerprints = {(ano, tri): digest for ano, tri, digest in payload["quarters"]}
+    return state.set_index(STATE_KEYS).sort_index(), fingerprints
+
+
+def save_state(
+    state: Optional["pd.DataFrame"],
+    path: Path,
+    fingerprints: Optional[Fingerprints] = None,
+) -> Path:
+    """
+    Grava os momentos por trimestre de forma atomica (temporario + replace).
+
+    Totais inteiros e floats (pelo repr) voltam do JSON exatamente iguais.
+
+    :param state: Momentos indexados por STATE_KEYS (None grava estado vazio).
+    :param path: Arquivo de estado (.json.gz).
+    :param fingerprints: Impressao digital de cada trimestre do estado.
+    :return: Caminho gravado.
+    """
+    rows = []
+    if state is not None:
+        rows = state.reset_index()[STATE_KEYS + MOMENT_COLUMNS]
+        rows = rows.astype({"Ano": int, "Trimestre": int, "n": int, "total": int})
+        rows = rows.values.tolist()
+    quarters = [
+        [ano, tri, digest]
+        for (ano, tri), digest in sorted((fingerprints or {}).items())
+    ]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with gzip.open(tmp, "wt", encoding="utf-8") as handle:
+        json.dump(
+            {"version": STATE_VERSION, "quarters": quarters, "rows": rows}, handle
+        )
+    tmp.replace(path)
+    return path
+
+
+def update_state(
+    state: Optional["pd.DataFrame"],
+    new: Optional["pd.DataFrame"],
+    quarters: Collection[Tuple[int, int]],
+    stale: Collection[Tuple[int, int]],
+) -> Optional["pd.DataFrame"]:
+    """
+    Monta o estado dos trimestres da entrada a partir do gravado e dos relidos.
+
+    Os trimestres relidos tem os momentos trocados pelos novos (mesmo que
+    nao tenham mais linhas) e os que nao estao na entrada saem do estado.
+
+    :param state: Momentos por trimestre acumulados (ou None).
+    :param new: Momentos por trimestre dos trimestres relidos (ou None).
+    :param quarters: Todos os trimestres (Ano, Trimestre) da entrada.
+    :param stale: Trimestres relidos.
+    :return: Estado atualizado (None se nao sobrar nenhum momento).
+    """
+    if state is not None and not state.empty:
+        present = state.index.droplevel(GROUP_KEYS)
+        state = state[present.isin(list(quarters)) & ~present.isin(list(stale))]
+    parts = [part for part in (state, new) if part is not None and not part.empty]
+    if not parts:
+        return None
+    return pd.concat(parts).sort_index()
 
-def _parse_valor(value: object) -> float:
+
+def keep_last_quarters(
+    state: Optional["pd.DataFrame"], quarters: int
+) -> Optional["pd.DataFrame"]:
     """
-    Converte valor monetario tratando separadores decimais.
+    Mantem no estado apenas os N trimestres mais recentes.
 
-    :param value: Valor original.
-    :return: Valor convertido.
+    :param state: Momentos por trimestre (ou None).
+    :param quarters: Quantidade de trimestres mantidos.
+    :return: Estado sem os trimestres mais antigos.
     """
-    if value is None:
-        return 0.0
-    text = str(value).strip()
-    if not text:
-        return 0.0
-    if "," in text and "." in text:
-        text = text.replace(".", "").replace(",", ".")
-    elif "," in text:
-        text = text.replace(",", ".")
-    try:
-        return float(text)
-    except ValueError:
-        return 0.0
+    if state is None or state.empty:
+        return state
+    present = state.index.droplevel(GROUP_KEYS)
+    latest = present.unique().sort_values()[-quarters:]
+    return state[present.isin(latest)]
 
 
-def _std_pop(series: "pd.Series") -> float:
+def _count_rows(
+    chunks: Iterable["pd.DataFrame"], counter: list
+) -> Iterator["pd.DataFrame"]:
     """
-    Calcula desvio padrao populacional (ddof=0).
+    Repassa os blocos somando as linhas em counter[0].
 
-    :param series: Serie numerica.
-    :return: Desvio padrao populacional.
+    :param chunks: Blocos de entrada.
+    :param counter: Lista de um elemento com o total acumulado.
+    :return: Iterador dos mesmos blocos.
     """
-    return float(series.std(ddof=0))
+    for chunk in chunks:
+        counter[0] += len(chunk)
+        yield chunk
 
 
 def aggregate(
     input_file: Path = INPUT_FILE,
     output_file: Path = OUTPUT_FILE,
-) -> None:
+    chunk_rows: Optional[int] = None,
+    engine: str = "pandas",
+    state_file: Optional[Path] = None,
+    keep_quarters: Optional[int] = None,
+    quarters: Optional[Fingerprints] = None,
+) -> Tuple[int, int]:
     """
     Agrega despesas por RazaoSocial e UF.
 
-    :param input_file: CSV enriquecido de entrada.
+    :param input_file: Enriquecido de entrada (CSV ou Parquet).
     :param output_file: CSV agregado de saida.
-    :return: None.
+    :param chunk_rows: Linhas por bloco; se informado, le a entrada em blocos
+        e guarda so os momentos por chave (sempre com pandas).
+    :param engine: "pandas" ou "duckdb" (o DuckDB le o arquivo direto, sem
+        passar o texto pelo pandas).
+    :param state_file: Momentos por trimestre de execucoes anteriores. O
+        estado fica so com os trimestres da entrada; com quarters, os
+        trimestres com a mesma impressao digital vem dele, sem reler as linhas.
+    :param keep_quarters: Com state_file, considera so os N trimestres mais
+        recentes (janela movel).
+    :param quarters: Todos os trimestres (Ano, Trimestre) da entrada com a
+        impressao digital das linhas de cada um (ex.: hash das origens).
+    :return: Tupla (linhas lidas, linhas agregadas).
     """
-    enriched_df = pd.read_csv(input_file, dtype=str, encoding="utf-8-sig")
-    enriched_df["RazaoSocial"] = (
-        enriched_df["RazaoSocial"].fillna("").astype(str).str.strip()
-    )
-    enriched_df["UF"] = enriched_df["UF"].fillna("").astype(str).str.strip()
+    check_engine(engine)
+    keys = STATE_KEYS if state_file else GROUP_KEYS
 
-    enriched_df = enriched_df[
-        (enriched_df["RazaoSocial"] != "") & (enriched_df["UF"] != "")
-    ]
-    enriched_df["ValorDespesas_num"] = enriched_df["ValorDespesas"].map(_parse_valor)
-
-    aggregated_df = (
-        enriched_df.groupby(["RazaoSocial", "UF"])["ValorDespesas_num"]
-        .agg(
-            TotalDespesas="sum",
-            MediaDespesas="mean",
-            DesvioPadraoDespesas=_std_pop,
-        )
-        .reset_index()
-    )
+    def read(stale: Optional[Collection[Tuple[int, int]]]) -> tuple:
+        """
+        Le da entrada so as linhas dos trimestres pedidos.
 
-    aggregated_df["DesvioPadraoDespesas"] = aggregated_df[
-        "DesvioPadraoDespesas"
-    ].fillna(0.0)
-    aggregated_df = aggregated_df.sort_values("TotalDespesas", ascending=False)
+        :param stale: Trimestres a ler (None = todos).
+        :return: Tupla (momentos, linhas lidas).
+        """
+        if stale is not None and not stale:
+            return None, 0
+        if chunk_rows:
+            chunks = iter_frames(input_file, chunk_rows)
+            if stale is not None:
+                chunks = (_only_quarters(chunk, stale) for chunk in chunks)
+            counter = [0]
+            return merge_chunks(_count_rows(chunks, counter), keys), counter[0]
+        if engine == "duckdb":
+            prepared, rows_in = _scan(input_file, keys, stale)
+            return _moments(prepared, keys), rows_in
+        enriched_df = read_quarters(input_file, stale)
+        return chunk_moments(enriched_df, keys), len(enriched_df)
 
+    state, rows_in = _refresh_state(read, state_file, quarters, keep_quarters)
+    aggregated_df = _finish(state)
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    for col in ["TotalDespesas", "MediaDespesas", "DesvioPadraoDespesas"]:
-        aggregated_df[col] = aggregated_df[col].map(lambda v: f"{v:.5f}")
     aggregated_df.to_csv(output_file, index=False, encoding="utf-8-sig")
+    return rows_in, len(aggregated_df)
 
 
 if __name__ == "__main__":
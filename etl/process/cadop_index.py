@@ -0,0 +1,205 @@
+import os
+import pickle
+import threading
+import unicodedata
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+
+try:
+    from etl.process.partial_cache import source_digest
+except ModuleNotFoundError:
+    from partial_cache import source_digest
+
+CADOP_ENCODINGS = ["utf-8-sig", "utf-8", "latin-1"]
+DEFAULT_CACHE_DIR = Path("data/cache/cadop")
+SNAPSHOT_PREFIX = "cadop_"
+# Incrementar quando a normalizacao mudar (invalida os snapshots).
+SNAPSHOT_VERSION = 2
+# Snapshots mantidos (os usados mais recentemente); outros CADOPs nao se apagam.
+SNAPSHOT_KEEP = 4
+
+# Coluna normalizada do CADOP -> nome usado nas etapas.
+COLUMNS = {
+    "registrooperadora": "RegistroANS",
+    "cnpj": "CNPJ",
+    "razaosocial": "RazaoSocial",
+    "modalidade": "Modalidade",
+    "uf": "UF",
+    "dataregistroans": "DataRegistroANS",
+}
+OPTIONAL_COLUMNS = {"dataregistroans"}
+
+_CACHE: Dict[Tuple, "CadopIndex"] = {}
+_CACHE_LOCK = threading.Lock()
+
+
+@dataclass(frozen=True)
+class CadopIndex:
+    """
+    CADOP normalizado e deduplicado (registro mais recente vence), com uma
+    tabela indexada por REGISTRO_OPERADORA e outra por CNPJ.
+
+    by_registro mantem o CNPJ como no CADOP (texto de saida do consolidado);
+    by_cnpj e indexada pelo CNPJ so com digitos (chave dos joins).
+    """
+
+    by_registro: "pd.DataFrame"
+    by_cnpj: "pd.DataFrame"
+
+
+def _column_key(name: str) -> str:
+    """
+    Normaliza o nome de uma coluna do CADOP para comparacao.
+
+    :param name: Nome original.
+    :return: Nome em minusculas, sem acentos e so com letras e digitos.
+    """
+    text = unicodedata.normalize("NFKD", str(name).strip().lower())
+    return "".join(ch for ch in text if ch.isalnum() and not unicodedata.combining(ch))
+
+
+def _read_cadop(path: Path) -> "pd.DataFrame":
+    """
+    Le o CSV do CADOP com fallback de encoding.
+
+    :param path: Caminho do CADOP.
+    :return: DataFrame bruto (tudo como texto).
+    """
+    last_error = None
+    for enc in CADOP_ENCODINGS:
+        try:
+            return pd.read_csv(path, sep=";", encoding=enc, dtype=str)
+        except Exception as exc:
+            last_error = exc
+    raise ValueError(f"Falha ao ler CADOP: {last_error}")
+
+
+def _build_index(path: Path) -> CadopIndex:
+    """
+    Normaliza colunas, tipa datas e deduplica o CADOP pelas duas chaves.
+
+    :param path: Caminho do CADOP.
+    :return: Indice do CADOP.
+    """
+    raw_df = _read_cadop(path)
+    found = {_column_key(col): col for col in raw_df.columns}
+    missing = [key for key in COLUMNS if key not in found]
+    if any(key not in OPTIONAL_COLUMNS for key in missing):
+        raise ValueError("Colunas obrigatorias nao encontradas no CADOP.")
+
+    keys = [key for key in COLUMNS if key in found]
+    cadop_df = raw_df[[found[key] for key in keys]].copy()
+    cadop_df.columns = [COLUMNS[key] for key in keys]
+    digits = cadop_df["CNPJ"].str.replace(r"\D", "", regex=True)
+    if "DataRegistroANS" in cadop_df.columns:
+        cadop_df["DataRegistroANS"] = pd.to_datetime(
+            cadop_df["DataRegistroANS"], errors="coerce"
+        )
+        cadop_df = cadop_df.sort_values("DataRegistroANS", kind="stable")
+
+    by_registro = (
+        cadop_df.dropna(subset=["RegistroANS"])
+        .drop_duplicates(subset=["RegistroANS"], keep="last")
+        .set_index("RegistroANS")
+    )
+    by_cnpj = (
+        cadop_df.assign(CNPJ=digits)
+        .dropna(subset=["CNPJ"])
+        .drop_duplicates(subset=["CNPJ"], keep="last")
+        .set_index("CNPJ")
+    )
+    return CadopIndex(by_registro=by_registro, by_cnpj=by_cnpj)
+
+
+def _snapshot_path(cache_dir: Path, digest: str) -> Path:
+    """
+    Retorna o snapshot binario de um CADOP.
+
+    :param cache_dir: Diretorio do cache.
+    :param digest: SHA-256 do CSV do CADOP.
+    :return: Caminho do snapshot.
+    """
+    return cache_dir / f"{SNAPSHOT_PREFIX}{digest}_v{SNAPSHOT_VERSION}.pkl"
+
+
+def _load_snapshot(path: Path) -> Optional[CadopIndex]:
+    """
+    Carrega um snapshot, ignorando arquivo ausente ou corrompido.
+
+    O mtime e atualizado a cada uso: e a ordem de descarte de _save_snapshot.
+
+    :param path: Caminho do snapshot.
+    :return: Indice do CADOP ou None.
+    """
+    if not path.exists():
+        return None
+    try:
+        with open(path, "rb") as handle:
+            tables = pickle.load(handle)
+        os.utime(path)
+        return CadopIndex(**tables)
+    except Exception:
+        return None
+
+
+def _save_snapshot(path: Path, index: CadopIndex) -> None:
+    """
+    Grava o snapshot de forma atomica e descarta os usados ha mais tempo,
+    mantendo SNAPSHOT_KEEP.
+
+    :param path: Caminho do snapshot.
+    :param index: Indice do CADOP.
+    :return: None.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tables = {"by_registro": index.by_registro, "by_cnpj": index.by_cnpj}
+    with open(tmp, "wb") as handle:
+        pickle.dump(tables, handle, protocol=pickle.HIGHEST_PROTOCOL)
+    tmp.replace(path)
+    snapshots = []
+    for other in path.parent.glob(f"{SNAPSHOT_PREFIX}*.pkl"):
+        try:
+            snapshots.append((other.stat().st_mtime_ns, other))
+        except OSError:
+            continue
+    for _, old in sorted(snapshots, reverse=True)[SNAPSHOT_KEEP:]:
+        if old != path:
+            old.unlink(missing_ok=True)
+
+
+def load_cadop_index(
+    path: Path, cache_dir: Optional[Path] = DEFAULT_CACHE_DIR
+) -> CadopIndex:
+    """
+    Retorna o indice do CADOP, lendo o CSV no maximo uma vez.
+
+    Em memoria, o indice fica guardado por caminho, tamanho e mtime. Em disco,
+    o snapshot e identificado pelo hash do CSV (o hash so e recalculado se o
+    tamanho ou o mtime mudarem).
+
+    :param path: Caminho do CADOP.
+    :param cache_dir: Diretorio dos snapshots (None desativa o disco).
+    :return: Indice do CADOP.
+    """
+    stat = path.stat()
+    key = (str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+    with _CACHE_LOCK:
+        if key in _CACHE:
+            return _CACHE[key]
+
+    index = None
+    if cache_dir is not None:
+        snapshot = _snapshot_path(cache_dir, source_digest(path, cache_dir))
+        index = _load_snapshot(snapshot)
+    if index is None:
+        index = _build_index(path)
+        if cache_dir is not None:
+            _save_snapshot(snapshot, index)
+
+    with _CACHE_LOCK:
+        _CACHE[key] = index
+    return index
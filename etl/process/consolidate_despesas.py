@@ -1,10 +1,38 @@
+import io
 import re
 import unicodedata
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from itertools import repeat
 from pathlib import Path
 from typing import Dict, Iterable, List, Optional, Tuple
 
 import pandas as pd
-from openpyxl import load_workbook
+
+try:
+    from etl.process.cadop_index import load_cadop_index
+    from etl.process.csv_dialect import (
+        CsvDialect,
+        encodings_for,
+        open_source,
+        sniff_csv,
+    )
+    from etl.process.duckdb_engine import check_engine, scan_expense_rows
+    from etl.process.frame_io import write_frame
+    from etl.process.line_prefilter import prefilter_lines
+    from etl.process.money import MONEY_DTYPE, parse_money
+    from etl.process.partial_cache import load_partial, save_partial, source_digest
+    from etl.process.xlsx_reader import iter_xlsx_frames
+except ModuleNotFoundError:
+    from cadop_index import load_cadop_index
+    from csv_dialect import CsvDialect, encodings_for, open_source, sniff_csv
+    from duckdb_engine import check_engine, scan_expense_rows
+    from frame_io import write_frame
+    from line_prefilter import prefilter_lines
+    from money import MONEY_DTYPE, parse_money
+    from partial_cache import load_partial, save_partial, source_digest
+    from xlsx_reader import iter_xlsx_frames
 
 
 EXTRACT_DIR = Path("data/processed/ans")
@@ -14,10 +42,11 @@ OUTPUT_FILE = OUTPUT_DIR / "consolidado_despesas.csv"
 
 CSV_EXTS = {".csv", ".txt"}
 XLSX_EXT = ".xlsx"
-CSV_SEPS = [";", ",", "\t", "|", None]
-CSV_ENCODINGS = ["utf-8", "latin-1"]
-CADOP_ENCODINGS = ["utf-8-sig", "utf-8", "latin-1"]
+ZIP_EXT = ".zip"
 QUARTER_RE = re.compile(r"([1-4])T(\d{4})", re.IGNORECASE)
+CSV_CHUNK_ROWS = 50000
+# A descricao (minuscula) precisa casar com todas as expressoes.
+EXPENSE_PATTERNS = ("despesa", r"(?:evento|sinistro)")
 
 
 def _normalize_key(value: object) -> str:
@@ -73,31 +102,67 @@ def _parse_quarter_from_path(path: Path) -> Optional[Tuple[int, int]]:
     return ano, trimestre
 
 
-def _collect_data_files(base_dir: Path) -> List[Tuple[Path, int, int]]:
+def _is_data_file(name: str) -> bool:
     """
-    Coleta arquivos elegiveis com ano e trimestre inferidos.
+    Retorna True se o nome tiver extensao de dados (CSV/TXT/XLSX).
+
+    :param name: Nome ou caminho do arquivo.
+    :return: True se for arquivo de dados.
+    """
+    suffix = Path(name).suffix.lower()
+    return suffix in CSV_EXTS or suffix == XLSX_EXT
+
+
+def _zip_members(zip_path: Path) -> List[str]:
+    """
+    Lista os membros de dados de um ZIP, ignorando pastas e outros arquivos.
+
+    :param zip_path: Caminho do ZIP.
+    :return: Nomes dos membros CSV/TXT/XLSX.
+    """
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            return [
+                info.filename
+                for info in archive.infolist()
+                if not info.is_dir() and _is_data_file(info.filename)
+            ]
+    except zipfile.BadZipFile:
+        return []
+
+
+def _collect_data_files(
+    base_dir: Path,
+) -> List[Tuple[Path, Optional[str], int, int]]:
+    """
+    Coleta arquivos elegiveis (soltos ou dentro de ZIPs) com ano e trimestre.
 
     :param base_dir: Diretorio base de busca.
-    :return: Lista de tuplas (arquivo, ano, trimestre).
+    :return: Lista de tuplas (arquivo, membro do ZIP ou None, ano, trimestre).
     """
-    files: List[Tuple[Path, int, int]] = []
+    files: List[Tuple[Path, Optional[str], int, int]] = []
     for path in base_dir.rglob("*"):
         if not path.is_file():
             continue
-        suffix = path.suffix.lower()
-        if suffix not in CSV_EXTS and suffix != XLSX_EXT:
+        if path.suffix.lower() == ZIP_EXT:
+            for member in _zip_members(path):
+                quarter = _parse_quarter_from_path(path / member)
+                if quarter:
+                    files.append((path, member, quarter[0], quarter[1]))
+            continue
+        if not _is_data_file(path.name):
             continue
         quarter = _parse_quarter_from_path(path)
         if not quarter:
             continue
         ano, tri = quarter
-        files.append((path, ano, tri))
+        files.append((path, None, ano, tri))
     return files
 
 
 def _latest_quarters(
-    files: List[Tuple[Path, int, int]], limit: int = 3
-) -> List[Tuple[Path, int, int]]:
+    files: List[Tuple[Path, Optional[str], int, int]], limit: int = 3
+) -> List[Tuple[Path, Optional[str], int, int]]:
     """
     Filtra apenas os N trimestres mais recentes.
 
@@ -105,24 +170,9 @@ def _latest_quarters(
     :param limit: Quantidade de trimestres.
     :return: Lista filtrada.
     """
-    quarters = sorted({(ano, tri) for _, ano, tri in files}, reverse=True)
+    quarters = sorted({(ano, tri) for _, _, ano, tri in files}, reverse=True)
     selected = set(quarters[:limit])
-    return [item for item in files if (item[1], item[2]) in selected]
-
-
-def _parse_decimal_series(series: "pd.Series") -> "pd.Series":
-    """
-    Converte serie monetaria tratando ponto e virgula.
-
-    :param series: Serie com valores monetarios.
-    :return: Serie numerica.
-    """
-    text = series.astype(str)
-    has_dot = text.str.contains(r"\.", regex=True)
-    has_comma = text.str.contains(",", regex=False)
-    text = text.where(~(has_dot & has_comma), text.str.replace(".", "", regex=False))
-    text = text.str.replace(",", ".", regex=False)
-    return pd.to_numeric(text, errors="coerce").fillna(0.0)
+    return [item for item in files if (item[2], item[3]) in selected]
 
 
 def _should_keep_col(name: str) -> bool:
@@ -153,6 +203,16 @@ def _map_cols(columns: Iterable[str]) -> Optional[Tuple[str, str, str]]:
     return reg_col, desc_col, val_col
 
 
+def _has_required_cols(columns: List[str]) -> bool:
+    """
+    Retorna True se o cabecalho tiver REG_ANS, DESCRICAO e VL_SALDO_FINAL.
+
+    :param columns: Colunas do cabecalho.
+    :return: True se todas as colunas necessarias existem.
+    """
+    return _map_cols([col for col in columns if _should_keep_col(col)]) is not None
+
+
 def _accumulate_chunk(
     chunk: "pd.DataFrame",
     reg_col: str,
@@ -160,7 +220,7 @@ def _accumulate_chunk(
     val_col: str,
     ano: int,
     tri: int,
-    agg: Dict[Tuple[str, int, int], float],
+    agg: Dict[Tuple[str, int, int], int],
 ) -> None:
     """
     Acumula linhas que casam no agregado do chunk.
@@ -175,197 +235,401 @@ def _accumulate_chunk(
     :return: None.
     """
     descricao = chunk[desc_col].astype(str).str.lower()
-    mask = descricao.str.contains("despesa", na=False) & descricao.str.contains(
-        r"(?:evento|sinistro)", na=False
-    )
+    mask = pd.Series(True, index=chunk.index)
+    for pattern in EXPENSE_PATTERNS:
+        mask &= descricao.str.contains(pattern, na=False)
     if not mask.any():
         return
     filtered = chunk.loc[mask, [reg_col, val_col]]
     reg = filtered[reg_col].astype(str).str.strip()
-    valores = _parse_decimal_series(filtered[val_col])
+    valores = parse_money(filtered[val_col]).fillna(0)
     grouped = valores.groupby(reg).sum()
     for reg_ans, total in grouped.items():
         key = (reg_ans, ano, tri)
-        agg[key] = agg.get(key, 0.0) + float(total)
+        agg[key] = agg.get(key, 0) + int(total)
+
+
+def _accumulate_scanned(
+    rows: "pd.DataFrame",
+    ano: int,
+    tri: int,
+    agg: Dict[Tuple[str, int, int], int],
+) -> None:
+    """
+    Acumula as linhas filtradas pelo DuckDB, bloco a bloco como na leitura
+    pandas (as chaves entram no agregado na mesma ordem).
+
+    :param rows: Linhas de scan_expense_rows (chunk, reg, valor).
+    :param ano: Ano do trimestre.
+    :param tri: Numero do trimestre.
+    :param agg: Dicionario de agregacao.
+    :return: None.
+    """
+    if rows.empty:
+        return
+    reg = rows["reg"].astype(str).str.strip()
+    valores = parse_money(rows["valor"]).fillna(0)
+    grouped = valores.groupby([rows["chunk"], reg]).sum()
+    for (_, reg_ans), total in grouped.items():
+        key = (reg_ans, ano, tri)
+        agg[key] = agg.get(key, 0) + int(total)
+
+
+def _read_csv_duckdb(
+    path: Path,
+    member: Optional[str],
+    filtered: Optional[io.BytesIO],
+    dialect: CsvDialect,
+    encoding: str,
+    ano: int,
+    tri: int,
+    agg: Dict[Tuple[str, int, int], int],
+) -> bool:
+    """
+    Le um CSV/TXT com o DuckDB e acumula no agregado.
+
+    :param path: Caminho do arquivo (ou do ZIP que o contem).
+    :param member: Membro do ZIP (None para arquivo solto).
+    :param filtered: Linhas pre-filtradas ou None.
+    :param dialect: Dialeto detectado.
+    :param encoding: Encoding a usar.
+    :param ano: Ano do trimestre.
+    :param tri: Numero do trimestre.
+    :param agg: Dicionario de agregacao.
+    :return: False se o cabecalho nao tiver as colunas necessarias.
+    """
+    columns = list(dialect.columns)
+    col_map = _map_cols([col for col in columns if _should_keep_col(col)])
+    if not col_map:
+        return False
+    rows = scan_expense_rows(
+        path,
+        member,
+        filtered,
+        sep=dialect.sep,
+        encoding=encoding,
+        width=len(columns),
+        columns=tuple(columns.index(col) for col in col_map),
+        patterns=EXPENSE_PATTERNS,
+        chunk_rows=CSV_CHUNK_ROWS,
+    )
+    _accumulate_scanned(rows, ano, tri, agg)
+    return True
+
+
+def _read_csv_pandas(
+    path: Path,
+    member: Optional[str],
+    filtered: Optional[io.BytesIO],
+    dialect: CsvDialect,
+    encoding: str,
+    ano: int,
+    tri: int,
+    agg: Dict[Tuple[str, int, int], int],
+) -> bool:
+    """
+    Le um CSV/TXT com o pandas em chunks e acumula no agregado.
+
+    :param path: Caminho do arquivo (ou do ZIP que o contem).
+    :param member: Membro do ZIP (None para arquivo solto).
+    :param filtered: Linhas pre-filtradas ou None.
+    :param dialect: Dialeto detectado.
+    :param encoding: Encoding a usar.
+    :param ano: Ano do trimestre.
+    :param tri: Numero do trimestre.
+    :param agg: Dicionario de agregacao.
+    :return: False se o cabecalho nao tiver as colunas necessarias.
+    """
+    if filtered is not None:
+        filtered.seek(0)
+        source = nullcontext(filtered)
+    else:
+        source = open_source(path, member)
+    with source as handle:
+        reader = pd.read_csv(
+            handle,
+            sep=dialect.sep,
+            engine="c",
+            dtype=str,
+            chunksize=CSV_CHUNK_ROWS,
+            encoding=encoding,
+            on_bad_lines="skip",
+            usecols=_should_keep_col,
+        )
+        col_map = None
+        for chunk in reader:
+            if col_map is None:
+                col_map = _map_cols(chunk.columns)
+                if not col_map:
+                    return False
+            reg_col, desc_col, val_col = col_map
+            _accumulate_chunk(chunk, reg_col, desc_col, val_col, ano, tri, agg)
+    return True
 
 
 def _accumulate_csv(
-    path: Path, ano: int, tri: int, agg: Dict[Tuple[str, int, int], float]
+    path: Path,
+    ano: int,
+    tri: int,
+    agg: Dict[Tuple[str, int, int], int],
+    member: Optional[str] = None,
+    prefilter: bool = False,
+    engine: str = "pandas",
 ) -> None:
     """
-    Le CSV/TXT em chunks e acumula valores no agregado.
+    Le CSV/TXT em chunks com o dialeto detectado e acumula no agregado.
 
-    :param path: Caminho do arquivo.
+    :param path: Caminho do arquivo (ou do ZIP que o contem).
     :param ano: Ano do trimestre.
     :param tri: Numero do trimestre.
     :param agg: Dicionario de agregacao.
+    :param member: Membro do ZIP a ler em streaming (None para arquivo solto).
+    :param prefilter: Se True, so o cabecalho e as linhas com as palavras-chave
+        chegam ao parser.
+    :param engine: "pandas" ou "duckdb" (leitura e filtro em SQL).
     :return: None.
     """
-    for encoding in CSV_ENCODINGS:
-        for sep in CSV_SEPS:
-            try:
-                reader = pd.read_csv(
-                    path,
-                    sep=sep,
-                    engine="python",
-                    dtype=str,
-                    chunksize=50000,
-                    encoding=encoding,
-                    on_bad_lines="skip",
-                    usecols=_should_keep_col,
-                )
-                col_map = None
-                for chunk in reader:
-                    if col_map is None:
-                        col_map = _map_cols(chunk.columns)
-                        if not col_map:
-                            break
-                    reg_col, desc_col, val_col = col_map
-                    _accumulate_chunk(chunk, reg_col, desc_col, val_col, ano, tri, agg)
-                if col_map:
-                    return
-            except Exception:
-                continue
+    dialect = sniff_csv(path, _has_required_cols, member=member)
+    if dialect is None:
+        return
+    filtered = prefilter_lines(path, member) if prefilter else None
+    read = _read_csv_duckdb if engine == "duckdb" else _read_csv_pandas
+    for encoding in encodings_for(dialect):
+        # Acumula em separado para nao somar duas vezes se o encoding falhar
+        # depois da amostra e a leitura precisar recomecar.
+        partial: Dict[Tuple[str, int, int], int] = {}
+        try:
+            if not read(path, member, filtered, dialect, encoding, ano, tri, partial):
+                return
+        except UnicodeDecodeError:
+            continue
+        except Exception:
+            return
+        for key, total in partial.items():
+            agg[key] = agg.get(key, 0) + total
+        return
 
 
-def _parse_decimal_value(value: object) -> float:
+def _select_xlsx_cols(
+    header: List[Optional[str]],
+) -> Optional[Tuple[int, int, int]]:
     """
-    Converte um valor monetario unico para float.
+    Localiza REG_ANS, DESCRICAO e VL_SALDO_FINAL no cabecalho do XLSX.
 
-    :param value: Valor original.
-    :return: Valor convertido.
+    :param header: Valores da primeira linha da planilha.
+    :return: Tupla de indices (reg, desc, valor) ou None.
     """
-    if value is None:
-        return 0.0
-    text = str(value).strip()
-    if not text:
-        return 0.0
-    text = text.replace(".", "").replace(",", ".")
-    try:
-        return float(text)
-    except ValueError:
-        return 0.0
+    reg_idx = desc_idx = val_idx = None
+    for idx, name in enumerate(header):
+        norm = _normalize_key(name)
+        if norm in {"regans", "registroans"}:
+            reg_idx = idx
+        elif norm == "descricao":
+            desc_idx = idx
+        elif "vlsaldofinal" in norm:
+            val_idx = idx
+    if reg_idx is None or desc_idx is None or val_idx is None:
+        return None
+    return reg_idx, desc_idx, val_idx
 
 
 def _accumulate_xlsx(
-    path: Path, ano: int, tri: int, agg: Dict[Tuple[str, int, int], float]
+    path: Path,
+    ano: int,
+    tri: int,
+    agg: Dict[Tuple[str, int, int], int],
+    member: Optional[str] = None,
 ) -> None:
     """
-    Faz streaming de XLSX e acumula linhas no agregado.
+    Le so as colunas usadas do XML das planilhas e acumula lotes no agregado.
 
-    :param path: Caminho do arquivo.
+    :param path: Caminho do arquivo (ou do ZIP que o contem).
     :param ano: Ano do trimestre.
     :param tri: Numero do trimestre.
     :param agg: Dicionario de agregacao.
+    :param member: Membro do ZIP a ler (None para arquivo solto).
     :return: None.
     """
+    partial: Dict[Tuple[str, int, int], int] = {}
     try:
-        wb = load_workbook(filename=path, read_only=True, data_only=True)
+        if member is None:
+            source = path
+        else:
+            # XLSX ja e compactado: manter o membro em memoria evita seeks
+            # caros no stream descompactado do ZIP externo.
+            with open_source(path, member) as handle:
+                source = io.BytesIO(handle.read())
+        for chunk in iter_xlsx_frames(source, _select_xlsx_cols):
+            chunk.columns = ["REG_ANS", "DESCRICAO", "VALOR"]
+            chunk = chunk.dropna(subset=["REG_ANS"])
+            _accumulate_chunk(chunk, "REG_ANS", "DESCRICAO", "VALOR", ano, tri, partial)
     except Exception:
         return
-    try:
-        for ws in wb.worksheets:
-            rows = ws.iter_rows(values_only=True)
-            try:
-                header = next(rows)
-            except StopIteration:
-                continue
-            if not header:
-                continue
-            reg_idx = desc_idx = val_idx = None
-            for idx, name in enumerate(header):
-                norm = _normalize_key(name)
-                if norm in {"regans", "registroans"}:
-                    reg_idx = idx
-                elif norm == "descricao":
-                    desc_idx = idx
-                elif "vlsaldofinal" in norm:
-                    val_idx = idx
-            if reg_idx is None or desc_idx is None or val_idx is None:
-                continue
-            for row in rows:
-                if not row or desc_idx >= len(row):
-                    continue
-                desc = row[desc_idx]
-                if desc is None:
-                    continue
-                text = str(desc).lower()
-                if "despesa" not in text or (
-                    "evento" not in text and "sinistro" not in text
-                ):
-                    continue
-                reg = row[reg_idx] if reg_idx < len(row) else None
-                val = row[val_idx] if val_idx < len(row) else None
-                if reg is None:
-                    continue
-                reg_ans = str(reg).strip()
-                total = _parse_decimal_value(val)
-                key = (reg_ans, ano, tri)
-                agg[key] = agg.get(key, 0.0) + total
-    finally:
-        wb.close()
-
-
-def _load_cadop(path: Path) -> "pd.DataFrame":
-    """
-    Carrega CADOP com fallback de encoding e colunas normalizadas.
-
-    :param path: Caminho do CADOP.
-    :return: DataFrame do CADOP normalizado.
-    """
-    df = None
-    last_error = None
-    for enc in CADOP_ENCODINGS:
-        try:
-            df = pd.read_csv(path, sep=";", encoding=enc, dtype=str)
-            break
-        except Exception as exc:
-            last_error = exc
-            continue
-    if df is None:
-        raise ValueError(f"Falha ao ler CADOP: {last_error}")
-    cols = {_normalize_key(c): c for c in df.columns}
-    reg_col = cols.get("registrooperadora")
-    cnpj_col = cols.get("cnpj")
-    razao_col = cols.get("razaosocial")
-    data_col = cols.get("dataregistroans")
-    if not reg_col or not cnpj_col or not razao_col:
-        raise ValueError("Colunas obrigatorias nao encontradas no CADOP.")
-    cadop = df[[reg_col, cnpj_col, razao_col] + ([data_col] if data_col else [])].copy()
-    cadop.columns = ["REG_ANS", "CNPJ", "RazaoSocial"] + (
-        ["DataRegistroANS"] if data_col else []
-    )
-    if "DataRegistroANS" in cadop.columns:
-        cadop["DataRegistroANS"] = pd.to_datetime(
-            cadop["DataRegistroANS"], errors="coerce"
+    for key, total in partial.items():
+        agg[key] = agg.get(key, 0) + total
+
+
+def _consolidate_file(
+    source: Tuple[Path, Optional[str], int, int],
+    prefilter: bool = False,
+    engine: str = "pandas",
+) -> Dict[Tuple[str, int, int], int]:
+    """
+    Consolida um unico arquivo em um agregado parcial (etapa "map").
+
+    Funcao de modulo para poder ser enviada a processos do pool.
+
+    :param source: Tupla (arquivo, membro do ZIP ou None, ano, trimestre).
+    :param prefilter: Se True, aplica o pre-filtro de linhas nos CSV/TXT.
+    :param engine: Engine de leitura dos CSV/TXT ("pandas" ou "duckdb").
+    :return: Agregado parcial por (REG_ANS, ano, trimestre).
+    """
+    path, member, ano, tri = source
+    partial: Dict[Tuple[str, int, int], int] = {}
+    suffix = Path(member or path.name).suffix.lower()
+    if suffix in CSV_EXTS:
+        _accumulate_csv(
+            path, ano, tri, partial, member=member, prefilter=prefilter, engine=engine
         )
-    return cadop
+    elif suffix == XLSX_EXT:
+        _accumulate_xlsx(path, ano, tri, partial, member=member)
+    return partial
 
 
-def consolidate(
+def _merge_partial(
+    agg: Dict[Tuple[str, int, int], int],
+    partial: Dict[Tuple[str, int, int], int],
+) -> None:
+    """
+    Soma um agregado parcial no agregado final (etapa "reduce").
+
+    :param agg: Agregado final.
+    :param partial: Agregado parcial de um arquivo.
+    :return: None.
+    """
+    for key, total in partial.items():
+        agg[key] = agg.get(key, 0) + total
+
+
+def _group_by_source(
+    files: List[Tuple[Path, Optional[str], int, int]],
+) -> List[Tuple[Tuple[Path, int, int], List[Tuple[Path, Optional[str], int, int]]]]:
+    """
+    Agrupa os arquivos por origem (ZIP ou arquivo solto) e trimestre, na ordem.
+
+    :param files: Lista de arquivos com ano e trimestre.
+    :return: Lista de ((origem, ano, trimestre), arquivos do grupo).
+    """
+    groups: Dict[Tuple[Path, int, int], List] = {}
+    for item in files:
+        path, _, ano, tri = item
+        groups.setdefault((path, ano, tri), []).append(item)
+    return list(groups.items())
+
+
+def _map_files(
+    files: List[Tuple[Path, Optional[str], int, int]],
+    workers: int,
+    prefilter: bool,
+    engine: str,
+) -> List[Dict[Tuple[str, int, int], int]]:
+    """
+    Consolida cada arquivo em um parcial, em processos se workers > 1.
+
+    :param files: Arquivos a processar.
+    :param workers: Processos para ler arquivos em paralelo (1 = sequencial).
+    :param prefilter: Se True, aplica o pre-filtro de linhas nos CSV/TXT.
+    :param engine: Engine de leitura dos CSV/TXT ("pandas" ou "duckdb").
+    :return: Parciais na mesma ordem dos arquivos.
+    """
+    if workers > 1 and len(files) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(files))) as executor:
+            return list(
+                executor.map(
+                    _consolidate_file, files, repeat(prefilter), repeat(engine)
+                )
+            )
+    return [_consolidate_file(source, prefilter, engine) for source in files]
+
+
+def quarter_sources(
+    extract_dir: Path = EXTRACT_DIR, limit_quarters: int = 3
+) -> Dict[Tuple[int, int], List[Path]]:
+    """
+    Lista as origens (ZIPs ou arquivos soltos) de cada trimestre consolidado.
+
+    :param extract_dir: Diretorio com os ZIPs baixados e/ou arquivos extraidos.
+    :param limit_quarters: Quantidade de trimestres.
+    :return: Mapa (Ano, Trimestre) -> origens.
+    """
+    files = _latest_quarters(_collect_data_files(extract_dir), limit=limit_quarters)
+    sources: Dict[Tuple[int, int], List[Path]] = {}
+    for (path, ano, tri), _ in _group_by_source(files):
+        sources.setdefault((ano, tri), []).append(path)
+    return sources
+
+
+def consolidate_frame(
     extract_dir: Path = EXTRACT_DIR,
     cadop_path: Path = CADOP_PATH,
-    output_file: Path = OUTPUT_FILE,
     limit_quarters: int = 3,
-) -> Path:
+    workers: int = 1,
+    prefilter: bool = False,
+    cache_dir: Optional[Path] = None,
+    engine: str = "pandas",
+) -> "pd.DataFrame":
     """
-    Consolida os ultimos trimestres em um unico CSV.
+    Consolida os ultimos trimestres em memoria, sem gravar arquivo.
+
+    Cada arquivo vira um agregado parcial e os parciais sao somados na ordem
+    dos arquivos, entao o resultado e o mesmo com qualquer numero de workers.
+    Com `cache_dir`, o parcial de cada origem/trimestre fica gravado pelo hash
+    do ZIP e so as origens novas ou alteradas sao lidas de novo.
 
-    :param extract_dir: Diretorio de extracao.
+    :param extract_dir: Diretorio com os ZIPs baixados e/ou arquivos extraidos.
     :param cadop_path: Caminho do CADOP.
-    :param output_file: Caminho do CSV de saida.
     :param limit_quarters: Quantidade de trimestres.
-    :return: Caminho do CSV consolidado.
+    :param workers: Processos para ler arquivos em paralelo (1 = sequencial).
+    :param prefilter: Se True, descarta nos bytes as linhas de CSV/TXT sem as
+        palavras-chave antes do parser (o filtro real continua valendo).
+    :param cache_dir: Diretorio dos parciais por trimestre (None desativa).
+    :param engine: "pandas" ou "duckdb" (CSV/TXT lidos e filtrados em SQL;
+        as somas sao inteiras, entao o resultado e identico).
+    :return: DataFrame com CNPJ, RazaoSocial, Trimestre, Ano e ValorDespesas.
     """
+    check_engine(engine)
     files = _collect_data_files(extract_dir)
     files = _latest_quarters(files, limit=limit_quarters)
 
-    agg: Dict[Tuple[str, int, int], float] = {}
-    for path, ano, tri in files:
-        if path.suffix.lower() in CSV_EXTS:
-            _accumulate_csv(path, ano, tri, agg)
-        elif path.suffix.lower() == XLSX_EXT:
-            _accumulate_xlsx(path, ano, tri, agg)
+    groups = _group_by_source(files)
+    digests: Dict[int, str] = {}
+    cached: Dict[int, Dict[Tuple[str, int, int], int]] = {}
+    if cache_dir is not None:
+        for idx, ((path, ano, tri), _) in enumerate(groups):
+            digests[idx] = source_digest(path, cache_dir)
+            hit = load_partial(digests[idx], ano, tri, cache_dir)
+            if hit is not None:
+                cached[idx] = hit
+
+    pending = [
+        item
+        for idx, (_, items) in enumerate(groups)
+        if idx not in cached
+        for item in items
+    ]
+    results = iter(_map_files(pending, workers, prefilter, engine))
+
+    agg: Dict[Tuple[str, int, int], int] = {}
+    for idx, ((_, ano, tri), items) in enumerate(groups):
+        if idx in cached:
+            group_partial = cached[idx]
+        else:
+            group_partial = {}
+            for _ in items:
+                _merge_partial(group_partial, next(results))
+            if cache_dir is not None:
+                save_partial(digests[idx], ano, tri, group_partial, cache_dir)
+        _merge_partial(agg, group_partial)
 
     consolidations = []
     for (reg_ans, ano, tri), total in agg.items():
@@ -380,25 +644,61 @@ def consolidate(
 
     consolidated_df = pd.DataFrame(consolidations)
     if consolidated_df.empty:
-        OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-        consolidated_df.to_csv(output_file, index=False, encoding="utf-8-sig")
-        return output_file
+        return consolidated_df
+    # Inteiro em 1/MONEY_SCALE; o texto com 5 casas so sai no CSV (frame_io).
+    consolidated_df["ValorDespesas"] = consolidated_df["ValorDespesas"].astype(
+        MONEY_DTYPE
+    )
+
+    cadop = load_cadop_index(cadop_path)
+    merged_df = consolidated_df.join(
+        cadop.by_registro[["CNPJ", "RazaoSocial"]], on="REG_ANS"
+    )
+    # CNPJ sai como no CADOP; a razao social mais recente vem pelos digitos.
+    merged_df["RazaoSocial"] = (
+        merged_df["CNPJ"]
+        .str.replace(r"\D", "", regex=True)
+        .map(cadop.by_cnpj["RazaoSocial"])
+        .fillna(merged_df["RazaoSocial"])
+    )
 
-    cadop_df = _load_cadop(cadop_path)
-    merged_df = consolidated_df.merge(cadop_df, on="REG_ANS", how="left")
+    return merged_df[["CNPJ", "RazaoSocial", "Trimestre", "Ano", "ValorDespesas"]]
 
-    if "DataRegistroANS" in cadop_df.columns:
-        cadop_latest = cadop_df.sort_values("DataRegistroANS")
-        latest_razao = (
-            cadop_latest.dropna(subset=["CNPJ"]).groupby("CNPJ")["RazaoSocial"].last()
-        )
-        merged_df["RazaoSocial"] = (
-            merged_df["CNPJ"].map(latest_razao).fillna(merged_df["RazaoSocial"])
-        )
 
-    final_df = merged_df[["CNPJ", "RazaoSocial", "Trimestre", "Ano", "ValorDespesas"]]
+def consolidate(
+    extract_dir: Path = EXTRACT_DIR,
+    cadop_path: Path = CADOP_PATH,
+    output_file: Path = OUTPUT_FILE,
+    limit_quarters: int = 3,
+    workers: int = 1,
+    prefilter: bool = False,
+    cache_dir: Optional[Path] = None,
+    engine: str = "pandas",
+) -> Path:
+    """
+    Consolida os ultimos trimestres em um unico arquivo.
+
+    :param extract_dir: Diretorio com os ZIPs baixados e/ou arquivos extraidos.
+    :param cadop_path: Caminho do CADOP.
+    :param output_file: Arquivo de saida (CSV ou Parquet, pelo sufixo).
+    :param limit_quarters: Quantidade de trimestres.
+    :param workers: Processos para ler arquivos em paralelo (1 = sequencial).
+    :param prefilter: Se True, aplica o pre-filtro de linhas nos CSV/TXT.
+    :param cache_dir: Diretorio dos parciais por trimestre (None desativa).
+    :param engine: "pandas" ou "duckdb" (ver consolidate_frame).
+    :return: Caminho do arquivo consolidado.
+    """
+    final_df = consolidate_frame(
+        extract_dir=extract_dir,
+        cadop_path=cadop_path,
+        limit_quarters=limit_quarters,
+        workers=workers,
+        prefilter=prefilter,
+        cache_dir=cache_dir,
+        engine=engine,
+    )
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    final_df.to_csv(output_file, index=False, encoding="utf-8-sig")
+    write_frame(final_df, output_file)
     return output_file
 
 
@@ -0,0 +1,159 @@
+import codecs
+import csv
+import io
+import threading
+import zipfile
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Callable, Dict, Iterator, List, Optional, Tuple
+
+CSV_SEPS = [";", ",", "\t", "|"]
+SAMPLE_BYTES = 256 * 1024
+FALLBACK_ENCODING = "latin-1"
+
+_CACHE: Dict[Tuple, Optional["CsvDialect"]] = {}
+_CACHE_LOCK = threading.Lock()
+
+
+@dataclass(frozen=True)
+class CsvDialect:
+    """
+    Dialeto detectado de um CSV/TXT: encoding, separador e cabecalho.
+    """
+
+    encoding: str
+    sep: str
+    columns: Tuple[str, ...]
+
+
+@contextmanager
+def open_source(path: Path, member: Optional[str] = None) -> Iterator[IO[bytes]]:
+    """
+    Abre um arquivo de dados em modo binario, direto do ZIP se for membro.
+
+    :param path: Caminho do arquivo ou do ZIP.
+    :param member: Nome do membro dentro do ZIP (None para arquivo solto).
+    :return: Stream binario do conteudo.
+    """
+    if member is None:
+        with open(path, "rb") as handle:
+            yield handle
+        return
+    with zipfile.ZipFile(path) as archive, archive.open(member) as handle:
+        yield handle
+
+
+def _fingerprint(path: Path, member: Optional[str]) -> Tuple:
+    """
+    Identifica o conteudo de um arquivo sem le-lo por inteiro.
+
+    :param path: Caminho do arquivo ou do ZIP.
+    :param member: Membro do ZIP (None para arquivo solto).
+    :return: Tupla que muda quando o conteudo muda.
+    """
+    stat = path.stat()
+    base = (str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+    if member is None:
+        return base
+    with zipfile.ZipFile(path) as archive:
+        info = archive.getinfo(member)
+    return base + (member, info.CRC, info.file_size)
+
+
+def _detect_encoding(sample: bytes) -> str:
+    """
+    Escolhe o encoding pela amostra: UTF-8 se decodificar, senao latin-1.
+
+    :param sample: Bytes iniciais do arquivo.
+    :return: Nome do encoding.
+    """
+    try:
+        # final=False tolera um caractere multibyte cortado no fim da amostra.
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return FALLBACK_ENCODING
+
+
+def _header(text: str, sep: str) -> List[str]:
+    """
+    Le a primeira linha (cabecalho) respeitando aspas.
+
+    :param text: Amostra decodificada.
+    :param sep: Separador candidato.
+    :return: Nomes das colunas.
+    """
+    try:
+        return next(csv.reader(io.StringIO(text), delimiter=sep))
+    except (StopIteration, csv.Error):
+        return []
+
+
+def _sniff_sample(
+    sample: bytes, accept: Callable[[List[str]], bool]
+) -> Optional[CsvDialect]:
+    """
+    Detecta encoding e separador a partir de uma amostra.
+
+    Os separadores sao testados na mesma ordem da leitura antiga e vence o
+    primeiro cujo cabecalho tenha as colunas aceitas; o csv.Sniffer fica
+    como ultimo recurso.
+
+    :param sample: Bytes iniciais do arquivo.
+    :param accept: Funcao que valida as colunas do cabecalho.
+    :return: Dialeto detectado ou None.
+    """
+    encoding = _detect_encoding(sample)
+    decoder_name = "utf-8-sig" if encoding == "utf-8" else encoding
+    text = codecs.getincrementaldecoder(decoder_name)(errors="replace").decode(sample)
+    for sep in CSV_SEPS:
+        columns = _header(text, sep)
+        if accept(columns):
+            return CsvDialect(encoding, sep, tuple(columns))
+    try:
+        sep = csv.Sniffer().sniff(text[:65536]).delimiter
+    except csv.Error:
+        return None
+    columns = _header(text, sep)
+    if accept(columns):
+        return CsvDialect(encoding, sep, tuple(columns))
+    return None
+
+
+def sniff_csv(
+    path: Path,
+    accept: Callable[[List[str]], bool],
+    member: Optional[str] = None,
+) -> Optional[CsvDialect]:
+    """
+    Le uma amostra uma unica vez e detecta o dialeto, com cache por arquivo.
+
+    :param path: Caminho do arquivo ou do ZIP.
+    :param accept: Funcao que valida as colunas do cabecalho.
+    :param member: Membro do ZIP (None para arquivo solto).
+    :return: Dialeto detectado ou None se nenhum separador servir.
+    """
+    # A propria funcao entra na chave: lambdas distintas tem o mesmo nome.
+    key = _fingerprint(path, member) + (accept,)
+    with _CACHE_LOCK:
+        if key in _CACHE:
+            return _CACHE[key]
+    with open_source(path, member) as handle:
+        sample = handle.read(SAMPLE_BYTES)
+    dialect = _sniff_sample(sample, accept)
+    with _CACHE_LOCK:
+        _CACHE[key] = dialect
+    return dialect
+
+
+def encodings_for(dialect: CsvDialect) -> List[str]:
+    """
+    Retorna o encoding detectado seguido do fallback (erro apos a amostra).
+
+    :param dialect: Dialeto detectado.
+    :return: Lista de encodings a tentar, em ordem.
+    """
+    if dialect.encoding == FALLBACK_ENCODING:
+        return [FALLBACK_ENCODING]
+    return [dialect.encoding, FALLBACK_ENCODING]
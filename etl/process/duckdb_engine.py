@@ -0,0 +1,207 @@
+import importlib.util
+import shutil
+import tempfile
+from contextlib import closing, contextmanager
+from pathlib import Path
+from typing import IO, Collection, Iterator, Optional, Sequence, Tuple, Union
+
+import pandas as pd
+
+try:
+    from etl.process.csv_dialect import open_source
+    from etl.process.frame_io import PARQUET_SUFFIX
+except ModuleNotFoundError:
+    from csv_dialect import open_source
+    from frame_io import PARQUET_SUFFIX
+
+ENGINES = ("pandas", "duckdb")
+COPY_BLOCK = 4 * 1024 * 1024
+INVALID_ENCODING = "INVALID ENCODING"
+
+
+def duckdb_available() -> bool:
+    """
+    Indica se o duckdb (dependencia opcional do engine SQL) esta instalado.
+
+    :return: True se o engine "duckdb" puder ser usado.
+    """
+    return importlib.util.find_spec("duckdb") is not None
+
+
+def check_engine(engine: str) -> str:
+    """
+    Valida o nome do engine de execucao.
+
+    :param engine: "pandas" ou "duckdb".
+    :return: O proprio nome.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Engine desconhecido: {engine} (use {', '.join(ENGINES)})")
+    if engine == "duckdb" and not duckdb_available():
+        raise RuntimeError("DuckDB indisponivel: instale o pacote duckdb.")
+    return engine
+
+
+def _connect():
+    """
+    Abre um banco DuckDB em memoria (transborda para disco se preciso).
+
+    :return: Conexao DuckDB.
+    """
+    import duckdb
+
+    con = duckdb.connect()
+    con.execute("SET enable_progress_bar = false")
+    return con
+
+
+@contextmanager
+def _local_csv(
+    path: Path, member: Optional[str], filtered: Optional[IO[bytes]]
+) -> Iterator[Path]:
+    """
+    Entrega um arquivo local para o DuckDB, que nao le membros de ZIP.
+
+    :param path: Caminho do arquivo ou do ZIP.
+    :param member: Membro do ZIP (None para arquivo solto).
+    :param filtered: Linhas ja pre-filtradas (None para o arquivo inteiro).
+    :return: Caminho legivel pelo DuckDB.
+    """
+    if member is None and filtered is None:
+        yield path
+        return
+    with tempfile.TemporaryDirectory(prefix="ans_duckdb_") as tmp_dir:
+        local = Path(tmp_dir) / "dados.csv"
+        with open(local, "wb") as out:
+            if filtered is not None:
+                filtered.seek(0)
+                shutil.copyfileobj(filtered, out, COPY_BLOCK)
+            else:
+                with open_source(path, member) as handle:
+                    shutil.copyfileobj(handle, out, COPY_BLOCK)
+        yield local
+
+
+def scan_expense_rows(
+    path: Path,
+    member: Optional[str],
+    filtered: Optional[IO[bytes]],
+    sep: str,
+    encoding: str,
+    width: int,
+    columns: Tuple[int, int, int],
+    patterns: Sequence[str],
+    chunk_rows: int,
+) -> "pd.DataFrame":
+    """
+    Le um CSV/TXT com o DuckDB e devolve so as linhas de despesa com evento.
+
+    Como o pandas com usecols, completa linhas curtas com nulos e ignora
+    campos a mais. As linhas voltam na ordem do arquivo, com o numero do bloco
+    de chunk_rows linhas em que a leitura pandas as encontraria, para que as
+    chaves entrem no agregado na mesma ordem (e a saida seja identica).
+
+    :param path: Caminho do arquivo ou do ZIP.
+    :param member: Membro do ZIP (None para arquivo solto).
+    :param filtered: Linhas ja pre-filtradas (None para o arquivo inteiro).
+    :param sep: Separador detectado.
+    :param encoding: Encoding a usar.
+    :param width: Quantidade de colunas do cabecalho.
+    :param columns: Indices das colunas (REG_ANS, DESCRICAO, VL_SALDO_FINAL).
+    :param patterns: Expressoes que a descricao (minuscula) precisa conter.
+    :param chunk_rows: Linhas por bloco da leitura pandas.
+    :return: DataFrame com as colunas chunk, reg e valor (texto).
+    """
+    reg_idx, desc_idx, val_idx = columns
+    types = ", ".join(f"'c{idx}': 'VARCHAR'" for idx in range(width))
+    conditions = " AND ".join(
+        f"regexp_matches(lower(c{desc_idx}), ?)" for _ in patterns
+    )
+    query = f"""
+        WITH src AS (
+            SELECT row_number() OVER () - 1 AS rn, *
+            FROM read_csv(
+                ?, delim = ?, encoding = ?, header = true, auto_detect = false,
+                columns = {{{types}}}, quote = '"', escape = '"',
+                ignore_errors = true, null_padding = true, strict_mode = false,
+                store_rejects = true
+            )
+        )
+        SELECT rn // ? AS chunk, coalesce(c{reg_idx}, 'nan') AS reg,
+               c{val_idx} AS valor
+        FROM src
+        WHERE {conditions}
+    """
+    with _local_csv(path, member, filtered) as local, closing(_connect()) as con:
+        params = [str(local), sep, encoding, chunk_rows, *patterns]
+        rows = con.execute(query, params).df()
+        rejected = con.execute(
+            "SELECT count(*) FROM reject_errors WHERE error_type = ?",
+            [INVALID_ENCODING],
+        ).fetchone()[0]
+    if rejected:
+        # Mesmo contrato da leitura pandas: quem chama tenta o proximo encoding.
+        raise UnicodeDecodeError(encoding, b"", 0, 0, "byte invalido para o encoding")
+    return rows
+
+
+def _strip(column: str) -> str:
+    """
+    Expressao SQL que remove espacos nas pontas (como str.strip).
+
+    :param column: Coluna SQL.
+    :return: Expressao SQL.
+    """
+    return f"regexp_replace(coalesce(\"{column}\", ''), '^\\s+|\\s+$', '', 'g')"
+
+
+def scan_aggregate_rows(
+    source: Union[Path, "pd.DataFrame"],
+    keys: Sequence[str],
+    value_column: str,
+    quarters: Optional[Collection[Tuple[int, int]]] = None,
+) -> Tuple["pd.DataFrame", int]:
+    """
+    Le o enriquecido com o DuckDB e limpa as chaves.
+
+    Faz o mesmo que a preparacao em pandas (linhas sem chave descartadas) e
+    devolve o valor como veio, para a conversao exata em pandas (money.py).
+
+    :param source: Arquivo (CSV ou Parquet) ou DataFrame ja em memoria.
+    :param keys: Colunas de agrupamento.
+    :param value_column: Coluna do valor.
+    :param quarters: Trimestres (Ano, Trimestre) a ler; None le todos.
+    :return: Tupla (DataFrame com as chaves e o valor, linhas lidas).
+    """
+    with closing(_connect()) as con:
+        params = []
+        if isinstance(source, pd.DataFrame):
+            con.register("entrada", source)
+            scan = "entrada"
+        elif source.suffix.lower() == PARQUET_SUFFIX:
+            scan, params = "read_parquet(?)", [str(source)]
+        else:
+            # CSV intermediario: UTF-8 com BOM, "," e aspas duplas (to_csv).
+            scan = (
+                "read_csv(?, delim = ',', quote = '\"', escape = '\"', "
+                "header = true, all_varchar = true, encoding = 'utf-8')"
+            )
+            params = [str(source)]
+        where = ""
+        if quarters is not None:
+            codes = [ano * 10 + tri for ano, tri in quarters] or [-1]
+            where = (
+                'WHERE CAST("Ano" AS INTEGER) * 10 + CAST("Trimestre" AS INTEGER) '
+                f"IN ({', '.join('?' for _ in codes)})"
+            )
+            params = params + codes
+        con.execute(f"CREATE TEMP TABLE src AS SELECT * FROM {scan} {where}", params)
+        rows_in = con.execute("SELECT count(*) FROM src").fetchone()[0]
+        selected = ", ".join(f'{_strip(key)} AS "{key}"' for key in keys)
+        not_empty = " AND ".join(f"{_strip(key)} <> ''" for key in keys)
+        prepared = con.execute(f"""
+            SELECT {selected}, "{value_column}"
+            FROM src
+            WHERE {not_empty}
+            """).df()
+    return prepared, rows_in
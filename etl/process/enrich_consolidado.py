@@ -1,61 +1,79 @@
 from pathlib import Path
-from typing import Dict
+from typing import Iterable, Iterator, Optional, Tuple
 
 import pandas as pd
 
+try:
+    from etl.process.cadop_index import load_cadop_index
+    from etl.process.frame_io import append_csv, iter_frames, read_frame, write_frame
+except ModuleNotFoundError:
+    from cadop_index import load_cadop_index
+    from frame_io import append_csv, iter_frames, read_frame, write_frame
+
 
 INPUT_FILE = Path("data/output/consolidado_validado.csv")
 CADOP_PATH = Path("Relatorio_cadop.csv")
 OUTPUT_DIR = Path("data/output")
 OUTPUT_FILE = OUTPUT_DIR / "consolidado_enriquecido.csv"
 MISSING_FILE = OUTPUT_DIR / "inconsistencias_2_2.csv"
-CADOP_ENCODINGS = ["utf-8-sig", "utf-8", "latin-1"]
+# Campos do CADOP acrescentados ao consolidado (DataRegistroANS se existir).
+LOOKUP_COLUMNS = ["RegistroANS", "Modalidade", "UF", "DataRegistroANS"]
 
 
-def _load_cadop(path: Path) -> "pd.DataFrame":
+def load_cadop_lookup(path: Path = CADOP_PATH) -> "pd.DataFrame":
     """
-    Carrega o CADOP e normaliza colunas para join por CNPJ.
+    Retorna a tabela de consulta do CADOP indexada por CNPJ.
 
     :param path: Caminho do CADOP.
-    :return: DataFrame do CADOP normalizado.
+    :return: Campos de LOOKUP_COLUMNS com indice CNPJ.
+    """
+    by_cnpj = load_cadop_index(path).by_cnpj
+    return by_cnpj[[col for col in LOOKUP_COLUMNS if col in by_cnpj.columns]]
+
+
+def enrich_chunk(
+    consolidated_df: "pd.DataFrame", cadop_lookup: "pd.DataFrame"
+) -> Tuple["pd.DataFrame", "pd.DataFrame"]:
+    """
+    Consulta o CADOP para um bloco do consolidado validado.
+
+    :param consolidated_df: Bloco do consolidado validado.
+    :param cadop_lookup: Tabela de load_cadop_lookup.
+    :return: Tupla (enriquecido, sem correspondencia no CADOP).
+    """
+    consolidated_df = consolidated_df.copy()
+    consolidated_df["CNPJ"] = consolidated_df["CNPJ"].str.replace(r"\D", "", regex=True)
+    enriched_df = consolidated_df.join(cadop_lookup, on="CNPJ")
+    missing_df = enriched_df[enriched_df["RegistroANS"].isna()].copy()
+    return enriched_df, missing_df
+
+
+def enrich_frame(
+    consolidated_df: "pd.DataFrame", cadop_path: Path = CADOP_PATH
+) -> Tuple["pd.DataFrame", "pd.DataFrame"]:
+    """
+    Faz join com o CADOP em memoria.
+
+    :param consolidated_df: Consolidado validado.
+    :param cadop_path: Caminho do CADOP.
+    :return: Tupla (enriquecido, sem correspondencia no CADOP).
+    """
+    return enrich_chunk(consolidated_df, load_cadop_lookup(cadop_path))
+
+
+def iter_enrich(
+    chunks: Iterable["pd.DataFrame"], cadop_path: Path = CADOP_PATH
+) -> Iterator[Tuple["pd.DataFrame", "pd.DataFrame"]]:
+    """
+    Enriquece um consolidado em blocos, carregando o CADOP uma unica vez.
+
+    :param chunks: Blocos do consolidado validado.
+    :param cadop_path: Caminho do CADOP.
+    :return: Iterador de tuplas (enriquecido, sem correspondencia) por bloco.
     """
-    cadop_df = None
-    last_error = None
-    for enc in CADOP_ENCODINGS:
-        try:
-            cadop_df = pd.read_csv(path, sep=";", encoding=enc, dtype=str)
-            break
-        except Exception as exc:
-            last_error = exc
-            continue
-    if cadop_df is None:
-        raise ValueError(f"Falha ao ler CADOP: {last_error}")
-
-    cols = {c.lower().replace("_", ""): c for c in cadop_df.columns}
-    reg_col = cols.get("registrooperadora")
-    cnpj_col = cols.get("cnpj")
-    mod_col = cols.get("modalidade")
-    uf_col = cols.get("uf")
-    data_col = cols.get("dataregistroans")
-
-    if not reg_col or not cnpj_col or not mod_col or not uf_col:
-        raise ValueError("Colunas obrigatorias nao encontradas no CADOP.")
-
-    keep_cols = [reg_col, cnpj_col, mod_col, uf_col] + ([data_col] if data_col else [])
-    cadop_df = cadop_df[keep_cols].copy()
-    cadop_df.columns = ["RegistroANS", "CNPJ", "Modalidade", "UF"] + (
-        ["DataRegistroANS"] if data_col else []
-    )
-    cadop_df["CNPJ"] = cadop_df["CNPJ"].str.replace(r"\D", "", regex=True)
-
-    cadop_df = cadop_df.dropna(subset=["CNPJ"])
-    if "DataRegistroANS" in cadop_df.columns:
-        cadop_df["DataRegistroANS"] = pd.to_datetime(
-            cadop_df["DataRegistroANS"], errors="coerce"
-        )
-        cadop_df = cadop_df.sort_values("DataRegistroANS")
-    cadop_df = cadop_df.drop_duplicates(subset=["CNPJ"], keep="last")
-    return cadop_df
+    cadop_lookup = load_cadop_lookup(cadop_path)
+    for chunk in chunks:
+        yield enrich_chunk(chunk, cadop_lookup)
 
 
 def enrich(
@@ -63,26 +81,36 @@ def enrich(
     cadop_path: Path = CADOP_PATH,
     output_file: Path = OUTPUT_FILE,
     missing_file: Path = MISSING_FILE,
-) -> None:
+    chunk_rows: Optional[int] = None,
+) -> Tuple[int, int]:
     """
     Faz join com CADOP e salva o consolidado enriquecido.
 
-    :param input_file: CSV consolidado validado.
+    :param input_file: Consolidado validado (CSV ou Parquet).
     :param cadop_path: Caminho do CADOP.
-    :param output_file: CSV enriquecido de saida.
-    :param missing_file: CSV de inconsistencias.
-    :return: None.
+    :param output_file: Enriquecido de saida (CSV ou Parquet, pelo sufixo).
+    :param missing_file: Arquivo de inconsistencias (CSV ou Parquet, pelo sufixo).
+    :param chunk_rows: Linhas por bloco; se informado, processa em blocos
+        com memoria limitada (saidas apenas em CSV).
+    :return: Tupla (linhas enriquecidas, linhas sem correspondencia no CADOP).
     """
-    consolidated_df = pd.read_csv(input_file, dtype=str, encoding="utf-8-sig")
-    consolidated_df["CNPJ"] = consolidated_df["CNPJ"].str.replace(r"\D", "", regex=True)
-    cadop_df = _load_cadop(cadop_path)
-
-    enriched_df = consolidated_df.merge(cadop_df, on="CNPJ", how="left")
-    missing_df = enriched_df[enriched_df["RegistroANS"].isna()].copy()
-
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    enriched_df.to_csv(output_file, index=False, encoding="utf-8-sig")
-    missing_df.to_csv(missing_file, index=False, encoding="utf-8-sig")
+    if chunk_rows:
+        enriched_count = missing_count = 0
+        chunks = iter_frames(input_file, chunk_rows)
+        for index, (enriched_df, missing_df) in enumerate(
+            iter_enrich(chunks, cadop_path)
+        ):
+            append_csv(enriched_df, output_file, first=index == 0)
+            append_csv(missing_df, missing_file, first=index == 0)
+            enriched_count += len(enriched_df)
+            missing_count += len(missing_df)
+        return enriched_count, missing_count
+
+    enriched_df, missing_df = enrich_frame(read_frame(input_file), cadop_path)
+    write_frame(enriched_df, output_file)
+    write_frame(missing_df, missing_file)
+    return len(enriched_df), len(missing_df)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,188 @@
+import importlib.util
+from pathlib import Path
+from typing import Collection, Iterator, Optional, Tuple
+
+import pandas as pd
+
+try:
+    from etl.process.money import money_text
+except ModuleNotFoundError:
+    from money import money_text
+
+PARQUET_SUFFIX = ".parquet"
+CSV_ENCODING = "utf-8-sig"
+INT_COLUMNS = ("Trimestre", "Ano")
+# Inteiros em 1/MONEY_SCALE entre as etapas; texto com 5 casas so no CSV.
+MONEY_COLUMNS = ("ValorDespesas",)
+
+
+def parquet_available() -> bool:
+    """
+    Indica se o pyarrow (dependencia opcional do Parquet) esta instalado.
+
+    :return: True se for possivel ler/gravar Parquet.
+    """
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def _is_parquet(path: Path) -> bool:
+    """
+    Decide o formato pelo sufixo do arquivo.
+
+    :param path: Caminho do arquivo.
+    :return: True se for Parquet.
+    """
+    return path.suffix.lower() == PARQUET_SUFFIX
+
+
+def read_frame(path: Path) -> "pd.DataFrame":
+    """
+    Le um arquivo intermediario: Parquet tipado ou CSV (tudo como texto).
+
+    :param path: Caminho do arquivo.
+    :return: DataFrame lido.
+    """
+    if _is_parquet(path):
+        return pd.read_parquet(path)
+    return pd.read_csv(path, dtype=str, encoding=CSV_ENCODING)
+
+
+def quarter_mask(
+    df: "pd.DataFrame", quarters: Collection[Tuple[int, int]]
+) -> "pd.Series":
+    """
+    Marca as linhas dos trimestres informados.
+
+    :param df: DataFrame com Ano e Trimestre (texto ou inteiros).
+    :param quarters: Trimestres (Ano, Trimestre).
+    :return: Serie booleana alinhada ao DataFrame.
+    """
+    codes = df["Ano"].astype(int) * 10 + df["Trimestre"].astype(int)
+    return codes.isin([ano * 10 + tri for ano, tri in quarters])
+
+
+def read_quarters(
+    path: Path, quarters: Optional[Collection[Tuple[int, int]]] = None
+) -> "pd.DataFrame":
+    """
+    Le um arquivo intermediario so com as linhas de alguns trimestres.
+
+    No Parquet o filtro vai para a leitura (pyarrow); o CSV e lido e filtrado.
+
+    :param path: Caminho do arquivo.
+    :param quarters: Trimestres (Ano, Trimestre) a ler; None le todos.
+    :return: DataFrame lido.
+    """
+    if quarters is None:
+        return read_frame(path)
+    if _is_parquet(path) and quarters:
+        filters = [
+            [("Ano", "==", ano), ("Trimestre", "==", tri)]
+            for ano, tri in sorted(quarters)
+        ]
+        return pd.read_parquet(path, filters=filters)
+    df = read_frame(path)
+    return df[quarter_mask(df, quarters)] if len(df) else df
+
+
+def iter_frames(path: Path, chunk_rows: int) -> Iterator["pd.DataFrame"]:
+    """
+    Le um arquivo intermediario em blocos de ate chunk_rows linhas.
+
+    Sempre produz ao menos um bloco (vazio, so com as colunas, se o arquivo
+    nao tiver linhas).
+
+    :param path: Caminho do arquivo (CSV ou Parquet).
+    :param chunk_rows: Linhas por bloco.
+    :return: Iterador de DataFrames.
+    """
+    if not _is_parquet(path):
+        yield from pd.read_csv(
+            path, dtype=str, encoding=CSV_ENCODING, chunksize=chunk_rows
+        )
+        return
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(path)
+    empty = True
+    for batch in parquet_file.iter_batches(batch_size=chunk_rows):
+        empty = False
+        yield batch.to_pandas()
+    if empty:
+        yield parquet_file.schema_arrow.empty_table().to_pandas()
+
+
+def _csv_ready(df: "pd.DataFrame") -> "pd.DataFrame":
+    """
+    Formata as colunas monetarias inteiras como texto com 5 casas.
+
+    :param df: DataFrame a gravar em CSV.
+    :return: O proprio DataFrame ou uma copia com o texto.
+    """
+    money = [
+        col
+        for col in MONEY_COLUMNS
+        if col in df.columns and pd.api.types.is_integer_dtype(df[col].dtype)
+    ]
+    if not money:
+        return df
+    return df.assign(**{col: money_text(df[col]) for col in money})
+
+
+def write_frame(df: "pd.DataFrame", path: Path) -> Path:
+    """
+    Grava um DataFrame no formato indicado pelo sufixo (Parquet ou CSV).
+
+    No Parquet, Trimestre e Ano viram inteiros e ValorDespesas fica como
+    veio (inteiro em 1/MONEY_SCALE quando vem do consolidado, ver money.py);
+    no CSV o valor inteiro sai como texto com 5 casas.
+
+    :param df: DataFrame a gravar.
+    :param path: Caminho de destino.
+    :return: Caminho de destino.
+    """
+    if not _is_parquet(path):
+        _csv_ready(df).to_csv(path, index=False, encoding=CSV_ENCODING)
+        return path
+    if not parquet_available():
+        raise RuntimeError("Parquet indisponivel: instale o pacote pyarrow.")
+    typed = df.copy()
+    for col in INT_COLUMNS:
+        if col in typed.columns:
+            typed[col] = pd.to_numeric(typed[col], errors="coerce").astype("Int64")
+    typed.to_parquet(path, index=False)
+    return path
+
+
+def append_csv(df: "pd.DataFrame", path: Path, first: bool) -> Path:
+    """
+    Grava um bloco de um CSV de saida escrito em partes.
+
+    O primeiro bloco cria o arquivo com BOM e cabecalho; os demais sao
+    anexados sem cabecalho.
+
+    :param df: Bloco a gravar.
+    :param path: CSV de destino.
+    :param first: True no primeiro bloco.
+    :return: Caminho de destino.
+    """
+    if _is_parquet(path):
+        raise ValueError("Gravacao em blocos suporta apenas CSV.")
+    if first:
+        return write_frame(df, path)
+    _csv_ready(df).to_csv(path, mode="a", header=False, index=False, encoding="utf-8")
+    return path
+
+
+def export_csv(source: Path, dest: Path) -> Path:
+    """
+    Converte um intermediario em CSV de entrega (UTF-8 com BOM).
+
+    :param source: Arquivo intermediario.
+    :param dest: CSV de destino.
+    :return: Caminho do CSV.
+    """
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    if source.resolve() == dest.resolve():
+        return dest
+    return write_frame(read_frame(source), dest)
@@ -0,0 +1,125 @@
+import io
+import mmap
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+import numpy as np
+
+try:
+    from etl.process.csv_dialect import open_source
+except ModuleNotFoundError:
+    from csv_dialect import open_source
+
+
+WINDOW_BYTES = 64 * 1024 * 1024
+KEYWORD = b"despesa"
+RARE_KEYWORDS = (b"evento", b"sinistro")
+QUOTE = ord('"')
+NEWLINE = ord("\n")
+
+
+def _iter_windows(path: Path, member: Optional[str]) -> Iterator[bytes]:
+    """
+    Le o arquivo em janelas grandes que terminam sempre em fim de linha.
+
+    Arquivo solto e mapeado em memoria (mmap); membro de ZIP e lido em blocos.
+
+    :param path: Caminho do arquivo ou do ZIP.
+    :param member: Membro do ZIP (None para arquivo solto).
+    :return: Iterador de janelas com linhas completas.
+    """
+    if member is None:
+        with open(path, "rb") as handle:
+            if path.stat().st_size == 0:
+                return
+            with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                start = 0
+                size = len(data)
+                while start < size:
+                    end = min(start + WINDOW_BYTES, size)
+                    if end < size:
+                        cut = data.rfind(b"\n", start, end)
+                        end = cut + 1 if cut >= start else size
+                    yield data[start:end]
+                    start = end
+        return
+    with open_source(path, member) as handle:
+        pending = b""
+        while True:
+            block = handle.read(WINDOW_BYTES)
+            if not block:
+                if pending:
+                    yield pending
+                return
+            pending += block
+            cut = pending.rfind(b"\n")
+            if cut < 0:
+                continue
+            yield pending[: cut + 1]
+            pending = pending[cut + 1 :]
+
+
+def _has_open_quote(window: bytes) -> bool:
+    """
+    Indica se alguma linha termina com aspas abertas (campo com quebra de linha).
+
+    :param window: Janela com linhas completas.
+    :return: True se o filtro por linha fisica nao e seguro.
+    """
+    data = np.frombuffer(window, dtype=np.uint8)
+    parity = np.logical_xor.accumulate(data == QUOTE)
+    return bool(parity[data == NEWLINE].any())
+
+
+def _matching_lines(window: bytes) -> List[bytes]:
+    """
+    Seleciona as linhas que contem "despesa" e "evento" ou "sinistro".
+
+    Procura primeiro as palavras raras e so entao delimita a linha, para nao
+    percorrer em Python as linhas que nao interessam.
+
+    :param window: Janela com linhas completas.
+    :return: Linhas encontradas, na ordem do arquivo.
+    """
+    lowered = window.lower()
+    spans = set()
+    for keyword in RARE_KEYWORDS:
+        pos = lowered.find(keyword)
+        while pos >= 0:
+            start = lowered.rfind(b"\n", 0, pos) + 1
+            end = lowered.find(b"\n", pos)
+            end = len(lowered) if end < 0 else end + 1
+            if KEYWORD in lowered[start:end]:
+                spans.add((start, end))
+            pos = lowered.find(keyword, end)
+    return [window[start:end] for start, end in sorted(spans)]
+
+
+def prefilter_lines(path: Path, member: Optional[str] = None) -> Optional[io.BytesIO]:
+    """
+    Copia so o cabecalho e as linhas com as palavras-chave de despesa de evento.
+
+    A busca e nos bytes com letras ASCII minusculas, entao vale para UTF-8 e
+    latin-1 sem decodificar. E um superconjunto do filtro real (que continua
+    sendo aplicado depois): a linha precisa conter "despesa" e "evento" ou
+    "sinistro" em qualquer coluna.
+
+    :param path: Caminho do arquivo ou do ZIP.
+    :param member: Membro do ZIP (None para arquivo solto).
+    :return: Buffer com as linhas filtradas ou None se houver campo com
+        quebra de linha (o arquivo deve ser lido inteiro).
+    """
+    output = io.BytesIO()
+    header_done = False
+    for window in _iter_windows(path, member):
+        if b'"' in window and _has_open_quote(window):
+            return None
+        if not header_done:
+            cut = window.find(b"\n") + 1 or len(window)
+            output.write(window[:cut])
+            window = window[cut:]
+            header_done = True
+        for line in _matching_lines(window):
+            output.write(line)
+    output.seek(0)
+    return output
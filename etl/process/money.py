@@ -0,0 +1,232 @@
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Valores monetarios em inteiros de 1/MONEY_SCALE (mesma escala do numeric(18,5)).
+MONEY_SCALE = 100_000
+MONEY_DECIMALS = 5
+MONEY_DTYPE = "Int64"
+# numeric(18,5): ate 13 digitos na parte inteira.
+MAX_INT_DIGITS = 13
+MONEY_LIMIT = 10 ** (MAX_INT_DIGITS + MONEY_DECIMALS)
+
+_MINUS, _PLUS, _COMMA, _DOT = (ord(char) for char in "-+,.")
+_ZERO, _NINE = ord("0"), ord("9")
+_QUANTUM = Decimal(1).scaleb(-MONEY_DECIMALS)
+
+
+def _normalize_text(text: str) -> str:
+    """
+    Aplica a regra de separadores: com virgula, pontos sao milhar.
+
+    :param text: Valor original, sem espacos nas pontas.
+    :return: Texto com ponto decimal.
+    """
+    if "," in text:
+        return text.replace(".", "").replace(",", ".")
+    return text
+
+
+def parse_money_value(value: object) -> Optional[int]:
+    """
+    Converte um valor isolado para inteiro escalado (versao linha a linha).
+
+    Aceita "1.234,56" e "1234.56"; arredonda na 5a casa (metade para longe
+    do zero, como o numeric do Postgres). Texto vazio, ilegivel ou fora da
+    faixa do numeric(18,5) vira 0; nulos (e "nan"/"inf") viram None.
+
+    :param value: Valor original (texto ou numero).
+    :return: Valor em 1/MONEY_SCALE ou None.
+    """
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    text = _normalize_text(str(value).strip())
+    if not text:
+        return 0
+    try:
+        number = Decimal(text)
+    except InvalidOperation:
+        return 0
+    if not number.is_finite():
+        return None
+    if number.adjusted() >= MAX_INT_DIGITS:
+        return 0
+    scaled = int(
+        number.quantize(_QUANTUM, rounding=ROUND_HALF_UP).scaleb(MONEY_DECIMALS)
+    )
+    return scaled if abs(scaled) < MONEY_LIMIT else 0
+
+
+def _parse_plain(raw: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    Caminho rapido para texto ja no formato do float() (ex.: "1234.5").
+
+    O float so serve de atalho: a linha so e aceita se o valor escalado cair
+    a menos de meia unidade de um inteiro mesmo somando o erro maximo do
+    double (|x| * 2^-50), e entao esse inteiro e exatamente o arredondamento
+    do texto. As demais linhas ficam para o caminho exato.
+
+    :param raw: Valores originais (object), sem nulos.
+    :return: Tupla (valores em 1/MONEY_SCALE, mascara das linhas resolvidas).
+    """
+    try:
+        number = raw.astype(np.float64)
+    except (TypeError, ValueError, OverflowError):
+        return np.zeros(len(raw), dtype=np.int64), np.zeros(len(raw), dtype=bool)
+    with np.errstate(invalid="ignore", over="ignore"):
+        scaled = number * MONEY_SCALE
+        rounded = np.rint(scaled)
+        error = np.abs(scaled - rounded) + np.abs(scaled) * 2.0**-50
+        exact = np.isfinite(scaled) & (error < 0.5) & (np.abs(rounded) < MONEY_LIMIT)
+    return np.where(exact, rounded, 0).astype(np.int64), exact
+
+
+def _parse_text(raw: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    Caminho exato: digitos, sinal e separadores resolvidos coluna a coluna na
+    matriz de caracteres; so o que sobra (espacos, expoente, digitos
+    Unicode...) vai linha a linha pelo parse_money_value.
+
+    :param raw: Valores originais (object), sem nulos.
+    :return: Tupla (valores em 1/MONEY_SCALE, mascara de "nan"/"inf").
+    """
+    # Matriz linhas x largura com o codigo de cada caractere (0 no preenchimento).
+    text = raw.astype(str)
+    codes = text.view(np.uint32).reshape(len(text), -1)
+    length = (codes != 0).sum(axis=1)
+    columns = np.arange(codes.shape[1])
+    inside = columns < length[:, None]
+
+    negative = codes[:, 0] == _MINUS
+    start = (negative | (codes[:, 0] == _PLUS)).astype(np.int64)
+    body = inside & (columns >= start[:, None])
+    comma = (codes == _COMMA).any(axis=1)
+    sep = np.where(comma, _COMMA, _DOT)
+    is_sep = body & (codes == sep[:, None])
+    thousands = body & comma[:, None] & (codes == _DOT)
+    is_digit = body & (codes >= _ZERO) & (codes <= _NINE)
+
+    # Posicao do separador decimal (o fim do texto se nao houver).
+    has_sep = is_sep.any(axis=1)
+    point = np.where(has_sep, is_sep.argmax(axis=1), length)
+    int_digit = is_digit & (columns < point[:, None])
+    frac_pos = columns - point[:, None]
+    frac_digit = is_digit & (frac_pos >= 1) & (frac_pos <= MONEY_DECIMALS)
+
+    simple = (body == (is_digit | is_sep | thousands)).all(axis=1)
+    # Ponto de milhar depois da virgula junta casas decimais: fica com o lento.
+    simple &= ~(thousands & (columns > point[:, None])).any(axis=1)
+    simple &= int_digit.sum(axis=1) <= MAX_INT_DIGITS
+    invalid = simple & ((is_sep.sum(axis=1) > 1) | ~is_digit.any(axis=1))
+
+    digits = codes.astype(np.int64) - _ZERO
+    value = np.zeros(len(text), dtype=np.int64)
+    for take, digit in zip((int_digit | frac_digit).T, digits.T):
+        np.multiply(value, 10, out=value, where=take)
+        np.add(value, digit, out=value, where=take)
+    decimals = np.clip(length - 1 - point, 0, MONEY_DECIMALS)
+    value *= 10 ** (MONEY_DECIMALS - decimals)
+    # 6a casa decide o arredondamento (metade para longe do zero).
+    round_col = point + MONEY_DECIMALS + 1
+    round_at = np.minimum(round_col, codes.shape[1] - 1)
+    round_digit = digits[np.arange(len(text)), round_at]
+    value += (round_col < length) & (round_digit >= 5)
+    value = np.where(negative, -value, value)
+    # O arredondamento pode passar do limite (ex.: "9999999999999.999995").
+    value[invalid | (np.abs(value) >= MONEY_LIMIT)] = 0
+
+    nan = np.zeros(len(text), dtype=bool)
+    for row in np.flatnonzero(~simple):
+        parsed = parse_money_value(raw[row])
+        nan[row] = parsed is None
+        value[row] = parsed or 0
+    return value, nan
+
+
+def parse_money(series: "pd.Series") -> "pd.Series":
+    """
+    Converte uma coluna monetaria para inteiros escalados (resultado exato,
+    igual ao do parse_money_value linha a linha).
+
+    :param series: Coluna de texto (ou numerica, vinda do Parquet).
+    :return: Serie Int64 em 1/MONEY_SCALE, com nulos onde o valor e nulo.
+    """
+    result = np.zeros(len(series), dtype=np.int64)
+    null = series.isna().to_numpy()
+    rows = np.flatnonzero(~null)
+    raw = series.to_numpy(dtype=object)[rows]
+
+    values, done = _parse_plain(raw)
+    result[rows[done]] = values[done]
+    pending = rows[~done]
+    if len(pending):
+        values, nan = _parse_text(raw[~done])
+        result[pending] = values
+        null[pending[nan]] = True
+    money = pd.Series(pd.array(result, dtype=MONEY_DTYPE), index=series.index)
+    return money.mask(null)
+
+
+def format_money(values: "np.ndarray") -> "np.ndarray":
+    """
+    Formata inteiros escalados com 5 casas, sem passar por float.
+
+    :param values: Valores em 1/MONEY_SCALE (int64).
+    :return: Array de strings (ex.: "-1234.50000").
+    """
+    values = np.asarray(values, dtype=np.int64)
+    if not len(values):
+        return np.array([], dtype=object)
+    whole, frac = np.divmod(np.abs(values), MONEY_SCALE)
+    sign = np.where(values < 0, "-", "")
+    text = np.char.add(sign, np.char.mod("%d", whole))
+    text = np.char.add(text, ".")
+    text = np.char.add(text, np.char.zfill(np.char.mod("%d", frac), MONEY_DECIMALS))
+    return text.astype(object)
+
+
+def to_money(series: "pd.Series") -> "pd.Series":
+    """
+    Valores em 1/MONEY_SCALE: inteiros (ja escalados, ex.: Parquet ou
+    consolidado em memoria) passam direto; texto vai para parse_money.
+
+    :param series: Valores tipados ou originais.
+    :return: Serie Int64 em 1/MONEY_SCALE.
+    """
+    if pd.api.types.is_integer_dtype(series.dtype):
+        return series.astype(MONEY_DTYPE)
+    return parse_money(series)
+
+
+def money_text(series: "pd.Series") -> "pd.Series":
+    """
+    Texto com 5 casas para CSV; series que nao sao inteiras voltam como estao.
+
+    :param series: Valores em 1/MONEY_SCALE (Int64) ou ja em texto.
+    :return: Serie de texto, com nulos onde o valor e nulo.
+    """
+    if not pd.api.types.is_integer_dtype(series.dtype):
+        return series
+    values = series.astype(MONEY_DTYPE)
+    valid = values.notna().to_numpy()
+    text = np.full(len(values), None, dtype=object)
+    text[valid] = format_money(values.to_numpy(np.int64, na_value=0)[valid])
+    return pd.Series(text, index=series.index, name=series.name)
+
+
+def money_mean(total: "np.ndarray", count: "np.ndarray") -> "np.ndarray":
+    """
+    Media inteira (total / count) arredondada na 5a casa, metade para longe
+    do zero.
+
+    :param total: Somas em 1/MONEY_SCALE.
+    :param count: Quantidades (maiores que zero).
+    :return: Medias em 1/MONEY_SCALE (int64).
+    """
+    total = np.asarray(total, dtype=np.int64)
+    count = np.asarray(count, dtype=np.int64)
+    whole, rest = np.divmod(np.abs(total), count)
+    whole += 2 * rest >= count
+    return np.where(total < 0, -whole, whole)
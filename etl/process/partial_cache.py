@@ -0,0 +1,148 @@
+import gzip
+import hashlib
+import json
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+DEFAULT_CACHE_DIR = Path("data/cache/partials")
+INDEX_NAME = "digests.json"
+PARTIAL_SUFFIX = ".json.gz"
+HASH_CHUNK = 1024 * 1024
+# Incrementar quando a regra de consolidacao mudar (invalida os parciais).
+CACHE_VERSION = 2
+
+# Totais em inteiros de 1/100000 (ver money.py).
+Partial = Dict[Tuple[str, int, int], int]
+
+_LOCK = threading.Lock()
+
+
+def _file_sha256(path: Path) -> str:
+    """
+    Calcula o SHA-256 de um arquivo em blocos.
+
+    :param path: Caminho do arquivo.
+    :return: Hash hexadecimal.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(HASH_CHUNK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _load_index(cache_dir: Path) -> Dict[str, Dict]:
+    """
+    Le o indice caminho -> (tamanho, mtime, hash), vazio se ausente ou corrompido.
+
+    :param cache_dir: Diretorio do cache.
+    :return: Mapa caminho -> entrada.
+    """
+    path = cache_dir / INDEX_NAME
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def source_digest(path: Path, cache_dir: Path = DEFAULT_CACHE_DIR) -> str:
+    """
+    Retorna o SHA-256 do arquivo de origem, reaproveitando o hash se o arquivo
+    nao mudou de tamanho nem de mtime.
+
+    :param path: Caminho do ZIP (ou arquivo solto).
+    :param cache_dir: Diretorio do cache.
+    :return: Hash hexadecimal do conteudo.
+    """
+    stat = path.stat()
+    key = str(path.resolve())
+    with _LOCK:
+        entry = _load_index(cache_dir).get(key)
+    if (
+        entry
+        and entry["size"] == stat.st_size
+        and entry["mtime_ns"] == stat.st_mtime_ns
+    ):
+        return entry["sha256"]
+
+    digest = _file_sha256(path)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    with _LOCK:
+        index = _load_index(cache_dir)
+        index[key] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": digest,
+        }
+        tmp = cache_dir / (INDEX_NAME + ".tmp")
+        tmp.write_text(json.dumps(index, indent=2, sort_keys=True), encoding="utf-8")
+        tmp.replace(cache_dir / INDEX_NAME)
+    return digest
+
+
+def _partial_path(cache_dir: Path, digest: str, ano: int, tri: int) -> Path:
+    """
+    Retorna o arquivo do parcial de um trimestre de uma origem.
+
+    :param cache_dir: Diretorio do cache.
+    :param digest: SHA-256 da origem.
+    :param ano: Ano do trimestre.
+    :param tri: Numero do trimestre.
+    :return: Caminho do parcial.
+    """
+    name = f"{digest}_{ano}_{tri}_v{CACHE_VERSION}{PARTIAL_SUFFIX}"
+    return cache_dir / digest[:2] / name
+
+
+def load_partial(
+    digest: str, ano: int, tri: int, cache_dir: Path = DEFAULT_CACHE_DIR
+) -> Optional[Partial]:
+    """
+    Carrega o agregado parcial em cache, se existir.
+
+    :param digest: SHA-256 da origem.
+    :param ano: Ano do trimestre.
+    :param tri: Numero do trimestre.
+    :param cache_dir: Diretorio do cache.
+    :return: Agregado parcial ou None.
+    """
+    path = _partial_path(cache_dir, digest, ano, tri)
+    if not path.exists():
+        return None
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as handle:
+            rows = json.load(handle)
+    except (OSError, ValueError):
+        return None
+    return {(reg, int(a), int(t)): int(total) for reg, a, t, total in rows}
+
+
+def save_partial(
+    digest: str,
+    ano: int,
+    tri: int,
+    partial: Partial,
+    cache_dir: Path = DEFAULT_CACHE_DIR,
+) -> None:
+    """
+    Grava o agregado parcial de forma atomica (arquivo temporario + replace).
+
+    Os totais sao inteiros, que o JSON grava e le sem perda.
+
+    :param digest: SHA-256 da origem.
+    :param ano: Ano do trimestre.
+    :param tri: Numero do trimestre.
+    :param partial: Agregado parcial.
+    :param cache_dir: Diretorio do cache.
+    :return: None.
+    """
+    path = _partial_path(cache_dir, digest, ano, tri)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    rows = [[reg, a, t, total] for (reg, a, t), total in partial.items()]
+    tmp = path.with_name(path.name + ".tmp")
+    with gzip.open(tmp, "wt", encoding="utf-8") as handle:
+        json.dump(rows, handle, separators=(",", ":"))
+    tmp.replace(path)
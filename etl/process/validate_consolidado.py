@@ -1,9 +1,34 @@
-import re
 from pathlib import Path
-from typing import List
+from typing import Iterable, Iterator, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 
+try:
+    from etl.process.frame_io import append_csv, iter_frames, read_frame, write_frame
+    from etl.process.money import to_money
+    from etl.process.validation_rules import (
+        Rule,
+        RuleStats,
+        apply_rules,
+        decode_reasons,
+        normalize_cnpjs,
+        register,
+        valid_cnpj_mask,
+    )
+except ModuleNotFoundError:
+    from frame_io import append_csv, iter_frames, read_frame, write_frame
+    from money import to_money
+    from validation_rules import (
+        Rule,
+        RuleStats,
+        apply_rules,
+        decode_reasons,
+        normalize_cnpjs,
+        register,
+        valid_cnpj_mask,
+    )
+
 
 INPUT_FILE = Path("data/output/consolidado_despesas.csv")
 OUTPUT_DIR = Path("data/output")
@@ -11,128 +36,133 @@ VALID_FILE = OUTPUT_DIR / "consolidado_validado.csv"
 INVALID_FILE = OUTPUT_DIR / "inconsistencias_2_1.csv"
 
 
-def _only_digits(value: object) -> str:
+# Regras na ordem em que aparecem na coluna Motivo. Cada uma e uma mascara
+# vetorizada sobre o bloco preparado (ver _prepare); todas rodam na mesma
+# passada, e uma regra nova e so mais uma funcao registrada aqui.
+RULES: List[Rule] = []
+
+
+@register(RULES, "CNPJ_INVALIDO")
+def _cnpj_invalido(consolidated_df: "pd.DataFrame") -> "np.ndarray":
+    """
+    CNPJ sem 14 digitos ou com digitos verificadores errados.
+
+    :param consolidated_df: Bloco preparado.
+    :return: Mascara das linhas invalidas.
+    """
+    return ~valid_cnpj_mask(consolidated_df["CNPJ"])
+
+
+@register(RULES, "RAZAO_SOCIAL_VAZIA")
+def _razao_social_vazia(consolidated_df: "pd.DataFrame") -> "np.ndarray":
+    """
+    RazaoSocial vazia ou so com espacos.
+
+    :param consolidated_df: Bloco preparado.
+    :return: Mascara das linhas invalidas.
     """
-    Retorna apenas os digitos de um valor.
+    return consolidated_df["RazaoSocial"].str.strip().eq("").to_numpy()
 
-    :param value: Valor original.
-    :return: String apenas com digitos.
+
+@register(RULES, "VALOR_NAO_POSITIVO")
+def _valor_nao_positivo(consolidated_df: "pd.DataFrame") -> "np.ndarray":
+    """
+    Valor de despesas zero, negativo ou ilegivel.
+
+    :param consolidated_df: Bloco preparado.
+    :return: Mascara das linhas invalidas.
     """
-    if value is None:
-        return ""
-    return re.sub(r"\D", "", str(value))
+    # Nulo conta como 0 (invalido).
+    values = consolidated_df["ValorDespesas_num"].to_numpy(np.int64, na_value=0)
+    return values <= 0
 
 
-def _cnpj_is_valid(value: object) -> bool:
+def _prepare(consolidated_df: "pd.DataFrame") -> "pd.DataFrame":
     """
-    Valida CNPJ usando digitos verificadores.
+    Normaliza CNPJ e RazaoSocial e converte o valor para as regras.
 
-    :param value: Valor do CNPJ.
-    :return: True se valido.
+    :param consolidated_df: Consolidado (texto do CSV ou colunas tipadas).
+    :return: Copia com a coluna auxiliar ValorDespesas_num (ver money.py).
     """
-    digits = _only_digits(value)
-    if len(digits) != 14:
-        return False
-    if digits == digits[0] * 14:
-        return False
-
-    def _calc_digit(base: str, weights: List[int]) -> str:
-        """
-        Calcula um digito verificador do CNPJ com pesos informados.
-
-        :param base: Base numerica.
-        :param weights: Pesos de calculo.
-        :return: Digito verificador.
-        """
-        total = sum(int(d) * w for d, w in zip(base, weights))
-        mod = total % 11
-        return "0" if mod < 2 else str(11 - mod)
-
-    d1 = _calc_digit(digits[:12], [5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
-    d2 = _calc_digit(digits[:12] + d1, [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
-    return digits[-2:] == d1 + d2
-
-
-def _parse_valor(value: object) -> float:
+    consolidated_df = consolidated_df.copy()
+    consolidated_df["CNPJ"] = normalize_cnpjs(consolidated_df["CNPJ"])
+    consolidated_df["RazaoSocial"] = (
+        consolidated_df["RazaoSocial"].fillna("").astype(str)
+    )
+    consolidated_df["ValorDespesas_num"] = to_money(consolidated_df["ValorDespesas"])
+    return consolidated_df
+
+
+def validate_frame(
+    consolidated_df: "pd.DataFrame",
+    stats: Optional[RuleStats] = None,
+) -> Tuple["pd.DataFrame", "pd.DataFrame"]:
     """
-    Converte valor monetario tratando separadores decimais.
+    Valida o consolidado em memoria e separa validos e invalidos.
 
-    :param value: Valor original.
-    :return: Valor convertido.
+    :param consolidated_df: Consolidado (texto do CSV ou colunas tipadas).
+    :param stats: Estatisticas por regra a atualizar (opcional).
+    :return: Tupla (validos, inconsistencias com a coluna Motivo).
     """
-    if value is None:
-        return 0.0
-    text = str(value).strip()
-    if not text:
-        return 0.0
-    if "," in text and "." in text:
-        text = text.replace(".", "").replace(",", ".")
-    elif "," in text:
-        text = text.replace(",", ".")
-    try:
-        return float(text)
-    except ValueError:
-        return 0.0
-
-
-def _append_reason(base: "pd.Series", reason: str, mask: "pd.Series") -> "pd.Series":
+    consolidated_df = _prepare(consolidated_df)
+    flags = apply_rules(RULES, consolidated_df, stats)
+    failed = flags != 0
+
+    consolidated_df = consolidated_df.drop(columns=["ValorDespesas_num"])
+    invalid = consolidated_df[failed].copy()
+    # So as linhas invalidas viram texto.
+    invalid["Motivo"] = decode_reasons(RULES, flags[failed])
+    return consolidated_df[~failed].copy(), invalid
+
+
+def iter_validate(
+    chunks: Iterable["pd.DataFrame"],
+    stats: Optional[RuleStats] = None,
+) -> Iterator[Tuple["pd.DataFrame", "pd.DataFrame"]]:
     """
-    Anexa um motivo ao texto base quando a mascara e verdadeira.
+    Valida um consolidado em blocos; as regras sao locais a cada linha.
 
-    :param base: Serie com motivos atuais.
-    :param reason: Motivo a adicionar.
-    :param mask: Mascara booleana onde o motivo se aplica.
-    :return: Serie atualizada.
+    :param chunks: Blocos do consolidado.
+    :param stats: Estatisticas por regra, somadas entre os blocos (opcional).
+    :return: Iterador de tuplas (validos, inconsistencias) por bloco.
     """
-    updated = base.copy()
-    to_update = mask & base.eq("")
-    to_append = mask & base.ne("")
-    updated.loc[to_update] = reason
-    updated.loc[to_append] = updated.loc[to_append] + ";" + reason
-    return updated
+    for chunk in chunks:
+        yield validate_frame(chunk, stats)
 
 
 def validate(
     input_file: Path = INPUT_FILE,
     valid_file: Path = VALID_FILE,
     invalid_file: Path = INVALID_FILE,
-) -> None:
+    chunk_rows: Optional[int] = None,
+    stats: Optional[RuleStats] = None,
+) -> Tuple[int, int]:
     """
     Valida o consolidado e separa saida valida e invalida.
 
-    :param input_file: CSV consolidado de entrada.
-    :param valid_file: CSV de validos.
-    :param invalid_file: CSV de inconsistencias.
-    :return: None.
+    :param input_file: Consolidado de entrada (CSV ou Parquet).
+    :param valid_file: Arquivo de validos (CSV ou Parquet, pelo sufixo).
+    :param invalid_file: Arquivo de inconsistencias (CSV ou Parquet, pelo sufixo).
+    :param chunk_rows: Linhas por bloco; se informado, processa em blocos
+        com memoria limitada (saidas apenas em CSV).
+    :param stats: Estatisticas por regra a atualizar (opcional).
+    :return: Tupla (linhas validas, linhas invalidas).
     """
-    consolidated_df = pd.read_csv(input_file, dtype=str, encoding="utf-8-sig")
-    consolidated_df["CNPJ"] = consolidated_df["CNPJ"].map(_only_digits)
-    consolidated_df["RazaoSocial"] = (
-        consolidated_df["RazaoSocial"].fillna("").astype(str)
-    )
-    consolidated_df["ValorDespesas_num"] = consolidated_df["ValorDespesas"].map(
-        _parse_valor
-    )
-
-    cnpj_valid = consolidated_df["CNPJ"].map(_cnpj_is_valid)
-    razao_ok = consolidated_df["RazaoSocial"].str.strip().ne("")
-    valor_ok = consolidated_df["ValorDespesas_num"] > 0
-
-    motivo = pd.Series("", index=consolidated_df.index)
-    motivo = _append_reason(motivo, "CNPJ_INVALIDO", ~cnpj_valid)
-    motivo = _append_reason(motivo, "RAZAO_SOCIAL_VAZIA", ~razao_ok)
-    motivo = _append_reason(motivo, "VALOR_NAO_POSITIVO", ~valor_ok)
-    consolidated_df["Motivo"] = motivo
-    invalid = consolidated_df[consolidated_df["Motivo"] != ""].copy()
-    valid = consolidated_df[consolidated_df["Motivo"] == ""].copy()
-
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    valid.drop(columns=["ValorDespesas_num", "Motivo"]).to_csv(
-        valid_file, index=False, encoding="utf-8-sig"
-    )
-    invalid.drop(columns=["ValorDespesas_num"]).to_csv(
-        invalid_file, index=False, encoding="utf-8-sig"
-    )
+    if chunk_rows:
+        valid_count = invalid_count = 0
+        chunks = iter_frames(input_file, chunk_rows)
+        for index, (valid, invalid) in enumerate(iter_validate(chunks, stats)):
+            append_csv(valid, valid_file, first=index == 0)
+            append_csv(invalid, invalid_file, first=index == 0)
+            valid_count += len(valid)
+            invalid_count += len(invalid)
+        return valid_count, invalid_count
+
+    valid, invalid = validate_frame(read_frame(input_file), stats)
+    write_frame(valid, valid_file)
+    write_frame(invalid, invalid_file)
+    return len(valid), len(invalid)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,196 @@
+import time
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Um bit por regra em FLAG_DTYPE.
+FLAG_DTYPE = np.uint32
+MAX_RULES = 32
+REASON_SEPARATOR = ";"
+CNPJ_LENGTH = 14
+# Pesos do primeiro e do segundo digito verificador.
+CNPJ_WEIGHTS_1 = np.array([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2], dtype=np.int32)
+CNPJ_WEIGHTS_2 = np.array([6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2], dtype=np.int32)
+
+
+@dataclass(frozen=True)
+class Rule:
+    """
+    Regra de validacao vetorizada.
+
+    A funcao recebe o bloco ja preparado e devolve uma mascara booleana (uma
+    posicao por linha) True onde a linha viola a regra; code e o texto que vai
+    para a coluna Motivo.
+    """
+
+    code: str
+    check: Callable[["pd.DataFrame"], "np.ndarray"]
+
+
+@dataclass
+class RuleStats:
+    """
+    Linhas avaliadas, violacoes e tempo por regra, somados entre blocos.
+    """
+
+    rows: int = 0
+    hits: Dict[str, int] = field(default_factory=dict)
+    seconds: Dict[str, float] = field(default_factory=dict)
+
+    def as_extra(self) -> Dict[str, float]:
+        """
+        Achata as estatisticas para as metricas da etapa.
+
+        :return: Mapa regra_<codigo> -> violacoes e regra_<codigo>_segundos.
+        """
+        extra: Dict[str, float] = {}
+        for code, hits in self.hits.items():
+            extra[f"regra_{code}"] = hits
+            extra[f"regra_{code}_segundos"] = round(self.seconds[code], 6)
+        return extra
+
+
+def register(registry: List[Rule], code: str) -> Callable:
+    """
+    Decorator que adiciona uma funcao de mascara ao registro de regras.
+
+    A ordem de registro e a ordem dos motivos na coluna Motivo.
+
+    :param registry: Lista de regras do validador.
+    :param code: Codigo do motivo (ex.: CNPJ_INVALIDO).
+    :return: Decorator que devolve a propria funcao.
+    """
+    if any(rule.code == code for rule in registry):
+        raise ValueError(f"Regra duplicada: {code}")
+    if len(registry) >= MAX_RULES:
+        raise ValueError(f"Limite de {MAX_RULES} regras atingido.")
+
+    def decorator(check: Callable) -> Callable:
+        registry.append(Rule(code, check))
+        return check
+
+    return decorator
+
+
+def apply_rules(
+    rules: Sequence[Rule],
+    frame: "pd.DataFrame",
+    stats: Optional[RuleStats] = None,
+) -> "np.ndarray":
+    """
+    Avalia todas as regras sobre o mesmo bloco e combina o resultado em bits.
+
+    :param rules: Regras registradas.
+    :param frame: Bloco ja preparado.
+    :param stats: Estatisticas a atualizar (opcional).
+    :return: Array com um inteiro por linha; o bit i marca a regra i.
+    """
+    flags = np.zeros(len(frame), dtype=FLAG_DTYPE)
+    if stats is not None:
+        stats.rows += len(frame)
+    for bit, rule in enumerate(rules):
+        started = time.perf_counter()
+        mask = np.asarray(rule.check(frame), dtype=bool)
+        flags |= mask.astype(FLAG_DTYPE) << FLAG_DTYPE(bit)
+        if stats is not None:
+            stats.hits[rule.code] = stats.hits.get(rule.code, 0) + int(mask.sum())
+            stats.seconds[rule.code] = (
+                stats.seconds.get(rule.code, 0.0) + time.perf_counter() - started
+            )
+    return flags
+
+
+def decode_reasons(rules: Sequence[Rule], flags: "np.ndarray") -> "np.ndarray":
+    """
+    Converte os bits de cada linha nos codigos separados por ";".
+
+    Cada combinacao distinta e montada uma unica vez.
+
+    :param rules: Regras registradas (mesma ordem de apply_rules).
+    :param flags: Bits por linha.
+    :return: Array de strings (vazia onde nenhuma regra foi violada).
+    """
+    combos, inverse = np.unique(flags, return_inverse=True)
+    texts = np.array(
+        [
+            REASON_SEPARATOR.join(
+                rule.code for bit, rule in enumerate(rules) if int(combo) >> bit & 1
+            )
+            for combo in combos
+        ],
+        dtype=object,
+    )
+    return texts[inverse.reshape(-1)]
+
+
+def normalize_cnpjs(values: "pd.Series") -> "pd.Series":
+    """
+    Remove os caracteres nao numericos de uma coluna de CNPJs
+    (mesma regra do normalize_cnpj da API).
+
+    :param values: Serie com os CNPJs originais (nulos viram "").
+    :return: Serie de strings apenas com digitos.
+    """
+    text = values.astype(object).where(values.notna(), "").astype(str)
+    # isdecimal aceita exatamente os caracteres de \d: essas linhas ja estao prontas.
+    dirty = ~text.str.isdecimal() & text.ne("")
+    if dirty.any():
+        text = text.copy()
+        text[dirty] = text[dirty].str.replace(r"\D", "", regex=True)
+    return text
+
+
+def _check_digit(weighted_sum: "np.ndarray") -> "np.ndarray":
+    """
+    Digito verificador a partir da soma ponderada (modulo 11).
+
+    :param weighted_sum: Somas ponderadas por linha.
+    :return: Digitos verificadores.
+    """
+    mod = weighted_sum % 11
+    return np.where(mod < 2, 0, 11 - mod)
+
+
+def _digit_matrix(digits: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    Converte CNPJs de 14 digitos em uma matriz (linhas x 14) de uint8.
+
+    A normalizacao mantem digitos Unicode (ex.: arabicos): eles ficam como 10
+    na matriz, que nunca bate com um digito verificador (a comparacao e
+    textual), e so entram na soma pelo valor decimal.
+
+    :param digits: Array de strings com exatamente 14 digitos.
+    :return: Tupla (matriz de digitos, matriz da base de 12 digitos em int32).
+    """
+    codes = digits.astype(f"<U{CNPJ_LENGTH}").view(np.uint32)
+    codes = codes.reshape(-1, CNPJ_LENGTH) - ord("0")
+    matrix = np.minimum(codes, 10).astype(np.uint8)
+    base = matrix[:, :12].astype(np.int32)
+    for row in np.flatnonzero((base > 9).any(axis=1)):
+        base[row] = [unicodedata.decimal(char) for char in digits[row][:12]]
+    return matrix, base
+
+
+def valid_cnpj_mask(digits: "pd.Series") -> "np.ndarray":
+    """
+    Valida CNPJs pelos digitos verificadores, todas as linhas de uma vez.
+
+    :param digits: Serie de CNPJs ja normalizados (ver normalize_cnpjs).
+    :return: Array booleano, True onde o CNPJ e valido.
+    """
+    valid = np.zeros(len(digits), dtype=bool)
+    candidates = np.flatnonzero(digits.str.len().eq(CNPJ_LENGTH).to_numpy())
+    if not len(candidates):
+        return valid
+
+    texts = digits.to_numpy(dtype=object)[candidates]
+    matrix, base = _digit_matrix(texts)
+    d1 = _check_digit(base @ CNPJ_WEIGHTS_1)
+    d2 = _check_digit(base @ CNPJ_WEIGHTS_2[:12] + d1 * CNPJ_WEIGHTS_2[12])
+    # Mesmo caractere repetido 14 vezes (00000000000000, 11111111111111...).
+    repeated = (matrix == matrix[:, :1]).all(axis=1)
+    valid[candidates] = (matrix[:, 12] == d1) & (matrix[:, 13] == d2) & ~repeated
+    return valid
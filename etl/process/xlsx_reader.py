@@ -0,0 +1,424 @@
+import html
+import posixpath
+import re
+import zipfile
+from pathlib import Path
+from typing import (
+    IO,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Union,
+)
+from xml.etree.ElementTree import iterparse
+
+import numpy as np
+import pandas as pd
+
+WORKBOOK_PATH = "xl/workbook.xml"
+WORKBOOK_RELS_PATH = "xl/_rels/workbook.xml.rels"
+SHARED_STRINGS_PATH = "xl/sharedStrings.xml"
+READ_BLOCK = 4 * 1024 * 1024
+
+SHEET_DATA_RE = re.compile(rb"<(\w+:)?sheetData\b[^>]*>")
+ROW_RE = re.compile(r"<(?:\w+:)?row\b[^>]*?(/?)>")
+CELL_RE = re.compile(r"<(?:\w+:)?c\b([^>]*?)(?:/>|>(.*?)</(?:\w+:)?c>)", re.S)
+REF_RE = re.compile(r'\br="([A-Za-z]+)\d*"')
+CELL_START_RE = re.compile(r"<(?:\w+:)?c[\s/>]")
+CELL_REF_RE = re.compile(r'<(?:\w+:)?c\s[^>]*?\br="')
+TYPE_RE = re.compile(r'\bt="(\w+)"')
+V_RE = re.compile(r"<(?:\w+:)?v>(.*?)</(?:\w+:)?v>", re.S)
+T_RE = re.compile(r"<(?:\w+:)?t\b[^>]*>(.*?)</(?:\w+:)?t>", re.S)
+
+Header = List[Optional[str]]
+Selector = Callable[[Header], Optional[Sequence[int]]]
+
+
+def _local(tag: str) -> str:
+    """
+    Remove o namespace de uma tag XML ({ns}nome -> nome).
+
+    :param tag: Tag com namespace.
+    :return: Nome local da tag.
+    """
+    return tag.rsplit("}", 1)[-1]
+
+
+def _attr(elem, name: str) -> Optional[str]:
+    """
+    Le um atributo ignorando o namespace (ex.: r:id).
+
+    :param elem: Elemento XML.
+    :param name: Nome local do atributo.
+    :return: Valor do atributo ou None.
+    """
+    for key, value in elem.attrib.items():
+        if _local(key) == name:
+            return value
+    return None
+
+
+def _sheet_paths(archive: zipfile.ZipFile) -> List[str]:
+    """
+    Lista as planilhas na ordem do workbook.
+
+    :param archive: XLSX aberto como ZIP.
+    :return: Caminhos internos dos XMLs das planilhas.
+    """
+    targets: Dict[str, str] = {}
+    with archive.open(WORKBOOK_RELS_PATH) as handle:
+        for _, elem in iterparse(handle):
+            if _local(elem.tag) == "Relationship":
+                targets[elem.get("Id")] = elem.get("Target")
+    paths: List[str] = []
+    with archive.open(WORKBOOK_PATH) as handle:
+        for _, elem in iterparse(handle):
+            if _local(elem.tag) != "sheet":
+                continue
+            target = targets.get(_attr(elem, "id"))
+            if not target:
+                continue
+            if target.startswith("/"):
+                paths.append(target.lstrip("/"))
+            else:
+                paths.append(posixpath.normpath(posixpath.join("xl", target)))
+    return paths
+
+
+def _shared_strings(archive: zipfile.ZipFile) -> List[str]:
+    """
+    Le a tabela de strings compartilhadas de forma incremental.
+
+    :param archive: XLSX aberto como ZIP.
+    :return: Lista de strings pelo indice.
+    """
+    if SHARED_STRINGS_PATH not in archive.namelist():
+        return []
+    strings: List[str] = []
+    with archive.open(SHARED_STRINGS_PATH) as handle:
+        for _, elem in iterparse(handle):
+            if _local(elem.tag) != "si":
+                continue
+            parts: List[str] = []
+            for child in elem:
+                name = _local(child.tag)
+                if name == "t":
+                    parts.append(child.text or "")
+                elif name == "r":
+                    for run in child:
+                        if _local(run.tag) == "t":
+                            parts.append(run.text or "")
+            strings.append("".join(parts))
+            elem.clear()
+    return strings
+
+
+def _column_index(letters: str) -> int:
+    """
+    Converte as letras da coluna (ex.: AB) no indice da coluna (0-based).
+
+    :param letters: Letras da referencia da celula.
+    :return: Indice da coluna.
+    """
+    index = 0
+    for ch in letters.upper():
+        index = index * 26 + (ord(ch) - 64)
+    return index - 1
+
+
+def _column_letters(index: int) -> str:
+    """
+    Converte o indice da coluna (0-based) nas letras da referencia.
+
+    :param index: Indice da coluna.
+    :return: Letras da coluna (ex.: 27 -> AB).
+    """
+    letters = ""
+    index += 1
+    while index:
+        index, rest = divmod(index - 1, 26)
+        letters = chr(65 + rest) + letters
+    return letters
+
+
+def _iter_blocks(handle: IO[bytes]) -> Iterator[str]:
+    """
+    Le o XML da planilha em blocos que sempre terminam no fim de uma linha.
+
+    :param handle: Stream do XML da planilha.
+    :return: Iterador de trechos do sheetData com linhas completas.
+    """
+    pending = b""
+    row_end = None
+    while True:
+        block = handle.read(READ_BLOCK)
+        pending += block
+        if row_end is None:
+            start = SHEET_DATA_RE.search(pending)
+            if not start:
+                if not block:
+                    return
+                continue
+            row_end = b"</" + (start.group(1) or b"") + b"row>"
+            pending = pending[start.end() :]
+        if not block:
+            if pending:
+                yield pending.decode("utf-8")
+            return
+        cut = pending.rfind(row_end)
+        if cut < 0:
+            continue
+        cut += len(row_end)
+        yield pending[:cut].decode("utf-8")
+        pending = pending[cut:]
+
+
+def _cell_text(attrs: str, body: Optional[str], strings: List[str]) -> Optional[str]:
+    """
+    Converte uma unica celula em texto (cabecalho e planilhas sem referencias).
+
+    :param attrs: Atributos da tag <c>.
+    :param body: Conteudo interno da celula (vazio se auto-fechada).
+    :param strings: Strings compartilhadas.
+    :return: Texto da celula ou None se vazia.
+    """
+    if not body:
+        return None
+    kind = TYPE_RE.search(attrs)
+    kind = kind.group(1) if kind else "n"
+    if kind == "inlineStr":
+        return html.unescape("".join(T_RE.findall(body)))
+    value = V_RE.search(body)
+    if not value:
+        return None
+    if kind == "s":
+        return strings[int(value.group(1))]
+    if kind == "b":
+        return str(value.group(1) == "1")
+    return html.unescape(value.group(1))
+
+
+def _parse_row(row: str, strings: List[str]) -> Dict[int, Optional[str]]:
+    """
+    Le todas as celulas de uma linha (posicao pela referencia ou pela ordem).
+
+    :param row: XML interno da linha.
+    :param strings: Strings compartilhadas.
+    :return: Mapa indice da coluna -> texto.
+    """
+    values: Dict[int, Optional[str]] = {}
+    position = -1
+    for match in CELL_RE.finditer(row):
+        ref = REF_RE.search(match.group(1))
+        position = _column_index(ref.group(1)) if ref else position + 1
+        values[position] = _cell_text(match.group(1), match.group(2), strings)
+    return values
+
+
+def _split_rows(text: str) -> List[str]:
+    """
+    Separa um trecho do sheetData no XML interno de cada linha.
+
+    :param text: Trecho com linhas completas.
+    :return: Conteudo de cada linha, em ordem.
+    """
+    starts = list(ROW_RE.finditer(text))
+    rows: List[str] = []
+    for idx, match in enumerate(starts):
+        end = starts[idx + 1].start() if idx + 1 < len(starts) else len(text)
+        rows.append("" if match.group(1) else text[match.end() : end])
+    return rows
+
+
+def _cells_pattern(letters: Iterable[str], ref_first: bool) -> "re.Pattern[str]":
+    """
+    Monta a regex que casa apenas celulas das colunas pedidas.
+
+    Os formatos comuns (<v> e texto inline) ja saem decodificados em grupos
+    proprios; qualquer outro conteudo cai no grupo bruto.
+
+    :param letters: Letras das colunas desejadas.
+    :param ref_first: True se toda celula comeca por <c r="..."> (prefixo literal,
+        bem mais rapido de procurar).
+    :return: Regex compilada.
+    """
+    ns = r"(?:\w+:)?"
+    start = "<c ()" if ref_first else rf"<{ns}c\b([^>]*?)"
+    return re.compile(
+        start + rf'\br="({"|".join(letters)})(\d+)"'
+        r"([^>]*?)(?:/>|>(?:"
+        rf"<{ns}v>([^<]*)</{ns}v>"
+        rf"|<{ns}is><{ns}t(?:\s[^>]*)?>([^<]*)</{ns}t></{ns}is>"
+        rf"|(.*?))</{ns}c>)",
+        re.S,
+    )
+
+
+def _refs_complete(text: str, ref_first: bool) -> bool:
+    """
+    Confere se a regex de _cells_pattern enxerga todas as celulas do trecho.
+
+    O atributo r e opcional e pode vir depois de outros (ex.: <c s="1" r="A2">);
+    trechos assim vao para a leitura linha a linha.
+
+    :param text: Trecho do sheetData com linhas completas.
+    :param ref_first: Mesmo valor passado a _cells_pattern.
+    :return: True se toda celula tem r="..." na forma esperada.
+    """
+    if ref_first:
+        # Contagem simples: outra tag "<c..." so causa leitura linha a linha.
+        return text.count("<c") == text.count('<c r="')
+    return len(CELL_REF_RE.findall(text)) == len(CELL_START_RE.findall(text))
+
+
+def _decode_cells(cells: pd.DataFrame, strings: List[str], text: str) -> pd.Series:
+    """
+    Converte as celulas brutas em texto de forma vetorizada.
+
+    :param cells: DataFrame com as colunas attrs, v, inline e body.
+    :param strings: Strings compartilhadas.
+    :param text: Trecho de origem (pula os tipos que nao aparecem nele).
+    :return: Serie com o texto de cada celula (None se vazia).
+    """
+    values = cells["v"].where(cells["v"] != "", cells["inline"])
+    values = values.where(values != "", None)
+    has_v = cells["v"] != ""
+
+    shared = None
+    if strings and 't="s"' in text:
+        shared = cells["attrs"].str.contains('t="s"', regex=False) & has_v
+    if "&" in text:
+        escaped = values.str.contains("&", regex=False, na=False)
+        if shared is not None:
+            escaped &= ~shared
+        values[escaped] = values[escaped].map(html.unescape)
+    if shared is not None and shared.any():
+        table = np.array(strings, dtype=object)
+        values[shared] = table[cells["v"][shared].astype(np.int64).to_numpy()]
+
+    odd = cells["body"] != ""
+    if 't="b"' in text:
+        odd |= cells["attrs"].str.contains('t="b"', regex=False) & has_v
+    if odd.any():
+        # Formulas, texto inline com formatacao e booleanos: raros, um a um.
+        values[odd] = [
+            _cell_text(attrs, body or f"<v>{v}</v>", strings)
+            for attrs, v, body in zip(
+                cells["attrs"][odd], cells["v"][odd], cells["body"][odd]
+            )
+        ]
+    return values
+
+
+def _frame_from_cells(
+    text: str,
+    cells_re: "re.Pattern[str]",
+    names: List[str],
+    positions: Dict[str, int],
+    strings: List[str],
+) -> pd.DataFrame:
+    """
+    Extrai so as celulas das colunas desejadas e monta uma linha por linha.
+
+    :param text: Trecho do sheetData com linhas completas.
+    :param cells_re: Regex de _cells_pattern.
+    :param names: Nomes das colunas de saida.
+    :param positions: Mapa letras da coluna -> posicao de saida.
+    :param strings: Strings compartilhadas.
+    :return: DataFrame com as colunas escolhidas.
+    """
+    found = cells_re.findall(text)
+    if not found:
+        return pd.DataFrame(columns=names)
+    cells = pd.DataFrame(
+        found, columns=["pre", "col", "row", "post", "v", "inline", "body"]
+    )
+    cells["attrs"] = cells["pre"] + cells["post"]
+    cells["value"] = _decode_cells(cells, strings, text)
+    cells["row"] = cells["row"].astype(np.int64)
+    cells["col"] = cells["col"].map(positions)
+    frame = cells.pivot(index="row", columns="col", values="value")
+    frame = frame.reindex(columns=range(len(names)))
+    frame.columns = names
+    return frame.reset_index(drop=True)
+
+
+def _iter_sheet_frames(
+    handle: IO[bytes], strings: List[str], select: Selector
+) -> Iterator[pd.DataFrame]:
+    """
+    Percorre uma planilha e devolve lotes com as colunas escolhidas.
+
+    Com referencias (r="B2") nas celulas, cada bloco e varrido por uma unica
+    regex que so casa as colunas pedidas; blocos com celulas fora desse
+    formato (sem r ou com r depois de outro atributo) sao lidos linha a linha.
+
+    :param handle: Stream do XML da planilha.
+    :param strings: Strings compartilhadas.
+    :param select: Recebe o cabecalho e retorna os indices desejados (ou None).
+    :return: Iterador de DataFrames.
+    """
+    names: Optional[List[str]] = None
+    indexes: List[int] = []
+    cells_re = None
+    ref_first = False
+    positions: Dict[str, int] = {}
+    for text in _iter_blocks(handle):
+        if names is None:
+            first = ROW_RE.search(text)
+            if not first:
+                continue
+            end = ROW_RE.search(text, first.end())
+            stop = end.start() if end else len(text)
+            header_xml = "" if first.group(1) else text[first.end() : stop]
+            header_cells = _parse_row(header_xml, strings)
+            width = max(header_cells) + 1 if header_cells else 0
+            header = [header_cells.get(idx) for idx in range(width)]
+            selected = select(header)
+            if selected is None:
+                return
+            indexes = list(selected)
+            names = [str(header[idx]) for idx in indexes]
+            if REF_RE.search(header_xml):
+                positions = {
+                    _column_letters(idx): pos for pos, idx in enumerate(indexes)
+                }
+                refs = header_xml.count('<c r="')
+                ref_first = refs > 0 and refs == header_xml.count("<c ")
+                cells_re = _cells_pattern(positions, ref_first)
+            text = text[stop:]
+        if cells_re is not None and _refs_complete(text, ref_first):
+            frame = _frame_from_cells(text, cells_re, names, positions, strings)
+        else:
+            rows = []
+            for row_xml in _split_rows(text):
+                values = _parse_row(row_xml, strings)
+                rows.append([values.get(idx) for idx in indexes])
+            frame = pd.DataFrame(rows, columns=names)
+        if not frame.empty:
+            yield frame
+
+
+def iter_xlsx_frames(
+    source: Union[Path, IO[bytes]], select: Selector
+) -> Iterator[pd.DataFrame]:
+    """
+    Le um XLSX direto do XML e devolve lotes so com as colunas escolhidas.
+
+    Cada planilha usa a primeira linha como cabecalho; planilhas em que
+    `select` retorna None sao ignoradas. Os valores saem como texto (numeros
+    como gravados no XML) e celulas vazias como None.
+
+    :param source: Caminho do XLSX ou stream binario com seek.
+    :param select: Recebe o cabecalho e retorna os indices das colunas desejadas.
+    :return: Iterador de DataFrames (colunas com os nomes do cabecalho).
+    """
+    with zipfile.ZipFile(source) as archive:
+        strings = _shared_strings(archive)
+        for sheet_path in _sheet_paths(archive):
+            with archive.open(sheet_path) as handle:
+                yield from _iter_sheet_frames(handle, strings, select)
@@ -1,13 +1,18 @@
+import argparse
+import hashlib
+import json
 import logging
 import shutil
 import sys
 import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Iterable, Iterator, Optional, Union
 import os
 import stat
 import time
 
+import pandas as pd
 import requests
 from bs4 import BeautifulSoup
 from datetime import datetime
@@ -19,39 +24,90 @@ PROJECT_ROOT = Path(__file__).resolve().parents[1]
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
-from etl.fetch.ans_downloader import download_items, extract_downloaded
+from etl.fetch import raw_cache
+from etl.fetch.ans_downloader import download_cached, download_items
 from etl.fetch.ans_indexer import get_last_trimesters
-from etl.process.aggregate_despesas import aggregate
-from etl.process.consolidate_despesas import consolidate
-from etl.process.enrich_consolidado import enrich
-from etl.process.validate_consolidado import validate
-
+from etl.pipeline_dag import Stage, run_stages, select_stages
+from etl.pipeline_metrics import (
+    StageMetrics,
+    record_rows,
+    write_metrics_json,
+    write_prometheus_textfile,
+)
+from etl.process.aggregate_despesas import (
+    aggregate,
+    aggregate_chunks,
+    aggregate_frame,
+)
+from etl.process.consolidate_despesas import consolidate_frame, quarter_sources
+from etl.process.duckdb_engine import ENGINES, check_engine
+from etl.process.enrich_consolidado import enrich, enrich_frame, iter_enrich
+from etl.process.frame_io import (
+    append_csv,
+    export_csv,
+    iter_frames,
+    parquet_available,
+    write_frame,
+)
+from etl.process.partial_cache import source_digest
+from etl.process.validate_consolidado import iter_validate, validate, validate_frame
+from etl.process.validation_rules import RuleStats
 
 ZIP_NAME = "Teste_Samuel_de_Souza.zip"
 DATA_DIR = Path("data")
 TMP_DIR = DATA_DIR / "tmp"
 RAW_DIR = TMP_DIR / "raw"
-EXTRACT_DIR = TMP_DIR / "extracted"
 INTER_DIR = TMP_DIR / "intermediate"
 TMP_MARKER = TMP_DIR / ".pipeline_tmp"
 LOG_DIR = DATA_DIR / "logs"
 OUTPUT_DIR = DATA_DIR / "output"
+CACHE_DIR = DATA_DIR / "cache" / "raw"
+PARTIALS_DIR = DATA_DIR / "cache" / "partials"
+STAGES_DIR = DATA_DIR / "cache" / "stages"
+# ZIPs da ultima execucao (caminho em RAW_DIR e hash no cache persistente).
+ZIPS_MANIFEST = DATA_DIR / "cache" / "zips.json"
+# Momentos por trimestre da agregacao, mantidos entre execucoes.
+AGGREGATE_STATE = DATA_DIR / "cache" / "agregado.json.gz"
+# Hash das origens de cada trimestre do ultimo consolidado (ver _aggregate).
+QUARTER_SOURCES = DATA_DIR / "cache" / "trimestres.json"
 
 CADOP_BASE_URL = (
     "https://dadosabertos.ans.gov.br/FTP/PDA/operadoras_de_plano_de_saude_ativas/"
 )
 CADOP_FILE_NAME = "Relatorio_cadop.csv"
 CADOP_OUTPUT = OUTPUT_DIR / CADOP_FILE_NAME
-
-
-def _setup_logger() -> logging.Logger:
+LIMIT_QUARTERS = 3
+DOWNLOAD_WORKERS = 4
+CONSOLIDATE_WORKERS = os.cpu_count() or 1
+STAGE_WORKERS = 4
+PREFILTER_ROWS = True
+# Parquet tipado entre as etapas quando o pyarrow estiver instalado.
+USE_PARQUET = parquet_available()
+# Engine padrao; "duckdb" (opcional, ver requirements-optional.txt) le os
+# trimestres e agrega a partir de CSV em SQL, com o mesmo resultado do pandas.
+# Na linha de comando: --engine duckdb.
+ENGINE = "pandas"
+# Etapas encadeadas em memoria; os CSVs de entrega sao gravados uma unica vez.
+FUSED_PIPELINE = True
+# No modo em memoria, grava cada CSV em uma thread assim que ele fica pronto.
+BACKGROUND_WRITES = True
+# Linhas por bloco no modo com memoria limitada (historico de muitos anos);
+# None desativa. Tem precedencia sobre FUSED_PIPELINE.
+STREAM_CHUNK_ROWS: Optional[int] = None
+# Arquivo .prom para o textfile collector do node_exporter; None desativa.
+PROMETHEUS_TEXTFILE: Optional[Path] = None
+# Etapa final que carrega as saidas no Postgres via COPY (exige o .env).
+LOAD_DATABASE = False
+
+
+def _setup_logger(timestamp: str) -> logging.Logger:
     """
     Cria um logger em arquivo com timestamp para a pipeline.
 
+    :param timestamp: Timestamp da execucao (nome do log e das metricas).
     :return: Logger configurado para a pipeline.
     """
     LOG_DIR.mkdir(parents=True, exist_ok=True)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     logger = logging.getLogger("pipeline")
     logger.setLevel(logging.INFO)
     logger.handlers.clear()
@@ -100,23 +156,6 @@ def _resolve_cadop_url(logger: logging.Logger) -> Optional[str]:
     return None
 
 
-def _download_file(url: str, dest: Path) -> None:
-    """
-    Baixa um arquivo para disco usando streaming.
-
-    :param url: URL do arquivo.
-    :param dest: Caminho de destino local.
-    :return: None.
-    """
-    dest.parent.mkdir(parents=True, exist_ok=True)
-    with requests.get(url, stream=True, timeout=60) as response:
-        response.raise_for_status()
-        with open(dest, "wb") as handle:
-            for chunk in response.iter_content(chunk_size=1024 * 1024):
-                if chunk:
-                    handle.write(chunk)
-
-
 def _zip_output(output_file: Path, zip_name: str) -> Path:
     """
     Compacta um unico arquivo dentro da pasta de saida.
@@ -172,7 +211,7 @@ def _cleanup_tmp(logger: Optional[logging.Logger] = None) -> None:
 
 def _ensure_cadop(logger: logging.Logger) -> Path:
     """
-    Garante o CSV CADOP local, baixando se necessario.
+    Garante o CSV CADOP local, usando o cache persistente se inalterado.
 
     :param logger: Logger da pipeline.
     :return: Caminho local do CADOP.
@@ -184,7 +223,9 @@ def _ensure_cadop(logger: logging.Logger) -> Path:
     if not cadop_url:
         raise RuntimeError("Nao foi possivel localizar o arquivo CADOP.")
     logger.info("Baixando CADOP: %s", cadop_url)
-    _download_file(cadop_url, cadop_path)
+    _, _, _, cached = download_cached(cadop_url, cadop_path, cache_dir=CACHE_DIR)
+    if cached:
+        logger.info("CADOP inalterado, reutilizado do cache")
     return cadop_path
 
 
@@ -215,9 +256,9 @@ def _prepare_directories(logger: logging.Logger) -> None:
     TMP_DIR.mkdir(parents=True, exist_ok=True)
     TMP_MARKER.write_text("temp files for pipeline", encoding="utf-8")
     RAW_DIR.mkdir(parents=True, exist_ok=True)
-    EXTRACT_DIR.mkdir(parents=True, exist_ok=True)
     INTER_DIR.mkdir(parents=True, exist_ok=True)
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    STAGES_DIR.mkdir(parents=True, exist_ok=True)
 
 
 def _download_trimesters(logger: logging.Logger) -> list[dict]:
@@ -227,59 +268,172 @@ def _download_trimesters(logger: logging.Logger) -> list[dict]:
     :param logger: Logger da pipeline.
     :return: Lista de itens de trimestre.
     """
-    logger.info("Buscando ultimos 3 trimestres")
-    trimestre_items = get_last_trimesters(3)
+    logger.info("Buscando ultimos %s trimestres", LIMIT_QUARTERS)
+    trimestre_items = get_last_trimesters(LIMIT_QUARTERS)
     logger.info("Trimestres identificados: %s", len(trimestre_items))
+    record_rows(rows_out=len(trimestre_items))
     return trimestre_items
 
 
 def _download_zips(logger: logging.Logger, trimestre_items: list[dict]) -> list[Path]:
     """
-    Baixa os ZIPs dos trimestres selecionados.
+    Baixa os ZIPs dos trimestres selecionados em paralelo.
+
+    Grava ZIPS_MANIFEST, a saida declarada da etapa: execucoes parciais sem
+    esta etapa restauram os ZIPs do cache por ele (ver _raw_dir).
 
     :param logger: Logger da pipeline.
     :param trimestre_items: Itens de trimestre.
     :return: Lista de caminhos baixados.
     """
     logger.info("Baixando ZIPs")
-    downloaded_paths = download_items(trimestre_items, raw_dir=RAW_DIR)
+    downloaded_paths = download_items(
+        trimestre_items,
+        raw_dir=RAW_DIR,
+        workers=DOWNLOAD_WORKERS,
+        logger=logger,
+        cache_dir=CACHE_DIR,
+    )
     logger.info("ZIPs baixados: %s", len(downloaded_paths))
+    record_rows(rows_out=len(downloaded_paths))
+    entries = [
+        {
+            "path": path.relative_to(RAW_DIR).as_posix(),
+            "sha256": raw_cache.cached_digest(item["url"], CACHE_DIR),
+        }
+        for item, path in zip(trimestre_items, downloaded_paths)
+    ]
+    ZIPS_MANIFEST.parent.mkdir(parents=True, exist_ok=True)
+    tmp = ZIPS_MANIFEST.with_name(ZIPS_MANIFEST.name + ".tmp")
+    tmp.write_text(json.dumps(entries, indent=2), encoding="utf-8")
+    tmp.replace(ZIPS_MANIFEST)
     return downloaded_paths
 
 
-def _extract_zips(logger: logging.Logger, trimestre_items: list[dict]) -> list[Path]:
+def _raw_dir(results: dict) -> Path:
     """
-    Extrai os ZIPs baixados para a pasta temporaria.
+    Retorna RAW_DIR com os ZIPs da execucao ou, se a etapa nao rodou, com os
+    da ultima execucao restaurados do cache persistente (RAW_DIR fica em
+    TMP_DIR, que e limpo a cada execucao).
 
-    :param logger: Logger da pipeline.
-    :param trimestre_items: Itens de trimestre.
-    :return: Lista de pastas extraidas.
+    :param results: Resultados das etapas.
+    :return: Diretorio com os ZIPs.
     """
-    logger.info("Extraindo ZIPs")
-    extracted_dirs = extract_downloaded(
-        trimestre_items, raw_dir=RAW_DIR, extract_dir=EXTRACT_DIR
-    )
-    logger.info("Pastas extraidas: %s", len(extracted_dirs))
-    return extracted_dirs
+    if "zips" in results:
+        return RAW_DIR
+    entries = json.loads(ZIPS_MANIFEST.read_text(encoding="utf-8"))
+    for entry in entries:
+        dest = RAW_DIR / entry["path"]
+        if not entry["sha256"] or not raw_cache.restore(
+            entry["sha256"], dest, CACHE_DIR
+        ):
+            raise RuntimeError(
+                f"ZIP {entry['path']} nao esta mais no cache {CACHE_DIR}; "
+                "rode a etapa zips."
+            )
+    return RAW_DIR
+
+
+def _stage_path(name: str) -> Path:
+    """
+    Retorna o arquivo de saida de uma etapa interna.
 
+    :param name: Nome base do arquivo (sem extensao).
+    :return: Parquet em STAGES_DIR (mantido para reexecucoes parciais) ou o
+        proprio CSV de entrega em OUTPUT_DIR.
+    """
+    if USE_PARQUET and not STREAM_CHUNK_ROWS:
+        return STAGES_DIR / f"{name}.parquet"
+    return OUTPUT_DIR / f"{name}.csv"
+
+
+def _source_fingerprints(raw_dir: Path) -> dict[str, str]:
+    """
+    Calcula o hash das origens de cada trimestre consolidado e grava em
+    QUARTER_SOURCES, para a agregacao de execucoes parciais.
+
+    :param raw_dir: Diretorio com os ZIPs (ver _raw_dir).
+    :return: Mapa "Ano-Trimestre" -> hash das origens.
+    """
+    fingerprints = {}
+    for (ano, tri), paths in quarter_sources(raw_dir, LIMIT_QUARTERS).items():
+        digests = sorted(source_digest(path, PARTIALS_DIR) for path in paths)
+        fingerprints[f"{ano}-{tri}"] = hashlib.sha256(
+            "".join(digests).encode("utf-8")
+        ).hexdigest()
+    QUARTER_SOURCES.parent.mkdir(parents=True, exist_ok=True)
+    tmp = QUARTER_SOURCES.with_name(QUARTER_SOURCES.name + ".tmp")
+    tmp.write_text(json.dumps(fingerprints, indent=2), encoding="utf-8")
+    tmp.replace(QUARTER_SOURCES)
+    return fingerprints
+
+
+def _quarter_fingerprints(
+    cadop_path: Path, sources: Optional[dict[str, str]] = None
+) -> Optional[dict[tuple[int, int], str]]:
+    """
+    Impressao digital das linhas de cada trimestre para a agregacao: hash das
+    origens do trimestre e do CADOP (que define RazaoSocial e UF).
 
-def _consolidate(logger: logging.Logger, cadop_path: Path) -> Path:
+    :param cadop_path: Caminho do CADOP usado no enriquecimento.
+    :param sources: Hash das origens por trimestre (None le QUARTER_SOURCES).
+    :return: Mapa (Ano, Trimestre) -> impressao ou None se nao houver origens
+        gravadas (a agregacao le a entrada inteira).
+    """
+    if sources is None:
+        if not QUARTER_SOURCES.exists():
+            return None
+        sources = json.loads(QUARTER_SOURCES.read_text(encoding="utf-8"))
+    cadop = source_digest(cadop_path, PARTIALS_DIR)
+    fingerprints = {}
+    for quarter, digest in sources.items():
+        ano, tri = quarter.split("-")
+        fingerprints[(int(ano), int(tri))] = hashlib.sha256(
+            f"{digest}{cadop}".encode("utf-8")
+        ).hexdigest()
+    return fingerprints
+
+
+def _consolidate(
+    logger: logging.Logger, raw_dir: Path, cadop_path: Path, engine: str = ENGINE
+) -> Path:
     """
-    Consolida os dados dos trimestres em um unico CSV.
+    Consolida os dados dos trimestres em um unico arquivo, lendo direto dos ZIPs.
 
     :param logger: Logger da pipeline.
+    :param raw_dir: Diretorio com os ZIPs (ver _raw_dir).
     :param cadop_path: Caminho do CADOP local.
-    :return: Caminho do CSV consolidado.
+    :param engine: "pandas" ou "duckdb".
+    :return: Caminho do consolidado (CSV ou Parquet).
     """
     logger.info("Consolidando dados")
-    consolidado_path = OUTPUT_DIR / "consolidado_despesas.csv"
-    consolidate(
-        extract_dir=EXTRACT_DIR,
+    consolidated_df = consolidate_frame(
+        extract_dir=raw_dir,
         cadop_path=cadop_path,
-        output_file=consolidado_path,
-        limit_quarters=3,
+        limit_quarters=LIMIT_QUARTERS,
+        workers=CONSOLIDATE_WORKERS,
+        prefilter=PREFILTER_ROWS,
+        cache_dir=PARTIALS_DIR,
+        engine=engine,
     )
-    return consolidado_path
+    _source_fingerprints(raw_dir)
+    record_rows(rows_out=len(consolidated_df))
+    return write_frame(consolidated_df, _stage_path("consolidado_despesas"))
+
+
+def _log_rules(logger: logging.Logger, stats: RuleStats) -> dict:
+    """
+    Registra no log as violacoes e o tempo de cada regra de validacao.
+
+    :param logger: Logger da pipeline.
+    :param stats: Estatisticas das regras.
+    :return: Contagens e tempos por regra, para as metricas da etapa.
+    """
+    for code, hits in stats.hits.items():
+        logger.info(
+            "Regra %s: %s linhas (%.3fs)", code, hits, stats.seconds.get(code, 0.0)
+        )
+    return stats.as_extra()
 
 
 def _validate(logger: logging.Logger, consolidado_path: Path) -> tuple[Path, Path]:
@@ -287,22 +441,26 @@ def _validate(logger: logging.Logger, consolidado_path: Path) -> tuple[Path, Pat
     Valida o consolidado e retorna os caminhos de saida.
 
     :param logger: Logger da pipeline.
-    :param consolidado_path: Caminho do CSV consolidado.
+    :param consolidado_path: Caminho do consolidado (CSV ou Parquet).
     :return: Tupla (validos, inconsistencias).
     """
     logger.info("Validando dados")
-    valid_path = OUTPUT_DIR / "consolidado_validado.csv"
+    valid_path = _stage_path("consolidado_validado")
     invalid_path = OUTPUT_DIR / "inconsistencias_2_1.csv"
-    validate(
+    stats = RuleStats()
+    valid_count, invalid_count = validate(
         input_file=consolidado_path,
         valid_file=valid_path,
         invalid_file=invalid_path,
+        stats=stats,
+    )
+    logger.info("Inconsistencias validacao: %s", invalid_count)
+    record_rows(
+        rows_in=valid_count + invalid_count,
+        rows_out=valid_count,
+        inconsistencias=invalid_count,
+        **_log_rules(logger, stats),
     )
-    if invalid_path.exists():
-        invalid_count = max(
-            sum(1 for _ in invalid_path.open(encoding="utf-8-sig")) - 1, 0
-        )
-        logger.info("Inconsistencias validacao: %s", invalid_count)
     return valid_path, invalid_path
 
 
@@ -313,83 +471,647 @@ def _enrich(
     Enriquece o consolidado validado com campos do CADOP.
 
     :param logger: Logger da pipeline.
-    :param valid_path: Caminho do CSV validado.
+    :param valid_path: Caminho do validado (CSV ou Parquet).
     :param cadop_path: Caminho do CADOP local.
     :return: Tupla (enriquecido, inconsistencias).
     """
     logger.info("Enriquecendo dados")
-    enriched_path = OUTPUT_DIR / "consolidado_enriquecido.csv"
+    enriched_path = _stage_path("consolidado_enriquecido")
     missing_path = OUTPUT_DIR / "inconsistencias_2_2.csv"
-    enrich(
+    enriched_count, missing_count = enrich(
         input_file=valid_path,
         cadop_path=cadop_path,
         output_file=enriched_path,
         missing_file=missing_path,
     )
-    if missing_path.exists():
-        missing_count = max(
-            sum(1 for _ in missing_path.open(encoding="utf-8-sig")) - 1, 0
-        )
-        logger.info("Inconsistencias cadastro: %s", missing_count)
+    logger.info("Inconsistencias cadastro: %s", missing_count)
+    record_rows(
+        rows_in=enriched_count,
+        rows_out=enriched_count,
+        inconsistencias=missing_count,
+    )
     return enriched_path, missing_path
 
 
-def _aggregate(logger: logging.Logger, enriched_path: Path) -> Path:
+def _aggregate(
+    logger: logging.Logger,
+    enriched_path: Path,
+    cadop_path: Path,
+    engine: str = ENGINE,
+) -> Path:
     """
     Agrega despesas por RazaoSocial e UF.
 
+    Os momentos por trimestre ficam em AGGREGATE_STATE com a impressao digital
+    de cada trimestre (origens e CADOP, ver _quarter_fingerprints): so os
+    trimestres novos ou alterados sao lidos da entrada, os demais vem do
+    estado, e os que sairam da entrada saem do estado. O resultado e o mesmo
+    de agregar a entrada inteira.
+
     :param logger: Logger da pipeline.
-    :param enriched_path: Caminho do CSV enriquecido.
+    :param enriched_path: Caminho do enriquecido (CSV ou Parquet).
+    :param cadop_path: Caminho do CADOP local.
+    :param engine: "pandas" ou "duckdb".
     :return: Caminho do CSV agregado.
     """
     logger.info("Agregando dados")
     aggregated_path = OUTPUT_DIR / "despesas_agregadas.csv"
-    aggregate(input_file=enriched_path, output_file=aggregated_path)
+    # Com Parquet a leitura ja e tipada e o pandas agrega mais rapido.
+    engine = "pandas" if enriched_path.suffix == ".parquet" else engine
+    rows_in, rows_out = aggregate(
+        input_file=enriched_path,
+        output_file=aggregated_path,
+        engine=engine,
+        state_file=AGGREGATE_STATE,
+        keep_quarters=LIMIT_QUARTERS,
+        quarters=_quarter_fingerprints(cadop_path),
+    )
+    logger.info("Linhas relidas na agregacao: %s", rows_in)
+    record_rows(rows_in=rows_in, rows_out=rows_out)
     return aggregated_path
 
 
-def _finalize_outputs(consolidado_path: Path, aggregated_path: Path) -> None:
+def _export_deliverables(logger: logging.Logger, paths: list[Path]) -> list[Path]:
+    """
+    Gera os CSVs de entrega a partir dos intermediarios das etapas.
+
+    :param logger: Logger da pipeline.
+    :param paths: Arquivos intermediarios.
+    :return: Caminhos dos CSVs em OUTPUT_DIR, na mesma ordem.
+    """
+    if USE_PARQUET:
+        logger.info("Exportando CSVs de entrega")
+    return [export_csv(path, OUTPUT_DIR / f"{path.stem}.csv") for path in paths]
+
+
+def _load_database(logger: logging.Logger) -> None:
     """
-    Cria os ZIPs finais exigidos no desafio.
+    Carrega CADOP, consolidado e agregado no Postgres (substitui o import.sql).
 
-    :param consolidado_path: Caminho do CSV consolidado.
-    :param aggregated_path: Caminho do CSV agregado.
+    :param logger: Logger da pipeline.
     :return: None.
     """
-    _zip_output(consolidado_path, "consolidado_despesas.zip")
-    _zip_output(aggregated_path, ZIP_NAME)
+    from etl.load.db_loader import load_outputs
+
+    logger.info("Carregando saidas no banco")
+    results = load_outputs(OUTPUT_DIR)
+    extra = {}
+    for result in results:
+        name = result.table.split(".")[-1]
+        logger.info(
+            "Tabela %s: %s linhas (COPY %.3fs, gravacao %.3fs)",
+            result.table,
+            result.written,
+            result.copy_seconds,
+            result.merge_seconds,
+        )
+        extra[f"{name}_copy_s"] = round(result.copy_seconds, 3)
+        extra[f"{name}_merge_s"] = round(result.merge_seconds, 3)
+    record_rows(
+        rows_in=sum(result.copied for result in results),
+        rows_out=sum(result.written for result in results),
+        **extra,
+    )
+
+
+def _write_output(
+    writer: Optional[ThreadPoolExecutor], df: "pd.DataFrame", name: str
+) -> Union[Future, tuple]:
+    """
+    Agenda a gravacao de um CSV de entrega.
+
+    :param writer: Executor de gravacao ou None para gravar no final.
+    :param df: DataFrame a gravar.
+    :param name: Nome base do CSV em OUTPUT_DIR.
+    :return: Future da gravacao ou par (DataFrame, caminho) pendente.
+    """
+    path = OUTPUT_DIR / f"{name}.csv"
+    if writer is None:
+        return df, path
+    return writer.submit(write_frame, df, path)
+
+
+def _run_fused(
+    logger: logging.Logger,
+    raw_dir: Path,
+    cadop_path: Path,
+    writer: Optional[ThreadPoolExecutor],
+    engine: str = ENGINE,
+) -> list[Path]:
+    """
+    Encadeia consolidacao, validacao, enriquecimento e agregacao em memoria.
+
+    :param logger: Logger da pipeline.
+    :param raw_dir: Diretorio com os ZIPs (ver _raw_dir).
+    :param cadop_path: Caminho do CADOP local.
+    :param writer: Executor de gravacao ou None para gravar no final.
+    :param engine: "pandas" ou "duckdb" (leitura dos trimestres).
+    :return: Caminhos dos CSVs gravados (consolidado primeiro, agregado por ultimo).
+    """
+    logger.info("Consolidando dados")
+    consolidated_df = consolidate_frame(
+        extract_dir=raw_dir,
+        cadop_path=cadop_path,
+        limit_quarters=LIMIT_QUARTERS,
+        workers=CONSOLIDATE_WORKERS,
+        prefilter=PREFILTER_ROWS,
+        cache_dir=PARTIALS_DIR,
+        engine=engine,
+    )
+    pending = [_write_output(writer, consolidated_df, "consolidado_despesas")]
+
+    logger.info("Validando dados")
+    stats = RuleStats()
+    valid_df, invalid_df = validate_frame(consolidated_df, stats)
+    pending.append(_write_output(writer, valid_df, "consolidado_validado"))
+    pending.append(_write_output(writer, invalid_df, "inconsistencias_2_1"))
+    logger.info("Inconsistencias validacao: %s", len(invalid_df))
+    rule_extra = _log_rules(logger, stats)
+
+    logger.info("Enriquecendo dados")
+    enriched_df, missing_df = enrich_frame(valid_df, cadop_path)
+    pending.append(_write_output(writer, enriched_df, "consolidado_enriquecido"))
+    pending.append(_write_output(writer, missing_df, "inconsistencias_2_2"))
+    logger.info("Inconsistencias cadastro: %s", len(missing_df))
+
+    logger.info("Agregando dados")
+    aggregated_df = aggregate_frame(
+        enriched_df,
+        state_file=AGGREGATE_STATE,
+        quarters=_quarter_fingerprints(cadop_path, _source_fingerprints(raw_dir)),
+        keep_quarters=LIMIT_QUARTERS,
+    )
+    pending.append(_write_output(writer, aggregated_df, "despesas_agregadas"))
+    record_rows(
+        rows_in=len(consolidated_df),
+        rows_out=len(aggregated_df),
+        inconsistencias_2_1=len(invalid_df),
+        inconsistencias_2_2=len(missing_df),
+        **rule_extra,
+    )
+
+    logger.info("Gravando CSVs de saida")
+    return [
+        item.result() if isinstance(item, Future) else write_frame(*item)
+        for item in pending
+    ]
+
+
+def _tee_outputs(
+    pairs: Iterable[tuple["pd.DataFrame", "pd.DataFrame"]],
+    kept_name: str,
+    dropped_name: str,
+    counts: dict[str, int],
+) -> Iterator["pd.DataFrame"]:
+    """
+    Grava em blocos as duas saidas de uma etapa e repassa os registros mantidos.
+
+    :param pairs: Tuplas (mantidos, descartados) por bloco.
+    :param kept_name: Nome base do CSV dos mantidos.
+    :param dropped_name: Nome base do CSV dos descartados.
+    :param counts: Contagem de linhas por nome, atualizada a cada bloco.
+    :return: Iterador dos blocos mantidos.
+    """
+    counts[kept_name] = counts[dropped_name] = 0
+    for index, (kept, dropped) in enumerate(pairs):
+        append_csv(kept, OUTPUT_DIR / f"{kept_name}.csv", first=index == 0)
+        append_csv(dropped, OUTPUT_DIR / f"{dropped_name}.csv", first=index == 0)
+        counts[kept_name] += len(kept)
+        counts[dropped_name] += len(dropped)
+        yield kept
+
+
+def _run_streaming(
+    logger: logging.Logger, consolidado_path: Path, cadop_path: Path
+) -> list[Path]:
+    """
+    Valida, enriquece e agrega em blocos, com memoria limitada ao tamanho do
+    bloco, ao CADOP e aos momentos por operadora/UF.
+
+    :param logger: Logger da pipeline.
+    :param consolidado_path: Caminho do consolidado.
+    :param cadop_path: Caminho do CADOP local.
+    :return: Caminhos dos CSVs gravados.
+    """
+    logger.info(
+        "Validando, enriquecendo e agregando em blocos de %s linhas",
+        STREAM_CHUNK_ROWS,
+    )
+    counts: dict[str, int] = {}
+    stats = RuleStats()
+    chunks = iter_frames(consolidado_path, STREAM_CHUNK_ROWS)
+    valid_chunks = _tee_outputs(
+        iter_validate(chunks, stats),
+        "consolidado_validado",
+        "inconsistencias_2_1",
+        counts,
+    )
+    enriched_chunks = _tee_outputs(
+        iter_enrich(valid_chunks, cadop_path),
+        "consolidado_enriquecido",
+        "inconsistencias_2_2",
+        counts,
+    )
+    aggregated_df = aggregate_chunks(
+        enriched_chunks,
+        state_file=AGGREGATE_STATE,
+        quarters=_quarter_fingerprints(cadop_path),
+        keep_quarters=LIMIT_QUARTERS,
+    )
+    aggregated_path = write_frame(aggregated_df, OUTPUT_DIR / "despesas_agregadas.csv")
+    logger.info("Inconsistencias validacao: %s", counts["inconsistencias_2_1"])
+    logger.info("Inconsistencias cadastro: %s", counts["inconsistencias_2_2"])
+    record_rows(
+        rows_in=counts["consolidado_validado"] + counts["inconsistencias_2_1"],
+        rows_out=len(aggregated_df),
+        inconsistencias_2_1=counts["inconsistencias_2_1"],
+        inconsistencias_2_2=counts["inconsistencias_2_2"],
+        **_log_rules(logger, stats),
+    )
+    return [
+        OUTPUT_DIR / f"{name}.csv"
+        for name in (
+            "consolidado_validado",
+            "inconsistencias_2_1",
+            "consolidado_enriquecido",
+            "inconsistencias_2_2",
+        )
+    ] + [aggregated_path]
+
+
+def _run_fused_stage(
+    logger: logging.Logger, raw_dir: Path, cadop_path: Path, engine: str = ENGINE
+) -> list[Path]:
+    """
+    Executa o modo em memoria com o gravador configurado.
+
+    :param logger: Logger da pipeline.
+    :param raw_dir: Diretorio com os ZIPs.
+    :param cadop_path: Caminho do CADOP local.
+    :param engine: "pandas" ou "duckdb".
+    :return: Caminhos dos CSVs gravados.
+    """
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        return _run_fused(
+            logger,
+            raw_dir,
+            cadop_path,
+            writer if BACKGROUND_WRITES else None,
+            engine,
+        )
+
+
+def _outputs(*names: str) -> tuple[Path, ...]:
+    """
+    Retorna os CSVs de entrega pelos nomes base.
+
+    :param names: Nomes base (sem extensao).
+    :return: Caminhos em OUTPUT_DIR.
+    """
+    return tuple(OUTPUT_DIR / f"{name}.csv" for name in names)
+
+
+def _cadop_path(results: dict) -> Path:
+    """
+    Retorna o CADOP da execucao ou, se a etapa nao rodou, a copia salva.
+
+    :param results: Resultados das etapas.
+    :return: Caminho do CADOP.
+    """
+    return results.get("cadop") or CADOP_OUTPUT
+
+
+def _build_stages(
+    logger: logging.Logger, load_db: bool = False, engine: str = ENGINE
+) -> list[Stage]:
+    """
+    Declara a pipeline como um DAG de etapas, conforme o modo de execucao.
+
+    O CADOP nao depende dos ZIPs e os dois ZIPs finais sao independentes, entao
+    rodam em paralelo. Em memoria, consolidacao ate agregacao formam uma etapa.
+
+    :param logger: Logger da pipeline.
+    :param load_db: Se True, inclui a carga no Postgres como etapa final.
+    :param engine: "pandas" ou "duckdb" (consolidacao e agregacao).
+    :return: Etapas em ordem topologica.
+    """
+
+    def _fetch_cadop(_results: dict) -> Path:
+        """
+        Baixa (ou reaproveita) o CADOP e salva a copia de entrega.
+
+        :param _results: Resultados das etapas (nao usados).
+        :return: Caminho do CADOP local.
+        """
+        cadop_path = _ensure_cadop(logger)
+        _persist_cadop(logger, cadop_path)
+        return cadop_path
+
+    stages = [
+        Stage("trimestres", lambda _r: _download_trimesters(logger), always=True),
+        Stage(
+            "zips",
+            lambda r: _download_zips(logger, r["trimestres"]),
+            deps=("trimestres",),
+            outputs=(ZIPS_MANIFEST,),
+            always=True,
+        ),
+        Stage("cadop", _fetch_cadop, outputs=(CADOP_OUTPUT,), always=True),
+    ]
+    consolidado_csv, aggregated_csv = _outputs(
+        "consolidado_despesas", "despesas_agregadas"
+    )
+    # Configuracao que muda as saidas de cada etapa (entra na impressao digital).
+    consolidate_config = {
+        "limit_quarters": LIMIT_QUARTERS,
+        "engine": engine,
+        "prefilter": PREFILTER_ROWS,
+    }
+    aggregate_config = {"keep_quarters": LIMIT_QUARTERS, "engine": engine}
+
+    if STREAM_CHUNK_ROWS or not FUSED_PIPELINE:
+        consolidado_path = _stage_path("consolidado_despesas")
+        stages.append(
+            Stage(
+                "consolidar",
+                lambda r: _consolidate(logger, _raw_dir(r), _cadop_path(r), engine),
+                deps=("zips", "cadop"),
+                outputs=(consolidado_path,),
+                config=consolidate_config,
+            )
+        )
+
+    if STREAM_CHUNK_ROWS:
+        stages.append(
+            Stage(
+                "processar",
+                lambda r: _run_streaming(logger, consolidado_path, _cadop_path(r)),
+                deps=("consolidar", "cadop"),
+                outputs=_outputs(
+                    "consolidado_validado",
+                    "inconsistencias_2_1",
+                    "consolidado_enriquecido",
+                    "inconsistencias_2_2",
+                    "despesas_agregadas",
+                ),
+                config={**aggregate_config, "stream_chunk_rows": STREAM_CHUNK_ROWS},
+            )
+        )
+        consolidado_dep, aggregated_dep = "consolidar", "processar"
+    elif FUSED_PIPELINE:
+        stages.append(
+            Stage(
+                "processar",
+                lambda r: _run_fused_stage(logger, _raw_dir(r), _cadop_path(r), engine),
+                deps=("zips", "cadop"),
+                outputs=_outputs(
+                    "consolidado_despesas",
+                    "consolidado_validado",
+                    "inconsistencias_2_1",
+                    "consolidado_enriquecido",
+                    "inconsistencias_2_2",
+                    "despesas_agregadas",
+                ),
+                config={**consolidate_config, **aggregate_config, "fused": True},
+            )
+        )
+        consolidado_dep = aggregated_dep = "processar"
+    else:
+        valid_path = _stage_path("consolidado_validado")
+        enriched_path = _stage_path("consolidado_enriquecido")
+        invalid_csv, missing_csv = _outputs(
+            "inconsistencias_2_1", "inconsistencias_2_2"
+        )
+        stages += [
+            Stage(
+                "validar",
+                lambda _r: _validate(logger, consolidado_path),
+                deps=("consolidar",),
+                outputs=(valid_path, invalid_csv),
+            ),
+            Stage(
+                "enriquecer",
+                lambda r: _enrich(logger, valid_path, _cadop_path(r)),
+                deps=("validar", "cadop"),
+                outputs=(enriched_path, missing_csv),
+            ),
+            Stage(
+                "agregar",
+                lambda r: _aggregate(logger, enriched_path, _cadop_path(r), engine),
+                deps=("enriquecer",),
+                outputs=(aggregated_csv,),
+                config=aggregate_config,
+            ),
+        ]
+        consolidado_dep, aggregated_dep = "consolidar", "agregar"
+        if USE_PARQUET:
+            stages.append(
+                Stage(
+                    "exportar",
+                    lambda _r: _export_deliverables(
+                        logger, [consolidado_path, valid_path, enriched_path]
+                    ),
+                    deps=("consolidar", "validar", "enriquecer"),
+                    outputs=_outputs(
+                        "consolidado_despesas",
+                        "consolidado_validado",
+                        "consolidado_enriquecido",
+                    ),
+                )
+            )
+            consolidado_dep = "exportar"
+
+    stages += [
+        Stage(
+            "zip_consolidado",
+            lambda _r: _zip_output(consolidado_csv, "consolidado_despesas.zip"),
+            deps=(consolidado_dep,),
+            outputs=(OUTPUT_DIR / "consolidado_despesas.zip",),
+        ),
+        Stage(
+            "zip_agregado",
+            lambda _r: _zip_output(aggregated_csv, ZIP_NAME),
+            deps=(aggregated_dep,),
+            outputs=(OUTPUT_DIR / ZIP_NAME,),
+        ),
+    ]
+    if load_db:
+        stages.append(
+            Stage(
+                "banco",
+                lambda _r: _load_database(logger),
+                deps=("cadop", consolidado_dep, aggregated_dep),
+            )
+        )
+    return stages
+
+
+def _write_metrics(
+    logger: logging.Logger,
+    timestamp: str,
+    metrics: list[StageMetrics],
+    selected: list[str],
+    mode: str,
+    started: float,
+    success: bool,
+    prometheus_textfile: Optional[Path],
+) -> None:
+    """
+    Grava as metricas da execucao (JSON e, se configurado, textfile .prom).
 
+    Falhas de escrita sao apenas registradas, sem mascarar o resultado.
 
-def run_pipeline() -> None:
+    :param logger: Logger da pipeline.
+    :param timestamp: Timestamp da execucao.
+    :param metrics: Metricas por etapa.
+    :param selected: Etapas selecionadas.
+    :param mode: Modo de execucao.
+    :param started: Inicio da execucao (epoch).
+    :param success: Se a execucao terminou sem erro.
+    :param prometheus_textfile: Arquivo .prom ou None.
+    :return: None.
+    """
+    finished = time.time()
+    summary = {
+        "started_at": datetime.fromtimestamp(started).isoformat(timespec="seconds"),
+        "finished_at": datetime.fromtimestamp(finished).isoformat(timespec="seconds"),
+        "status": "sucesso" if success else "falha",
+        "mode": mode,
+        "wall_seconds": round(finished - started, 3),
+        "selected": selected,
+    }
+    try:
+        path = write_metrics_json(
+            LOG_DIR / f"pipeline_metrics_{timestamp}.json", metrics, summary
+        )
+        logger.info("Metricas gravadas em %s", path)
+        if prometheus_textfile:
+            write_prometheus_textfile(prometheus_textfile, metrics, success, finished)
+    except OSError as exc:
+        logger.warning("Falha ao gravar metricas: %s", exc)
+
+
+def run_pipeline(
+    only: Optional[list[str]] = None,
+    start: Optional[str] = None,
+    force: bool = False,
+    prometheus_textfile: Optional[Path] = PROMETHEUS_TEXTFILE,
+    load_db: bool = LOAD_DATABASE,
+    engine: str = ENGINE,
+) -> None:
     """
     Executa a pipeline completa do download ate a agregacao.
 
+    Etapas independentes rodam em paralelo e etapas cujas entradas e saidas
+    nao mudaram desde a ultima execucao sao puladas. As metricas de cada
+    etapa sao gravadas em pipeline_metrics_<timestamp>.json, ao lado do log.
+
+    :param only: Executa somente estas etapas (dependencias lidas do disco).
+    :param start: Executa a partir desta etapa (ela e as dependentes).
+    :param force: Se True, nao pula etapas inalteradas.
+    :param prometheus_textfile: Arquivo .prom para o node_exporter (opcional).
+    :param load_db: Se True, carrega as saidas no Postgres ao final.
+    :param engine: "pandas" ou "duckdb" (exige o pacote duckdb).
     :return: None.
     """
+    check_engine(engine)
     print("PROCESSANDO...")
-    logger = _setup_logger()
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    logger = _setup_logger(timestamp)
     logger.info("Iniciando pipeline")
-
+    if STREAM_CHUNK_ROWS:
+        mode = f"blocos de {STREAM_CHUNK_ROWS} linhas"
+        logger.info("Modo de execucao: em blocos de %s linhas", STREAM_CHUNK_ROWS)
+    elif FUSED_PIPELINE:
+        mode = "memoria"
+        logger.info("Modo de execucao: em memoria")
+    else:
+        mode = "Parquet" if USE_PARQUET else "CSV"
+        logger.info("Formato intermediario: %s", mode)
+    logger.info("Engine de execucao: %s", engine)
+
+    stages = _build_stages(logger, load_db, engine)
+    selected = select_stages(stages, only=only, start=start)
+    logger.info("Etapas selecionadas: %s", ", ".join(selected))
     _prepare_directories(logger)
 
+    metrics: list[StageMetrics] = []
+    started = time.time()
+    success = False
     try:
-        trimestre_items = _download_trimesters(logger)
-        _download_zips(logger, trimestre_items)
-        _extract_zips(logger, trimestre_items)
-
-        cadop_path = _ensure_cadop(logger)
-        _persist_cadop(logger, cadop_path)
-        consolidado_path = _consolidate(logger, cadop_path)
-        valid_path, _ = _validate(logger, consolidado_path)
-        enriched_path, _ = _enrich(logger, valid_path, cadop_path)
-        aggregated_path = _aggregate(logger, enriched_path)
-        logger.info("Gerando ZIP final")
-        _finalize_outputs(consolidado_path, aggregated_path)
+        run_stages(
+            stages,
+            selected,
+            state_dir=STAGES_DIR,
+            logger=logger,
+            workers=STAGE_WORKERS,
+            force=force,
+            metrics=metrics,
+        )
+        success = True
         logger.info("Pipeline finalizado com sucesso")
         print("FINALIZADO")
     finally:
         _cleanup_tmp(logger)
+        _write_metrics(
+            logger,
+            timestamp,
+            metrics,
+            selected,
+            mode,
+            started,
+            success,
+            prometheus_textfile,
+        )
+
+
+def _parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    """
+    Le os argumentos de linha de comando da pipeline.
+
+    :param argv: Argumentos (None usa sys.argv).
+    :return: Argumentos lidos.
+    """
+    parser = argparse.ArgumentParser(description="Pipeline de despesas da ANS.")
+    selection = parser.add_mutually_exclusive_group()
+    selection.add_argument(
+        "--only",
+        help="Etapas a executar, separadas por virgula (ex.: validar,agregar).",
+    )
+    selection.add_argument(
+        "--from", dest="start", help="Etapa inicial (executa ela e as seguintes)."
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Nao pula etapas inalteradas."
+    )
+    parser.add_argument(
+        "--prometheus-textfile",
+        type=Path,
+        default=PROMETHEUS_TEXTFILE,
+        help="Grava as metricas tambem neste arquivo .prom (node_exporter).",
+    )
+    parser.add_argument(
+        "--load-db",
+        action="store_true",
+        default=LOAD_DATABASE,
+        help="Carrega as saidas no Postgres ao final (etapa banco, exige .env).",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default=ENGINE,
+        help="Engine da consolidacao e da agregacao (duckdb exige o pacote duckdb).",
+    )
+    return parser.parse_args(argv)
 
 
 if __name__ == "__main__":
-    run_pipeline()
+    args = _parse_args()
+    run_pipeline(
+        only=args.only.split(",") if args.only else None,
+        start=args.start,
+        force=args.force,
+        prometheus_textfile=args.prometheus_textfile,
+        load_db=args.load_db,
+        engine=args.engine,
+    )
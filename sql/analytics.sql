@@ -1,4 +1,5 @@
 -- Etapa 3.4
+-- Periodos, medias e totais vem dos resumos materializados (ver ddl.sql).
 
 -- Query 1: 5 operadoras com maior crescimento percentual
 
@@ -13,13 +14,13 @@ JOIN ans.despesas_consolidadas i
   ON i.cnpj = f.cnpj
 WHERE (i.ano, i.trimestre) = (
         SELECT ano, trimestre
-        FROM ans.despesas_consolidadas
+        FROM ans.resumo_trimestre
         ORDER BY ano, trimestre
         LIMIT 1
       )
   AND (f.ano, f.trimestre) = (
         SELECT ano, trimestre
-        FROM ans.despesas_consolidadas
+        FROM ans.resumo_trimestre
         ORDER BY ano DESC, trimestre DESC
         LIMIT 1
       )
@@ -31,37 +32,30 @@ LIMIT 5;
 
 SELECT
     uf,
-    SUM(total_despesas) AS total_despesas_uf,
-    ROUND(AVG(total_despesas), 2) AS media_por_operadora_uf
-FROM ans.despesas_agregadas
-WHERE uf IS NOT NULL
-GROUP BY uf
+    total_despesas AS total_despesas_uf,
+    ROUND(media_por_operadora, 2) AS media_por_operadora_uf
+FROM ans.resumo_uf
 ORDER BY total_despesas_uf DESC
 LIMIT 5;
 
 -- Query 3: Quantas operadoras tiveram despesas acima da media geral
 
+WITH ultimos AS (
+    SELECT ano, trimestre, total_despesas, qtd_despesas
+    FROM ans.resumo_trimestre
+    ORDER BY ano DESC, trimestre DESC
+    LIMIT 3
+)
 SELECT COUNT(*) AS operadoras_acima_media_2_de_3
 FROM (
     SELECT d.cnpj, COUNT(*) AS qtd_acima
     FROM ans.despesas_consolidadas d
-    WHERE (d.ano, d.trimestre) IN (
-        SELECT ano, trimestre
-        FROM ans.despesas_consolidadas
-        GROUP BY ano, trimestre
-        ORDER BY ano DESC, trimestre DESC
-        LIMIT 3
-    )
+    WHERE (d.ano, d.trimestre) IN (SELECT ano, trimestre FROM ultimos)
+    -- Limite por ano: descarta as particoes antigas ja na execucao.
+    AND d.ano >= (SELECT MIN(ano) FROM ultimos)
     AND d.valor_despesas > (
-        SELECT AVG(x.valor_despesas)
-        FROM ans.despesas_consolidadas x
-        WHERE (x.ano, x.trimestre) IN (
-            SELECT ano, trimestre
-            FROM ans.despesas_consolidadas
-            GROUP BY ano, trimestre
-            ORDER BY ano DESC, trimestre DESC
-            LIMIT 3
-        )
+        SELECT SUM(total_despesas) / SUM(qtd_despesas)
+        FROM ultimos
     )
     GROUP BY d.cnpj
 ) t
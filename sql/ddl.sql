@@ -4,6 +4,9 @@
 -- Tipos:
 -- - Valores monetarios: numeric(18,5) para precisao (evita erros do float).
 -- - Datas: date para Data_Registro_ANS.
+-- Particionamento: consolidado por (ano, trimestre), exige PostgreSQL 11+.
+-- Resumos: views materializadas (por trimestre, operadora e UF) lidas pelas
+-- queries analiticas e pela API; atualize com ans.atualizar_resumos() apos cada carga.
 
 CREATE DATABASE ans_despesas;
 \connect ans_despesas
@@ -13,7 +16,7 @@ CREATE SCHEMA IF NOT EXISTS ans;
 
 -- Cadastro de operadoras
 CREATE TABLE IF NOT EXISTS ans.operadoras_cadop (
-    cnpj char(14) PRIMARY KEY CHECK (cnpj ~ '^[0-9]{14}$'),
+    cnpj char(14) PRIMARY KEY CHECK (length(cnpj) = 14 AND cnpj !~ '[^0-9]'),
     registro_operadora varchar(20) CHECK (registro_operadora IS NULL OR registro_operadora ~ '^[0-9]+$'),
     razao_social text NOT NULL CHECK (razao_social <> ''),
     nome_fantasia text,
@@ -43,15 +46,19 @@ CREATE INDEX IF NOT EXISTS idx_operadoras_uf
 
 
 -- Despesas consolidadas
+-- Particionada por trimestre: cada (ano, trimestre) e a particao
+-- ans.despesas_consolidadas_<ano>_<trimestre>. Filtros por periodo so leem as
+-- particoes do periodo e uma recarga troca o trimestre inteiro (ver
+-- ans.recarregar_consolidadas), sem upsert na tabela toda.
 CREATE TABLE IF NOT EXISTS ans.despesas_consolidadas (
-    cnpj char(14) NOT NULL CHECK (cnpj ~ '^[0-9]{14}$'),
+    cnpj char(14) NOT NULL CHECK (length(cnpj) = 14 AND cnpj !~ '[^0-9]'),
     razao_social text NOT NULL CHECK (razao_social <> ''),
     trimestre smallint NOT NULL CHECK (trimestre BETWEEN 1 AND 4),
     ano smallint NOT NULL CHECK (ano BETWEEN 2000 AND 2100),
     valor_despesas numeric(18,5) NOT NULL CHECK (valor_despesas > 0),
     PRIMARY KEY (cnpj, ano, trimestre),
     FOREIGN KEY (cnpj) REFERENCES ans.operadoras_cadop (cnpj)
-);
+) PARTITION BY RANGE (ano, trimestre);
 
 CREATE INDEX IF NOT EXISTS idx_consolidadas_cnpj
     ON ans.despesas_consolidadas (cnpj);
@@ -60,6 +67,131 @@ CREATE INDEX IF NOT EXISTS idx_consolidadas_ano_tri
     ON ans.despesas_consolidadas (ano, trimestre);
 
 
+-- Monta a nova versao de um trimestre em ans.despesas_consolidadas_<ano>_<tri>_carga
+-- a partir de uma tabela com as colunas do consolidado (ja tipadas), com os
+-- mesmos indices e FK da tabela pai: o ATTACH so os associa, sem reconstruir.
+CREATE OR REPLACE FUNCTION ans.preparar_particao_consolidadas(
+    p_origem regclass,
+    p_ano int,
+    p_trimestre int
+) RETURNS bigint
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_carga text := format('despesas_consolidadas_%s_%s_carga', p_ano, p_trimestre);
+    v_linhas bigint;
+BEGIN
+    EXECUTE format('DROP TABLE IF EXISTS ans.%I', v_carga);
+    EXECUTE format(
+        'CREATE TABLE ans.%I (LIKE ans.despesas_consolidadas INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+        v_carga
+    );
+    EXECUTE format(
+        'INSERT INTO ans.%I (cnpj, razao_social, trimestre, ano, valor_despesas) '
+        'SELECT cnpj, razao_social, trimestre, ano, valor_despesas FROM %s '
+        'WHERE ano = $1 AND trimestre = $2',
+        v_carga, p_origem
+    ) USING p_ano, p_trimestre;
+    GET DIAGNOSTICS v_linhas = ROW_COUNT;
+
+    EXECUTE format(
+        'ALTER TABLE ans.%I ADD CONSTRAINT %I PRIMARY KEY (cnpj, ano, trimestre)',
+        v_carga, v_carga || '_pkey'
+    );
+    EXECUTE format('CREATE INDEX %I ON ans.%I (cnpj)', v_carga || '_cnpj_idx', v_carga);
+    EXECUTE format(
+        'CREATE INDEX %I ON ans.%I (ano, trimestre)', v_carga || '_ano_trimestre_idx', v_carga
+    );
+    EXECUTE format(
+        'ALTER TABLE ans.%I ADD CONSTRAINT %I FOREIGN KEY (cnpj) '
+        'REFERENCES ans.operadoras_cadop (cnpj)',
+        v_carga, v_carga || '_cnpj_fkey'
+    );
+    -- CHECK igual ao limite da particao: o ATTACH dispensa a varredura.
+    EXECUTE format(
+        'ALTER TABLE ans.%I ADD CONSTRAINT limite_trimestre CHECK (ano = %s AND trimestre = %s)',
+        v_carga, p_ano, p_trimestre
+    );
+    RETURN v_linhas;
+END;
+$$;
+
+
+-- Troca a particao do trimestre pela versao _carga (DETACH + ATTACH). Rode na
+-- mesma transacao da preparacao: leitores veem o trimestre antigo ou o novo,
+-- nunca uma carga pela metade.
+CREATE OR REPLACE FUNCTION ans.trocar_particao_consolidadas(
+    p_ano int,
+    p_trimestre int
+) RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_particao text := format('despesas_consolidadas_%s_%s', p_ano, p_trimestre);
+    v_indice text;
+BEGIN
+    IF to_regclass(format('ans.%I', v_particao)) IS NOT NULL THEN
+        EXECUTE format(
+            'ALTER TABLE ans.despesas_consolidadas DETACH PARTITION ans.%I', v_particao
+        );
+        EXECUTE format('DROP TABLE ans.%I', v_particao);
+    END IF;
+    EXECUTE format('ALTER TABLE ans.%I RENAME TO %I', v_particao || '_carga', v_particao);
+    FOREACH v_indice IN ARRAY ARRAY['pkey', 'cnpj_idx', 'ano_trimestre_idx'] LOOP
+        EXECUTE format(
+            'ALTER INDEX ans.%I RENAME TO %I',
+            v_particao || '_carga_' || v_indice, v_particao || '_' || v_indice
+        );
+    END LOOP;
+    EXECUTE format(
+        'ALTER TABLE ans.%I RENAME CONSTRAINT %I TO %I',
+        v_particao, v_particao || '_carga_cnpj_fkey', v_particao || '_cnpj_fkey'
+    );
+    EXECUTE format(
+        'ALTER TABLE ans.despesas_consolidadas ATTACH PARTITION ans.%I '
+        'FOR VALUES FROM (%s, %s) TO (%s, %s)',
+        v_particao, p_ano, p_trimestre, p_ano, p_trimestre + 1
+    );
+    EXECUTE format('ALTER TABLE ans.%I DROP CONSTRAINT limite_trimestre', v_particao);
+END;
+$$;
+
+
+-- Recarrega os trimestres presentes em p_origem, substituindo cada um por
+-- inteiro. Todas as particoes sao montadas antes da primeira troca, entao o
+-- bloqueio da tabela pai (DETACH) dura so as trocas.
+CREATE OR REPLACE FUNCTION ans.recarregar_consolidadas(p_origem regclass)
+RETURNS bigint
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_periodos int[][];
+    v_periodo int[];
+    v_linhas bigint := 0;
+BEGIN
+    EXECUTE format(
+        'SELECT array_agg(DISTINCT ARRAY[ano::int, trimestre::int]) FROM %s', p_origem
+    ) INTO v_periodos;
+    IF v_periodos IS NULL THEN
+        RETURN 0;
+    END IF;
+    -- Varios trimestres: indexa a origem para nao varre-la inteira a cada um.
+    IF array_length(v_periodos, 1) > 1 THEN
+        EXECUTE format('CREATE INDEX ON %s (ano, trimestre)', p_origem);
+        EXECUTE format('ANALYZE %s', p_origem);
+    END IF;
+    FOREACH v_periodo SLICE 1 IN ARRAY v_periodos LOOP
+        v_linhas := v_linhas
+            + ans.preparar_particao_consolidadas(p_origem, v_periodo[1], v_periodo[2]);
+    END LOOP;
+    FOREACH v_periodo SLICE 1 IN ARRAY v_periodos LOOP
+        PERFORM ans.trocar_particao_consolidadas(v_periodo[1], v_periodo[2]);
+    END LOOP;
+    RETURN v_linhas;
+END;
+$$;
+
+
 -- Despesas agregadas
 CREATE TABLE IF NOT EXISTS ans.despesas_agregadas (
     razao_social text NOT NULL CHECK (razao_social <> ''),
@@ -72,3 +204,74 @@ CREATE TABLE IF NOT EXISTS ans.despesas_agregadas (
 
 CREATE INDEX IF NOT EXISTS idx_agregadas_uf
     ON ans.despesas_agregadas (uf);
+
+
+-- Resumos materializados (poucas centenas de linhas em vez da tabela de fatos).
+-- O indice unico de cada view permite o REFRESH ... CONCURRENTLY: leitores
+-- continuam vendo a versao anterior enquanto a nova e calculada.
+
+-- Total e quantidade de registros por trimestre (media = total / qtd).
+CREATE MATERIALIZED VIEW IF NOT EXISTS ans.resumo_trimestre AS
+SELECT
+    ano,
+    trimestre,
+    SUM(valor_despesas) AS total_despesas,
+    COUNT(*) AS qtd_despesas
+FROM ans.despesas_consolidadas
+GROUP BY ano, trimestre;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_resumo_trimestre
+    ON ans.resumo_trimestre (ano, trimestre);
+
+-- Total por operadora em todos os trimestres, com a razao social do CADOP.
+CREATE MATERIALIZED VIEW IF NOT EXISTS ans.resumo_operadora AS
+SELECT
+    t.cnpj,
+    COALESCE(c.razao_social, t.razao_social) AS razao_social,
+    t.total_despesas,
+    t.qtd_trimestres
+FROM (
+    SELECT
+        cnpj,
+        MAX(razao_social) AS razao_social,
+        SUM(valor_despesas) AS total_despesas,
+        COUNT(*) AS qtd_trimestres
+    FROM ans.despesas_consolidadas
+    GROUP BY cnpj
+) t
+LEFT JOIN ans.operadoras_cadop c
+  ON c.cnpj = t.cnpj;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_resumo_operadora
+    ON ans.resumo_operadora (cnpj);
+
+CREATE INDEX IF NOT EXISTS idx_resumo_operadora_total
+    ON ans.resumo_operadora (total_despesas DESC);
+
+-- Total e media por operadora em cada UF (a partir do agregado).
+CREATE MATERIALIZED VIEW IF NOT EXISTS ans.resumo_uf AS
+SELECT
+    uf,
+    SUM(total_despesas) AS total_despesas,
+    AVG(total_despesas) AS media_por_operadora,
+    COUNT(*) AS qtd_operadoras
+FROM ans.despesas_agregadas
+WHERE uf IS NOT NULL
+GROUP BY uf;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_resumo_uf
+    ON ans.resumo_uf (uf);
+
+
+-- Recalcula os resumos sem bloquear leituras. Rode depois de cada carga
+-- (import.sql e etl/load/db_loader.py ja chamam).
+CREATE OR REPLACE FUNCTION ans.atualizar_resumos()
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    REFRESH MATERIALIZED VIEW CONCURRENTLY ans.resumo_trimestre;
+    REFRESH MATERIALIZED VIEW CONCURRENTLY ans.resumo_operadora;
+    REFRESH MATERIALIZED VIEW CONCURRENTLY ans.resumo_uf;
+END;
+$$;
@@ -1,13 +1,41 @@
 -- Etapa 3.3
--- Execute via psql (necessario para \copy).
+-- Execute via psql (necessario para \copy e \if).
+-- Staging UNLOGGED (sem WAL), cada valor convertido uma unica vez; em carga
+-- completa (tabela vazia) os indices secundarios sao recriados depois do
+-- INSERT. Ao final: ANALYZE, resumos materializados e tempo de cada passo.
+
+\set ON_ERROR_STOP on
+SET maintenance_work_mem = '256MB';
+SET work_mem = '64MB';
+
+CREATE SCHEMA IF NOT EXISTS ans_stg;
+
+DROP TABLE IF EXISTS ans_stg.tempos;
+CREATE UNLOGGED TABLE ans_stg.tempos (
+    id int GENERATED ALWAYS AS IDENTITY,
+    etapa text NOT NULL,
+    fim timestamptz NOT NULL DEFAULT clock_timestamp()
+);
+INSERT INTO ans_stg.tempos (etapa) VALUES ('inicio');
+
+-- Texto monetario ("1.234,56" ou "1234.56") -> numeric(18,5); NULL se tiver
+-- caracteres fora de [0-9.,-]. Funcao SQL simples: o planner a expande inline.
+CREATE OR REPLACE FUNCTION ans_stg.valor(p_texto text) RETURNS numeric
+LANGUAGE sql IMMUTABLE
+AS $$
+    SELECT CASE
+        WHEN p_texto !~ '^[0-9.,-]+$' THEN NULL
+        WHEN strpos(p_texto, ',') > 0 THEN replace(replace(p_texto, '.', ''), ',', '.')::numeric(18,5)
+        ELSE p_texto::numeric(18,5)
+    END
+$$;
 
 -- =========================
 -- 1) CADOP
 -- =========================
-CREATE SCHEMA IF NOT EXISTS ans_stg;
 
 DROP TABLE IF EXISTS ans_stg.cadop;
-CREATE TABLE ans_stg.cadop (
+CREATE UNLOGGED TABLE ans_stg.cadop (
     registro_operadora text,
     cnpj text,
     razao_social text,
@@ -31,10 +59,23 @@ CREATE TABLE ans_stg.cadop (
 );
 
 \copy ans_stg.cadop FROM 'data/output/Relatorio_cadop.csv' WITH (FORMAT csv, HEADER true, DELIMITER ';', ENCODING 'UTF8');
+INSERT INTO ans_stg.tempos (etapa) VALUES ('cadop: copy');
+
+SELECT NOT EXISTS (SELECT 1 FROM ans.operadoras_cadop) AS cadop_vazia \gset
+BEGIN;
+\if :cadop_vazia
+DROP INDEX IF EXISTS ans.idx_operadoras_registro;
+DROP INDEX IF EXISTS ans.idx_operadoras_uf;
+\endif
 
-WITH cadop_clean AS (
+-- OFFSET 0 impede que o planner replique as expressoes no filtro. Apos a
+-- limpeza o CNPJ so tem digitos: basta conferir o tamanho.
+WITH cadop_tipado AS (
     SELECT
-        regexp_replace(cnpj, '[^0-9]', '', 'g') AS cnpj,
+        CASE
+            WHEN cnpj !~ '[^0-9]' THEN cnpj
+            ELSE regexp_replace(cnpj, '[^0-9]', '', 'g')
+        END AS cnpj,
         NULLIF(trim(registro_operadora), '') AS registro_operadora,
         NULLIF(trim(razao_social), '') AS razao_social,
         NULLIF(trim(nome_fantasia), '') AS nome_fantasia,
@@ -59,8 +100,7 @@ WITH cadop_clean AS (
             ELSE NULL
         END AS data_registro_ans
     FROM ans_stg.cadop
-    WHERE regexp_replace(cnpj, '[^0-9]', '', 'g') ~ '^[0-9]{14}$'
-      AND NULLIF(trim(razao_social), '') IS NOT NULL
+    OFFSET 0
 ),
 cadop_dedup AS (
     SELECT DISTINCT ON (cnpj)
@@ -84,7 +124,9 @@ cadop_dedup AS (
         cargo_representante,
         regiao_de_comercializacao,
         data_registro_ans
-    FROM cadop_clean
+    FROM cadop_tipado
+    WHERE length(cnpj) = 14
+      AND razao_social IS NOT NULL
     ORDER BY cnpj, data_registro_ans DESC NULLS LAST
 )
 INSERT INTO ans.operadoras_cadop (
@@ -157,11 +199,18 @@ WHERE EXCLUDED.data_registro_ans IS NOT NULL
         OR EXCLUDED.data_registro_ans >= ans.operadoras_cadop.data_registro_ans
       );
 
+CREATE INDEX IF NOT EXISTS idx_operadoras_registro
+    ON ans.operadoras_cadop (registro_operadora);
+CREATE INDEX IF NOT EXISTS idx_operadoras_uf
+    ON ans.operadoras_cadop (uf);
+COMMIT;
+INSERT INTO ans_stg.tempos (etapa) VALUES ('cadop: upsert + indices');
+
 -- =========================
 -- 2) CONSOLIDADO
 -- =========================
 DROP TABLE IF EXISTS ans_stg.consolidado;
-CREATE TABLE ans_stg.consolidado (
+CREATE UNLOGGED TABLE ans_stg.consolidado (
     cnpj text,
     razao_social text,
     trimestre text,
@@ -171,44 +220,43 @@ CREATE TABLE ans_stg.consolidado (
 
 -- Descompacte data/output/consolidado_despesas.zip antes de importar.
 \copy ans_stg.consolidado FROM 'data/output/consolidado_despesas.csv' WITH (FORMAT csv, HEADER true, ENCODING 'UTF8');
+INSERT INTO ans_stg.tempos (etapa) VALUES ('consolidado: copy');
 
-INSERT INTO ans.despesas_consolidadas (
-    cnpj,
-    razao_social,
-    trimestre,
-    ano,
-    valor_despesas
-)
-SELECT
-    regexp_replace(cnpj, '[^0-9]', '', 'g') AS cnpj,
-    NULLIF(trim(razao_social), ''),
-    trimestre::smallint,
-    ano::smallint,
-    CASE
-        WHEN valor_despesas ~ ',' THEN regexp_replace(replace(valor_despesas, '.', ''), ',', '.', 'g')::numeric(18,5)
-        ELSE valor_despesas::numeric(18,5)
-    END
-FROM ans_stg.consolidado
-WHERE regexp_replace(cnpj, '[^0-9]', '', 'g') ~ '^[0-9]{14}$'
-  AND NULLIF(trim(razao_social), '') IS NOT NULL
-  AND trimestre ~ '^[1-4]$'
-  AND ano ~ '^[0-9]{4}$'
-  AND valor_despesas ~ '^[0-9.,-]+$'
-  AND (
+-- Linhas validas ja tipadas; cada trimestre presente e recarregado por inteiro
+-- (particao nova + DETACH/ATTACH em uma transacao, ver ddl.sql). Ordenar por
+-- trimestre deixa as linhas de cada particao contiguas na staging.
+DROP TABLE IF EXISTS ans_stg.consolidado_tipado;
+CREATE UNLOGGED TABLE ans_stg.consolidado_tipado AS
+SELECT cnpj, razao_social, trimestre, ano, valor_despesas
+FROM (
+    SELECT
         CASE
-            WHEN valor_despesas ~ ',' THEN regexp_replace(replace(valor_despesas, '.', ''), ',', '.', 'g')::numeric(18,5)
-            ELSE valor_despesas::numeric(18,5)
-        END
-      ) > 0
-ON CONFLICT (cnpj, ano, trimestre) DO UPDATE SET
-    razao_social = EXCLUDED.razao_social,
-    valor_despesas = EXCLUDED.valor_despesas;
+            WHEN cnpj !~ '[^0-9]' THEN cnpj
+            ELSE regexp_replace(cnpj, '[^0-9]', '', 'g')
+        END AS cnpj,
+        NULLIF(trim(razao_social), '') AS razao_social,
+        CASE WHEN trimestre IN ('1', '2', '3', '4') THEN trimestre::smallint END AS trimestre,
+        CASE WHEN length(ano) = 4 AND ano !~ '[^0-9]' THEN ano::smallint END AS ano,
+        ans_stg.valor(valor_despesas) AS valor_despesas
+    FROM ans_stg.consolidado
+    OFFSET 0
+) AS tipado
+WHERE length(cnpj) = 14
+  AND razao_social IS NOT NULL
+  AND trimestre IS NOT NULL
+  AND ano IS NOT NULL
+  AND valor_despesas > 0
+ORDER BY ano, trimestre;
+INSERT INTO ans_stg.tempos (etapa) VALUES ('consolidado: conversao');
+
+SELECT ans.recarregar_consolidadas('ans_stg.consolidado_tipado') AS linhas_consolidado;
+INSERT INTO ans_stg.tempos (etapa) VALUES ('consolidado: particoes');
 
 -- =========================
 -- 3) AGREGADO
 -- =========================
 DROP TABLE IF EXISTS ans_stg.agregadas;
-CREATE TABLE ans_stg.agregadas (
+CREATE UNLOGGED TABLE ans_stg.agregadas (
     razao_social text,
     uf text,
     total_despesas text,
@@ -217,6 +265,13 @@ CREATE TABLE ans_stg.agregadas (
 );
 
 \copy ans_stg.agregadas FROM 'data/output/despesas_agregadas.csv' WITH (FORMAT csv, HEADER true, ENCODING 'UTF8');
+INSERT INTO ans_stg.tempos (etapa) VALUES ('agregadas: copy');
+
+SELECT NOT EXISTS (SELECT 1 FROM ans.despesas_agregadas) AS agregadas_vazia \gset
+BEGIN;
+\if :agregadas_vazia
+DROP INDEX IF EXISTS ans.idx_agregadas_uf;
+\endif
 
 INSERT INTO ans.despesas_agregadas (
     razao_social,
@@ -226,48 +281,62 @@ INSERT INTO ans.despesas_agregadas (
     desvio_padrao_despesas
 )
 SELECT
-    NULLIF(trim(razao_social), ''),
-    upper(NULLIF(trim(uf), '')),
-    CASE
-        WHEN total_despesas ~ ',' THEN regexp_replace(replace(total_despesas, '.', ''), ',', '.', 'g')::numeric(18,5)
-        ELSE total_despesas::numeric(18,5)
-    END,
-    CASE
-        WHEN media_despesas ~ ',' THEN regexp_replace(replace(media_despesas, '.', ''), ',', '.', 'g')::numeric(18,5)
-        ELSE media_despesas::numeric(18,5)
-    END,
-    CASE
-        WHEN desvio_padrao_despesas ~ ',' THEN regexp_replace(replace(desvio_padrao_despesas, '.', ''), ',', '.', 'g')::numeric(18,5)
-        ELSE desvio_padrao_despesas::numeric(18,5)
-    END
-FROM ans_stg.agregadas
-WHERE NULLIF(trim(razao_social), '') IS NOT NULL
-  AND length(trim(uf)) = 2
-  AND total_despesas ~ '^[0-9.,-]+$'
-  AND media_despesas ~ '^[0-9.,-]+$'
-  AND desvio_padrao_despesas ~ '^[0-9.,-]+$'
-  AND (
-        CASE
-            WHEN total_despesas ~ ',' THEN regexp_replace(replace(total_despesas, '.', ''), ',', '.', 'g')::numeric(18,5)
-            ELSE total_despesas::numeric(18,5)
-        END
-      ) > 0
-  AND (
-        CASE
-            WHEN media_despesas ~ ',' THEN regexp_replace(replace(media_despesas, '.', ''), ',', '.', 'g')::numeric(18,5)
-            ELSE media_despesas::numeric(18,5)
-        END
-      ) > 0
-  AND (
-        CASE
-            WHEN desvio_padrao_despesas ~ ',' THEN regexp_replace(replace(desvio_padrao_despesas, '.', ''), ',', '.', 'g')::numeric(18,5)
-            ELSE desvio_padrao_despesas::numeric(18,5)
-        END
-      ) >= 0
+    razao_social,
+    uf,
+    total_despesas,
+    media_despesas,
+    desvio_padrao_despesas
+FROM (
+    SELECT
+        NULLIF(trim(razao_social), '') AS razao_social,
+        upper(NULLIF(trim(uf), '')) AS uf,
+        ans_stg.valor(total_despesas) AS total_despesas,
+        ans_stg.valor(media_despesas) AS media_despesas,
+        ans_stg.valor(desvio_padrao_despesas) AS desvio_padrao_despesas
+    FROM ans_stg.agregadas
+    OFFSET 0
+) AS tipado
+WHERE razao_social IS NOT NULL
+  AND length(uf) = 2
+  AND total_despesas > 0
+  AND media_despesas > 0
+  AND desvio_padrao_despesas >= 0
 ON CONFLICT (razao_social, uf) DO UPDATE SET
     total_despesas = EXCLUDED.total_despesas,
     media_despesas = EXCLUDED.media_despesas,
     desvio_padrao_despesas = EXCLUDED.desvio_padrao_despesas;
 
+CREATE INDEX IF NOT EXISTS idx_agregadas_uf
+    ON ans.despesas_agregadas (uf);
+COMMIT;
+INSERT INTO ans_stg.tempos (etapa) VALUES ('agregadas: upsert + indices');
+
+-- =========================
+-- 4) ESTATISTICAS, RESUMOS E TEMPOS
+-- =========================
+ANALYZE ans.operadoras_cadop;
+ANALYZE ans.despesas_consolidadas;
+ANALYZE ans.despesas_agregadas;
+INSERT INTO ans_stg.tempos (etapa) VALUES ('analyze');
+
+-- Resumos lidos por analytics.sql e pela API (REFRESH CONCURRENTLY, ver ddl.sql).
+SELECT ans.atualizar_resumos();
+INSERT INTO ans_stg.tempos (etapa) VALUES ('resumos');
+
+-- Duracao de cada passo (ms) e total da importacao.
+SELECT etapa, ms
+FROM (
+    SELECT
+        id,
+        etapa,
+        round(extract(epoch FROM fim - lag(fim) OVER (ORDER BY id)) * 1000) AS ms
+    FROM ans_stg.tempos
+    UNION ALL
+    SELECT NULL, 'total', round(extract(epoch FROM max(fim) - min(fim)) * 1000)
+    FROM ans_stg.tempos
+) AS passos
+WHERE etapa <> 'inicio'
+ORDER BY id NULLS LAST;
+
 -- Limpeza: remove o schema temporario de staging apos a importacao
 DROP SCHEMA IF EXISTS ans_stg CASCADE;
@@ -0,0 +1,81 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from etl.process.aggregate_despesas import aggregate
+from etl.process.duckdb_engine import duckdb_available
+
+
+def _enriched(path: Path, quarters: list, bump: int = 0) -> Path:
+    """
+    Grava um enriquecido minimo com duas operadoras por trimestre.
+    """
+    rows = [
+        {
+            "RazaoSocial": razao,
+            "UF": "SP",
+            "Ano": 2024,
+            "Trimestre": tri,
+            "ValorDespesas": f"{tri * 100 + offset + bump},50",
+        }
+        for tri in quarters
+        for offset, razao in enumerate(["A", "B"])
+    ]
+    pd.DataFrame(rows).to_csv(path, index=False)
+    return path
+
+
+def test_estado_em_janela_igual_a_agregar_tudo(tmp_path: Path) -> None:
+    """
+    Com estado e janela de 3 trimestres, o agregado e o mesmo da entrada atual.
+    """
+    state = tmp_path / "agregado.json.gz"
+    out = tmp_path / "agregado.csv"
+    aggregate(_enriched(tmp_path / "a.csv", [1, 2, 3]), out, state_file=state)
+
+    second = _enriched(tmp_path / "b.csv", [2, 3, 4])
+    for _ in range(2):
+        aggregate(second, out, state_file=state, keep_quarters=3)
+        incremental = pd.read_csv(out)
+        aggregate(second, tmp_path / "completo.csv")
+        assert incremental.equals(pd.read_csv(tmp_path / "completo.csv"))
+
+
+@pytest.mark.parametrize(
+    "engine, chunk_rows",
+    [("pandas", None), ("pandas", 1), ("duckdb", None)],
+    ids=["pandas", "blocos", "duckdb"],
+)
+def test_so_trimestres_novos_ou_alterados_sao_relidos(
+    tmp_path: Path, engine: str, chunk_rows
+) -> None:
+    """
+    Com impressoes digitais, so os trimestres novos ou alterados sao lidos e os
+    que sairam da entrada saem do estado.
+    """
+    if engine == "duckdb" and not duckdb_available():
+        pytest.skip("duckdb nao instalado")
+    state = tmp_path / "agregado.json.gz"
+    out = tmp_path / "agregado.csv"
+    options = dict(chunk_rows=chunk_rows, engine=engine, state_file=state)
+    first = {(2024, tri): f"v{tri}" for tri in (1, 2, 3)}
+    aggregate(_enriched(tmp_path / "a.csv", [1, 2, 3]), out, quarters=first, **options)
+
+    # Trimestre 3 republicado com outros valores e trimestre 4 novo.
+    second = _enriched(tmp_path / "b.csv", [2, 3, 4], bump=7)
+    pd.concat(
+        [
+            pd.read_csv(_enriched(tmp_path / "t2.csv", [2]), dtype=str),
+            pd.read_csv(second, dtype=str).iloc[2:],
+        ]
+    ).to_csv(second, index=False)
+    quarters = {(2024, 2): "v2", (2024, 3): "v3b", (2024, 4): "v4"}
+    rows_in, _ = aggregate(second, out, quarters=quarters, **options)
+    assert rows_in == 4
+    aggregate(second, tmp_path / "completo.csv")
+    assert pd.read_csv(out).equals(pd.read_csv(tmp_path / "completo.csv"))
+
+    rows_in, _ = aggregate(second, out, quarters=quarters, **options)
+    assert rows_in == 0
+    assert pd.read_csv(out).equals(pd.read_csv(tmp_path / "completo.csv"))
@@ -0,0 +1,38 @@
+from pathlib import Path
+
+from etl.process import cadop_index
+
+HEADER = "REGISTRO_OPERADORA;CNPJ;Razao_Social;Modalidade;UF;Data_Registro_ANS\n"
+
+
+def _cadop(path: Path, razao: str) -> Path:
+    """
+    Grava um CADOP minimo com CNPJ formatado como no arquivo da ANS.
+    """
+    path.write_text(
+        HEADER + f"123;07.644.806/2059-95;{razao};Medicina;SP;2020-01-01\n",
+        encoding="utf-8",
+    )
+    return path
+
+
+def test_cnpj_original_na_saida_e_digitos_no_join(tmp_path: Path) -> None:
+    """
+    by_registro mantem o texto do CADOP; by_cnpj e indexada pelos digitos.
+    """
+    index = cadop_index.load_cadop_index(_cadop(tmp_path / "c.csv", "A"), None)
+    assert index.by_registro.loc["123", "CNPJ"] == "07.644.806/2059-95"
+    assert index.by_cnpj.loc["07644806205995", "RazaoSocial"] == "A"
+
+
+def test_dois_cadops_nao_se_apagam(tmp_path: Path) -> None:
+    """
+    Alternar entre dois CADOPs reaproveita os dois snapshots.
+    """
+    cache = tmp_path / "cache"
+    first = _cadop(tmp_path / "a.csv", "A")
+    second = _cadop(tmp_path / "b.csv", "B")
+    for path in (first, second):
+        cadop_index.load_cadop_index(path, cache)
+    snapshots = sorted(cache.glob(f"{cadop_index.SNAPSHOT_PREFIX}*.pkl"))
+    assert len(snapshots) == 2
@@ -0,0 +1,52 @@
+from pathlib import Path
+
+import pytest
+
+from etl.bench.synthetic_ans import generate_dataset
+from etl.process.consolidate_despesas import consolidate
+from etl.process.duckdb_engine import duckdb_available
+
+MODES = {
+    "prefiltro": {"prefilter": True},
+    "processos": {"workers": 2},
+    "duckdb": {"engine": "duckdb"},
+    "parciais": {"cache_dir": Path("parciais")},
+}
+
+
+@pytest.fixture(scope="module")
+def dataset(tmp_path_factory: pytest.TempPathFactory):
+    """
+    Base sintetica pequena, compartilhada pelos modos.
+    """
+    return generate_dataset(
+        tmp_path_factory.mktemp("ans"), rows=4000, operators=60, quarters=4, seed=11
+    )
+
+
+@pytest.mark.parametrize("mode", list(MODES))
+def test_modos_da_consolidacao_gravam_o_mesmo_arquivo(
+    dataset, tmp_path: Path, monkeypatch: pytest.MonkeyPatch, mode: str
+) -> None:
+    """
+    Pre-filtro, leitura em processos, DuckDB e parciais por trimestre (frios e
+    reaproveitados) geram os mesmos bytes da consolidacao sequencial.
+    """
+    if mode == "duckdb" and not duckdb_available():
+        pytest.skip("duckdb nao instalado")
+    monkeypatch.chdir(tmp_path)
+
+    def run(name: str, **options) -> bytes:
+        output = consolidate(
+            extract_dir=dataset.raw_dir,
+            cadop_path=dataset.cadop_path,
+            output_file=tmp_path / f"{name}.csv",
+            **options,
+        )
+        return output.read_bytes()
+
+    expected = run("sequencial")
+    assert run(mode, **MODES[mode]) == expected
+    if mode == "parciais":
+        assert any((tmp_path / "parciais").rglob("*"))
+        assert run("parciais_reaproveitados", **MODES[mode]) == expected
@@ -0,0 +1,66 @@
+from pathlib import Path
+
+import pandas as pd
+
+from etl.load.db_loader import agregado_frames, consolidado_frames
+
+
+def _rows(frames) -> list:
+    """
+    Junta os blocos em uma lista de tuplas (nulos como None).
+    """
+    df = pd.concat(list(frames), ignore_index=True)
+    return [
+        tuple(None if pd.isna(value) else value for value in row)
+        for row in df.itertuples(index=False)
+    ]
+
+
+def test_consolidado_aplica_as_regras_do_import_sql(tmp_path: Path) -> None:
+    """
+    CNPJ so com digitos, razao social sem espacos nas pontas, trimestre 1-4,
+    ano com 4 digitos e valor > 0 (NULL fora de [0-9.,-]), como no import.sql.
+    """
+    path = tmp_path / "consolidado_despesas.csv"
+    path.write_text(
+        "CNPJ,RazaoSocial,Trimestre,Ano,ValorDespesas\n"
+        '12.345.678/0001-95,"  Operadora A ",1,2024,"1.234,56"\n'
+        "12345678000195,Operadora A,2,2024,1234.5\n"
+        "1234567800019,Curto,1,2024,10\n"
+        '12345678000195,"   ",1,2024,10\n'
+        "12345678000195,Trimestre,5,2024,10\n"
+        "12345678000195,Ano,1,24,10\n"
+        "12345678000195,Zero,1,2024,0\n"
+        "12345678000195,Negativo,1,2024,-5\n"
+        '12345678000195,Moeda,1,2024,"R$ 10"\n'
+        "12345678000195,Vazio,1,2024,\n",
+        encoding="utf-8",
+    )
+    assert _rows(consolidado_frames(path)) == [
+        ("12345678000195", "Operadora A", "1", "2024", "1234.56000"),
+        ("12345678000195", "Operadora A", "2", "2024", "1234.5"),
+    ]
+
+
+def test_agregado_aplica_as_regras_do_import_sql(tmp_path: Path) -> None:
+    """
+    UF em maiusculas com 2 letras, total e media > 0 e desvio >= 0, como no
+    import.sql.
+    """
+    path = tmp_path / "despesas_agregadas.csv"
+    path.write_text(
+        "RazaoSocial,UF,TotalDespesas,MediaDespesas,DesvioPadraoDespesas\n"
+        '" Operadora A ",sp,"1.000,50","500,25",0\n'
+        'Operadora B," mg ",10,10,"1,5"\n'
+        "Operadora C,SPX,10,10,1\n"
+        "Operadora D,RJ,10,10,-1\n"
+        "Operadora E,RJ,0,0,0\n"
+        'Operadora F,RJ,10,"0,00",0\n'
+        ",RJ,10,10,1\n"
+        "Operadora G,RJ,10,10,\n",
+        encoding="utf-8",
+    )
+    assert _rows(agregado_frames(path)) == [
+        ("Operadora A", "SP", "1000.50000", "500.25000", "0"),
+        ("Operadora B", "MG", "10", "10", "1.50000"),
+    ]
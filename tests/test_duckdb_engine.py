@@ -0,0 +1,55 @@
+from pathlib import Path
+
+import pytest
+
+from etl.bench.synthetic_ans import generate_dataset
+from etl.process.aggregate_despesas import aggregate
+from etl.process.consolidate_despesas import consolidate
+from etl.process.duckdb_engine import duckdb_available
+from etl.process.enrich_consolidado import enrich
+from etl.process.validate_consolidado import validate
+
+pytestmark = pytest.mark.skipif(not duckdb_available(), reason="duckdb nao instalado")
+
+
+def _run(dataset, out: Path, engine: str) -> list:
+    """
+    Consolida, valida, enriquece e agrega com o engine informado.
+    """
+    out.mkdir(parents=True)
+    consolidado = consolidate(
+        extract_dir=dataset.raw_dir,
+        cadop_path=dataset.cadop_path,
+        output_file=out / "consolidado.csv",
+        engine=engine,
+    )
+    validate(
+        input_file=consolidado,
+        valid_file=out / "validado.csv",
+        invalid_file=out / "inconsistencias_2_1.csv",
+    )
+    enrich(
+        input_file=out / "validado.csv",
+        cadop_path=dataset.cadop_path,
+        output_file=out / "enriquecido.csv",
+        missing_file=out / "inconsistencias_2_2.csv",
+    )
+    aggregate(out / "enriquecido.csv", out / "agregado.csv", engine=engine)
+    return sorted(out.iterdir())
+
+
+def test_duckdb_gera_saidas_identicas_ao_pandas(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    Com os formatos de arquivo do gerador, os dois engines gravam os mesmos bytes.
+    """
+    monkeypatch.chdir(tmp_path)
+    dataset = generate_dataset(
+        tmp_path / "ans", rows=4000, operators=60, quarters=4, seed=7
+    )
+    pandas_files = _run(dataset, tmp_path / "pandas", "pandas")
+    duckdb_files = _run(dataset, tmp_path / "duckdb", "duckdb")
+    assert [p.name for p in pandas_files] == [p.name for p in duckdb_files]
+    for left, right in zip(pandas_files, duckdb_files):
+        assert left.read_bytes() == right.read_bytes(), left.name
@@ -0,0 +1,35 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from etl.process.frame_io import parquet_available, read_frame, write_frame
+from etl.process.money import MONEY_DTYPE, to_money
+
+VALUES = pd.Series([123450000, -5, None], dtype=MONEY_DTYPE)
+
+
+def _frame() -> "pd.DataFrame":
+    """
+    Consolidado minimo com o valor em 1/MONEY_SCALE.
+    """
+    return pd.DataFrame({"CNPJ": ["1", "2", "3"], "ValorDespesas": VALUES})
+
+
+def test_csv_grava_texto_com_5_casas(tmp_path: Path) -> None:
+    """
+    No CSV de entrega o valor inteiro sai como texto exato.
+    """
+    text = read_frame(write_frame(_frame(), tmp_path / "c.csv"))["ValorDespesas"]
+    assert text[:2].tolist() == ["1234.50000", "-0.00005"] and pd.isna(text[2])
+    assert to_money(text).equals(VALUES)
+
+
+@pytest.mark.skipif(not parquet_available(), reason="pyarrow ausente")
+def test_parquet_mantem_inteiro_sem_reconverter(tmp_path: Path) -> None:
+    """
+    No Parquet o valor fica inteiro e to_money nao volta ao texto.
+    """
+    read = read_frame(write_frame(_frame(), tmp_path / "c.parquet"))
+    assert pd.api.types.is_integer_dtype(read["ValorDespesas"].dtype)
+    assert to_money(read["ValorDespesas"]).equals(VALUES)
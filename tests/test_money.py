@@ -0,0 +1,42 @@
+import pandas as pd
+import pytest
+
+from etl.process.money import MONEY_LIMIT, parse_money, parse_money_value
+
+# Casos de borda: separadores, arredondamento na 6a casa e limite do numeric(18,5).
+CASES = [
+    "1234.56",
+    "1.234,56",
+    "-1.234,56",
+    "0,000005",
+    "0.000004",
+    "1e3",
+    "abc",
+    "",
+    "1.2.3",
+    "9999999999999.99999",
+    "9999999999999.999994",
+    "9999999999999.999995",
+    "-9999999999999.999995",
+    "9.999.999.999.999,999995",
+    "10000000000000",
+]
+
+
+def test_parse_money_igual_ao_escalar() -> None:
+    """
+    O caminho vetorizado devolve o mesmo que parse_money_value linha a linha.
+    """
+    parsed = parse_money(pd.Series(CASES, dtype=object))
+    expected = [parse_money_value(text) for text in CASES]
+    assert [None if pd.isna(value) else int(value) for value in parsed] == expected
+
+
+@pytest.mark.parametrize("text", ["9999999999999.999995", "-9999999999999.999995"])
+def test_arredondamento_fora_da_faixa_vira_zero(text: str) -> None:
+    """
+    Arredondar para cima nao pode gerar valor fora do numeric(18,5).
+    """
+    value = int(parse_money(pd.Series([text]))[0])
+    assert value == 0
+    assert abs(value) < MONEY_LIMIT
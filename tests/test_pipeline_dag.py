@@ -0,0 +1,34 @@
+import logging
+from pathlib import Path
+
+from etl.pipeline_dag import Stage, run_stages
+
+
+def test_mudanca_de_configuracao_reexecuta_a_etapa(tmp_path: Path) -> None:
+    """
+    Com entradas e saidas iguais, a etapa so e pulada se a configuracao
+    tambem for a mesma da ultima execucao.
+    """
+    output = tmp_path / "saida.txt"
+    calls = []
+
+    def run(_results: dict) -> list:
+        calls.append(1)
+        output.write_text("saida", encoding="utf-8")
+        return [output]
+
+    def execute(config: dict) -> None:
+        stage = Stage("etapa", run, outputs=(output,), config=config)
+        run_stages(
+            [stage],
+            ["etapa"],
+            state_dir=tmp_path / "stages",
+            logger=logging.getLogger("test_pipeline_dag"),
+        )
+
+    execute({"engine": "pandas", "limit_quarters": 3})
+    execute({"limit_quarters": 3, "engine": "pandas"})
+    assert len(calls) == 1
+    execute({"engine": "duckdb", "limit_quarters": 3})
+    execute({"engine": "duckdb", "limit_quarters": 4})
+    assert len(calls) == 3
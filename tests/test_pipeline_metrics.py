@@ -0,0 +1,54 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from etl.pipeline_metrics import measure_stage, write_prometheus_textfile
+
+
+def _busy(seconds: float) -> None:
+    """
+    Consome CPU na thread atual por alguns segundos.
+    """
+    end = time.thread_time() + seconds
+    while time.thread_time() < end:
+        pass
+
+
+def test_cpu_de_pool_de_threads_entra_na_etapa() -> None:
+    """
+    A CPU gasta pelas threads de um pool aberto pela etapa e contada.
+    """
+    with measure_stage("pool") as metrics:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(_busy, [0.1, 0.1]))
+    assert metrics.cpu_seconds >= 0.15
+
+
+def test_etapas_simultaneas_e_rss_do_processo(tmp_path: Path) -> None:
+    """
+    Etapas sobrepostas ficam marcadas e o RSS sai como gauge do processo.
+    """
+    inner_open = threading.Event()
+    release = threading.Event()
+    stages = []
+
+    def inner() -> None:
+        with measure_stage("b") as metrics:
+            inner_open.set()
+            release.wait()
+        stages.append(metrics)
+
+    with measure_stage("a") as outer:
+        thread = threading.Thread(target=inner)
+        thread.start()
+        inner_open.wait()
+        release.set()
+        thread.join()
+    stages.append(outer)
+    assert [s.concurrent_stages for s in stages] == [2, 2]
+
+    text = write_prometheus_textfile(tmp_path / "m.prom", stages, True, 0.0)
+    content = text.read_text(encoding="utf-8")
+    assert "stage_peak_rss_mb" not in content
+    assert "\nans_pipeline_process_peak_rss_mb " in content
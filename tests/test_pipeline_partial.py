@@ -0,0 +1,165 @@
+import dataclasses
+import logging
+from pathlib import Path
+
+import pytest
+
+from etl import run_pipeline as rp
+from etl.fetch import raw_cache
+from etl.pipeline_dag import run_stages, select_stages
+
+ITEMS = [
+    {"url": f"http://ans.invalid/{tri}T2024.zip", "filename": f"{tri}T2024.zip"}
+    for tri in (1, 2, 3)
+]
+
+
+def _fake_download(url: str, part: Path, headers: dict, unchanged) -> tuple:
+    """
+    Simula o download: grava o nome da URL como conteudo.
+    """
+    part.write_bytes(url.encode("utf-8"))
+    return part.stat().st_size, {"ETag": f'"{url}"'}
+
+
+def _download_items(items: list, raw_dir: Path, **_kwargs) -> list:
+    """
+    Baixa os itens pelo cache persistente real, com a rede simulada.
+    """
+    return [
+        raw_cache.fetch(
+            item["url"],
+            raw_dir / item["filename"],
+            _fake_download,
+            cache_dir=rp.CACHE_DIR,
+        )[0]
+        for item in items
+    ]
+
+
+def _write_outputs(stage) -> object:
+    """
+    Troca a funcao da etapa por uma que so grava as saidas declaradas.
+    """
+
+    def run(_results: dict) -> list:
+        for path in stage.outputs:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(stage.name, encoding="utf-8")
+        return list(stage.outputs)
+
+    return dataclasses.replace(stage, run=run)
+
+
+@pytest.fixture
+def pipeline(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> list:
+    """
+    Pipeline em tmp_path com rede e processamento simulados.
+
+    Retorna a lista que recebe os ZIPs vistos pela consolidacao.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(rp, "USE_PARQUET", False)
+    monkeypatch.setattr(rp, "get_last_trimesters", lambda _limit: ITEMS)
+    monkeypatch.setattr(rp, "download_items", _download_items)
+
+    def ensure_cadop(_logger: logging.Logger) -> Path:
+        rp.CADOP_OUTPUT.parent.mkdir(parents=True, exist_ok=True)
+        rp.CADOP_OUTPUT.write_text("cadop", encoding="utf-8")
+        return rp.CADOP_OUTPUT
+
+    monkeypatch.setattr(rp, "_ensure_cadop", ensure_cadop)
+    monkeypatch.setattr(rp, "_persist_cadop", lambda _logger, path: path)
+
+    seen: list = []
+
+    def consolidate(_logger, raw_dir: Path, _cadop: Path, *outputs: Path) -> list:
+        seen.append(sorted(p.read_bytes().decode() for p in raw_dir.rglob("*.zip")))
+        for path in outputs:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text("saida", encoding="utf-8")
+        return list(outputs)
+
+    monkeypatch.setattr(
+        rp,
+        "_consolidate",
+        lambda lg, raw, cadop, *_: consolidate(
+            lg, raw, cadop, rp._stage_path("consolidado_despesas")
+        )[0],
+    )
+    monkeypatch.setattr(
+        rp,
+        "_run_fused_stage",
+        lambda lg, raw, cadop, *_: consolidate(
+            lg,
+            raw,
+            cadop,
+            *rp._outputs(
+                "consolidado_despesas",
+                "consolidado_validado",
+                "inconsistencias_2_1",
+                "consolidado_enriquecido",
+                "inconsistencias_2_2",
+                "despesas_agregadas",
+            ),
+        ),
+    )
+    return seen
+
+
+def _run(**selection) -> None:
+    """
+    Executa como run_pipeline: TMP_DIR limpo e etapas apos a consolidacao
+    trocadas por gravadores das saidas declaradas.
+    """
+    logger = logging.getLogger("test_pipeline_partial")
+    stages = [
+        (
+            stage
+            if stage.name in ("trimestres", "zips", "cadop", "consolidar")
+            or (
+                stage.name == "processar"
+                and rp.FUSED_PIPELINE
+                and not rp.STREAM_CHUNK_ROWS
+            )
+            else _write_outputs(stage)
+        )
+        for stage in rp._build_stages(logger)
+    ]
+    rp._prepare_directories(logger)
+    run_stages(
+        stages,
+        select_stages(stages, **selection),
+        state_dir=rp.STAGES_DIR,
+        logger=logger,
+        force=True,
+    )
+
+
+@pytest.mark.parametrize(
+    "fused, stream, selection",
+    [
+        (True, None, {"only": ["processar"]}),
+        (True, None, {"start": "processar"}),
+        (False, None, {"start": "consolidar"}),
+        (False, 50, {"start": "consolidar"}),
+    ],
+    ids=["memoria_only", "memoria_from", "etapas_from", "blocos_from"],
+)
+def test_segunda_execucao_parcial_le_zips_do_cache(
+    pipeline: list,
+    monkeypatch: pytest.MonkeyPatch,
+    fused: bool,
+    stream,
+    selection: dict,
+) -> None:
+    """
+    Sem a etapa zips, a consolidacao le os ZIPs da execucao anterior.
+    """
+    monkeypatch.setattr(rp, "FUSED_PIPELINE", fused)
+    monkeypatch.setattr(rp, "STREAM_CHUNK_ROWS", stream)
+    _run()
+    # A segunda execucao limpa TMP_DIR (e RAW_DIR) antes de rodar.
+    _run(**selection)
+    expected = sorted(item["url"] for item in ITEMS)
+    assert pipeline == [expected, expected]
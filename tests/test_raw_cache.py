@@ -0,0 +1,222 @@
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+import pytest
+
+from etl.fetch import ans_downloader, raw_cache
+
+
+class _Remote:
+    """
+    Estado do servidor de teste: conteudo atual, ETag e falhas a simular.
+
+    cut_then: se definido, a proxima resposta 200 e cortada no meio e o
+    conteudo passa a ser este (body, etag) antes da retomada.
+    """
+
+    def __init__(self) -> None:
+        self.body = b"v1" * 1000
+        self.etag = '"v1"'
+        self.failures = 0
+        self.cut_then = None
+        self.requests: List[Dict[str, str]] = []
+
+
+@pytest.fixture
+def remote() -> Iterator[tuple]:
+    """
+    Sobe um servidor HTTP local com If-None-Match, Range (inclusive 416) e
+    If-Range.
+    """
+    state = _Remote()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            state.requests.append(dict(self.headers))
+            if state.failures:
+                state.failures -= 1
+                self.send_response(503)
+                self.end_headers()
+                return
+            if self.headers.get("If-None-Match") == state.etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            ranged = self.headers.get("Range")
+            if ranged and self.headers.get("If-Range") in (None, state.etag):
+                start = int(ranged.split("=")[1].rstrip("-"))
+                if start >= len(state.body):
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{len(state.body)}")
+                    self.end_headers()
+                    return
+                body = state.body[start:]
+                self.send_response(206)
+                self.send_header(
+                    "Content-Range",
+                    f"bytes {start}-{len(state.body) - 1}/{len(state.body)}",
+                )
+            else:
+                start, body = 0, state.body
+                self.send_response(200)
+            self.send_header("ETag", state.etag)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if state.cut_then and start == 0:
+                self.wfile.write(body[: len(body) // 2])
+                state.body, state.etag = state.cut_then
+                state.cut_then = None
+                self.close_connection = True
+                return
+            self.wfile.write(body)
+
+        def log_message(self, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield state, f"http://127.0.0.1:{server.server_port}/f.zip"
+    server.shutdown()
+    server.server_close()
+
+
+def test_um_get_por_execucao_e_validadores_do_proprio_download(
+    remote: tuple, tmp_path: Path
+) -> None:
+    """
+    Cada execucao faz um unico GET; a versao nova e gravada com o ETag dela.
+    """
+    state, url = remote
+    cache_dir, dest = tmp_path / "cache", tmp_path / "out" / "f.zip"
+
+    _, received, _, cached = ans_downloader.download_cached(
+        url, dest, cache_dir=cache_dir
+    )
+    assert received == len(state.body) and len(state.requests) == 1 and not cached
+
+    _, received, _, cached = ans_downloader.download_cached(
+        url, dest, cache_dir=cache_dir
+    )
+    assert received == 0 and len(state.requests) == 2 and cached
+    assert state.requests[-1]["If-None-Match"] == '"v1"'
+
+    state.body, state.etag = b"v2" * 1000, '"v2"'
+    _, received, _, cached = ans_downloader.download_cached(
+        url, dest, cache_dir=cache_dir
+    )
+    assert received == len(state.body) and len(state.requests) == 3 and not cached
+    assert dest.read_bytes() == state.body
+
+    _, received, _, cached = ans_downloader.download_cached(
+        url, dest, cache_dir=cache_dir
+    )
+    assert cached and state.requests[-1]["If-None-Match"] == '"v2"'
+
+
+def test_verificacao_condicional_tem_retentativa(
+    remote: tuple, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    Uma falha transitoria no GET condicional e repetida, nao derruba a etapa.
+    """
+    monkeypatch.setattr(ans_downloader, "RETRY_BACKOFF", 0.0)
+    state, url = remote
+    cache_dir, dest = tmp_path / "cache", tmp_path / "out" / "f.zip"
+    ans_downloader.download_cached(url, dest, cache_dir=cache_dir)
+
+    state.failures = 1
+    _, received, _, cached = ans_downloader.download_cached(
+        url, dest, cache_dir=cache_dir
+    )
+    assert received == 0 and cached and len(state.requests) == 3
+
+
+@pytest.mark.parametrize("changes", [False, True], ids=["mesma_versao", "mudou"])
+def test_retomada_so_anexa_a_mesma_versao(
+    remote: tuple, tmp_path: Path, monkeypatch: pytest.MonkeyPatch, changes: bool
+) -> None:
+    """
+    Download cortado retoma com If-Range; se o remoto mudou, recomeca do zero.
+    """
+    monkeypatch.setattr(ans_downloader, "RETRY_BACKOFF", 0.0)
+    # Blocos pequenos: o trecho recebido antes do corte chega ao .part.
+    monkeypatch.setattr(ans_downloader, "CHUNK_SIZE", 100)
+    state, url = remote
+    new = (b"v2" * 1500, '"v2"') if changes else (state.body, state.etag)
+    state.cut_then = new
+    cache_dir, dest = tmp_path / "cache", tmp_path / "out" / "f.zip"
+
+    ans_downloader.download_cached(url, dest, cache_dir=cache_dir)
+    assert dest.read_bytes() == new[0]
+    assert state.requests[-1]["If-Range"] == '"v1"'
+    assert not list((cache_dir / "parts").iterdir())
+
+    _, received, _, cached = ans_downloader.download_cached(
+        url, dest, cache_dir=cache_dir
+    )
+    assert received == 0 and cached and dest.read_bytes() == new[0]
+
+
+def test_parcial_completo_nao_e_registrado_como_cache(
+    remote: tuple, tmp_path: Path, caplog: pytest.LogCaptureFixture
+) -> None:
+    """
+    Um parcial ja completo (416) entra no cache, mas o log nao o trata como
+    arquivo inalterado vindo do cache.
+    """
+    state, url = remote
+    cache_dir = tmp_path / "cache"
+    # Parcial de uma execucao anterior interrompida depois do ultimo byte.
+    part = ans_downloader._part_path(raw_cache._part_path(cache_dir, url))
+    part.parent.mkdir(parents=True)
+    part.write_bytes(state.body)
+    ans_downloader._save_part_meta(part, {"ETag": state.etag})
+    item = {"url": url, "filename": "f.zip", "ano": 2024, "trimestre": 1}
+    logger = logging.getLogger("test_raw_cache")
+
+    with caplog.at_level(logging.INFO, logger="test_raw_cache"):
+        (path,) = ans_downloader.download_items(
+            [item], tmp_path / "raw", logger=logger, cache_dir=cache_dir
+        )
+        assert state.requests[-1]["Range"] == f"bytes={len(state.body)}-"
+        assert path.read_bytes() == state.body
+        assert "Baixado f.zip: 0.0 MB" in caplog.text
+        assert "Inalterado" not in caplog.text
+
+        ans_downloader.download_items(
+            [item], tmp_path / "raw", logger=logger, cache_dir=cache_dir
+        )
+        assert "Inalterado (cache) f.zip" in caplog.text
+
+
+def test_objeto_removido_durante_verificacao_e_baixado_de_novo(tmp_path: Path) -> None:
+    """
+    Se o objeto sai do cache (LRU de outra thread) enquanto o 304 chega, o
+    arquivo e baixado de novo em vez de falhar.
+    """
+    cache_dir = tmp_path / "cache"
+    url = "http://ans.invalid/1T2024.zip"
+    requests_sent = []
+
+    def download(url: str, part: Path, headers: dict, unchanged) -> tuple:
+        requests_sent.append(headers)
+        if headers:
+            for obj in (cache_dir / raw_cache.OBJECTS_DIR).rglob("*"):
+                if obj.is_file():
+                    obj.unlink()
+            return 0, None
+        part.write_bytes(b"conteudo")
+        return part.stat().st_size, {"ETag": '"v1"'}
+
+    raw_cache.fetch(url, tmp_path / "a.zip", download, cache_dir=cache_dir)
+    path, received, cached = raw_cache.fetch(
+        url, tmp_path / "b.zip", download, cache_dir=cache_dir
+    )
+    assert path.read_bytes() == b"conteudo" and received == 8 and not cached
+    assert requests_sent == [{}, {"If-None-Match": '"v1"'}, {}]
+    digest = raw_cache.cached_digest(url, cache_dir)
+    assert raw_cache.restore(digest, tmp_path / "c.zip", cache_dir)
@@ -0,0 +1,72 @@
+import io
+import zipfile
+
+import pytest
+
+from etl.process.xlsx_reader import iter_xlsx_frames
+
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+HEADER = (
+    '<row r="1"><c r="A1" t="inlineStr"><is><t>A</t></is></c>'
+    '<c r="B1" t="inlineStr"><is><t>B</t></is></c></row>'
+)
+
+
+def _workbook(rows_xml: str) -> io.BytesIO:
+    """
+    Monta um XLSX minimo com uma planilha (cabecalho A/B + rows_xml).
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr(
+            "xl/workbook.xml",
+            f'<workbook xmlns="{MAIN_NS}" xmlns:r="{REL_NS}"><sheets>'
+            '<sheet name="S" sheetId="1" r:id="rId1"/></sheets></workbook>',
+        )
+        archive.writestr(
+            "xl/_rels/workbook.xml.rels",
+            f'<Relationships xmlns="{PKG_REL_NS}"><Relationship Id="rId1" '
+            f'Type="{REL_NS}/worksheet" Target="worksheets/sheet1.xml"/>'
+            "</Relationships>",
+        )
+        archive.writestr(
+            "xl/worksheets/sheet1.xml",
+            f'<worksheet xmlns="{MAIN_NS}"><sheetData>{HEADER}{rows_xml}'
+            "</sheetData></worksheet>",
+        )
+    buffer.seek(0)
+    return buffer
+
+
+@pytest.mark.parametrize(
+    "rows_xml",
+    [
+        '<row r="2"><c r="A2"><v>1</v></c><c r="B2"><v>2</v></c></row>',
+        '<row r="2"><c s="1" r="A2"><v>1</v></c><c s="1" r="B2"><v>2</v></c></row>',
+        '<row r="2"><c><v>1</v></c><c><v>2</v></c></row>',
+    ],
+    ids=["ref_primeiro", "ref_depois_de_s", "sem_ref"],
+)
+def test_linhas_de_dados_em_qualquer_formato(rows_xml: str) -> None:
+    """
+    Celulas de dados sem r ou com r fora da primeira posicao nao somem.
+    """
+    frames = list(iter_xlsx_frames(_workbook(rows_xml), lambda header: [0, 1]))
+    assert [frame.values.tolist() for frame in frames] == [[["1", "2"]]]
+
+
+def test_bloco_com_formatos_misturados() -> None:
+    """
+    Uma linha sem referencia no meio de linhas com referencia e mantida.
+    """
+    rows_xml = (
+        '<row r="2"><c r="A2"><v>1</v></c><c r="B2"><v>2</v></c></row>'
+        '<row r="3"><c><v>3</v></c><c><v>4</v></c></row>'
+    )
+    frames = list(iter_xlsx_frames(_workbook(rows_xml), lambda header: [0, 1]))
+    assert [row for frame in frames for row in frame.values.tolist()] == [
+        ["1", "2"],
+        ["3", "4"],
+    ]